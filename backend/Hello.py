@@ -1,38 +1,58 @@
 # Streamlit app
 
 import streamlit as st
-import pandas as pd
 from pymongo import MongoClient
 import altair as alt
-from dateutil import parser
+from qc_data import ensure_indexes, metadata_page, summary_kpis, wear_nonwear_by_participant
 
 # Connect to MongoDB
 client = MongoClient('mongodb://localhost:27017/')
 db = client['accelerometer_data']
 collection = db['ukb_summary']
 
-# Load data
-@st.cache_data
-def load_data():
-    data = list(collection.find({}, {'_id': 0}))  # Excluding the MongoDB ID from the data
-    df = pd.json_normalize(data, sep='_')  # Flatten the 'data' node
-    df['data_file-size'] = df['data_file-size'].apply(lambda x: x / (1024 ** 2))  # Convert file size to MB
+PAGE_SIZE = 100
 
-    # Extract timezone and clean datetime fields
-    def extract_timezone(dt):
-        return dt.split('[')[-1].strip(']')
 
-    def clean_datetime(dt):
-        clean_dt = dt.split('+')[0].strip()  # Remove the timezone offset
-        return parser.parse(clean_dt)
+@st.cache_resource
+def prepare_collection():
+    ensure_indexes(collection)
+    return True
 
-    df['timezone'] = df['data_file-startTime'].apply(extract_timezone)
-    df['data_file-startTime'] = df['data_file-startTime'].apply(clean_datetime).dt.strftime('%Y-%m-%d %H:%M:%S')
-    df['data_file-endTime'] = df['data_file-endTime'].apply(clean_datetime).dt.strftime('%Y-%m-%d %H:%M:%S')
 
+prepare_collection()
+
+
+# Load data: KPIs and chart series are aggregated by MongoDB, only the displayed table page is fetched
+@st.cache_data(ttl=300)
+def load_kpis():
+    return summary_kpis(collection)
+
+
+@st.cache_data(ttl=300)
+def load_wear_nonwear():
+    return wear_nonwear_by_participant(collection)
+
+
+@st.cache_data(ttl=300)
+def load_metadata_page(after, page_size):
+    return metadata_page(collection, after, page_size)
+
+
+# Range paging: the key each visited page starts after, so Previous/Next never skip() through the collection
+def metadata_table_page(page_count):
+    if 'page_starts' not in st.session_state:
+        st.session_state.page_starts = [None]
+    starts = st.session_state.page_starts
+    df, next_key = load_metadata_page(starts[-1], PAGE_SIZE)
+    previous_col, label_col, next_col = st.columns([1, 4, 1])
+    previous_col.button('Previous', on_click=starts.pop, disabled=len(starts) == 1)
+    label_col.markdown(f"Page {len(starts)} of {page_count}")
+    next_col.button('Next', on_click=starts.append, args=(next_key,), disabled=next_key is None)
     return df
 
-df = load_data()
+
+kpis = load_kpis()
+wear_df = load_wear_nonwear()
 
 # Function to convert column names for table display
 def format_column_name(name):
@@ -44,7 +64,6 @@ def format_column_name(name):
 columns_for_display = ['participant_id', 'date', 'data_totalReads', 'data_file-size', 'data_file-deviceID',
                        'timezone', 'data_file-startTime', 'data_file-endTime', 'data_quality-daylightSavingsCrossover']
 formatted_columns = {col: format_column_name(col) for col in columns_for_display}
-df_display = df[columns_for_display].rename(columns=formatted_columns)
 
 
 # Custom CSS for styling
@@ -104,23 +123,23 @@ st.markdown('##')
 # Displaying metrics in cards using columns
 col1, col2, col3, col4 = st.columns(4)
 with col1:
-    st.markdown(f'<div class="card"><h1 class="big-font">{df.shape[0]}</h1><p>Total Files Processed</p></div>', unsafe_allow_html=True)
+    st.markdown(f'<div class="card"><h1 class="big-font">{kpis["total_files"]}</h1><p>Total Files Processed</p></div>', unsafe_allow_html=True)
 with col2:
-    average_wear_time = df['data_wearTime-overall(days)'].mean()
+    average_wear_time = kpis['average_wear_time'] or 0
     st.markdown(f'<div class="card"><h1 class="big-font">{average_wear_time:.2f} days</h1><p>Average Wear Time</p></div>', unsafe_allow_html=True)
 with col3:
-    good_calibration_count = df[df['data_quality-goodCalibration'] == 1].shape[0]
+    good_calibration_count = kpis['good_calibration_count']
     st.markdown(f'<div class="card"><h1 class="big-font">{good_calibration_count}</h1><p>Participants with Good Calibration</p></div>', unsafe_allow_html=True)
 with col4:
-    average_nonwear_time = df['data_nonWearTime-overall(days)'].mean()
+    average_nonwear_time = kpis['average_non_wear_time'] or 0
     st.markdown(f'<div class="card"><h1 class="big-font">{average_nonwear_time:.2f} days</h1><p>Average Non-Wear Time</p></div>', unsafe_allow_html=True)
 
 st.markdown('##')
 st.subheader('overall Weartime Vs Non-Wear Time')
 st.markdown('##')
 # Altair chart for visualizing wear and non-wear times
-if 'participant_id' in df.columns and 'data_wearTime-overall(days)' in df.columns and 'data_nonWearTime-overall(days)' in df.columns:
-    melted_df = df.melt(id_vars=['participant_id'],
+if not wear_df.empty:
+    melted_df = wear_df.melt(id_vars=['participant_id'],
                         value_vars=['data_wearTime-overall(days)', 'data_nonWearTime-overall(days)'],
                         var_name='Type', value_name='Days')
     chart = alt.Chart(melted_df).mark_bar().encode(
@@ -143,4 +162,6 @@ else:
 # Display the file metadata table at the end
 st.subheader(' File Metadata')
 st.markdown("##")
+page_count = max(1, -(-kpis['total_files'] // PAGE_SIZE))
+df_display = metadata_table_page(page_count)[columns_for_display].rename(columns=formatted_columns)
 st.markdown('<div class="dataframe-container">' + df_display.to_html(index=False, escape=False) + '</div>', unsafe_allow_html=True)
@@ -0,0 +1,111 @@
+import numpy as np
+
+MINUTES_PER_DAY = 24 * 60
+
+AGP_PERCENTILES = (5, 25, 50, 75, 95)
+
+# International consensus CGM ranges (mg/dL), lower bound inclusive, upper bound exclusive
+TIR_BANDS = (
+    ("very_low", None, 54),
+    ("low", 54, 70),
+    ("target", 70, 181),
+    ("high", 181, 251),
+    ("very_high", 251, None),
+)
+
+
+def day_matrix(days):
+    """Build a (days x 1440) float32 matrix of glucose by minute of day, NaN where no reading."""
+    matrix = np.full((len(days), MINUTES_PER_DAY), np.nan, dtype=np.float32)
+    for row, day in enumerate(days):
+        matrix[row, day.readings['minute']] = day.readings['glucose']
+    return matrix
+
+
+def slot_percentiles(by_slot, percentiles=AGP_PERCENTILES):
+    """
+    Percentiles of every row of a (slots x samples) matrix, ignoring NaN.
+
+    Equivalent to np.nanpercentile(..., axis=1) with linear interpolation, but fully
+    vectorized: NaNs sort to the end of each row, so each row's valid prefix is indexed
+    directly instead of being reduced slot by slot. Rows without samples (no days in the
+    range) are all NaN.
+    """
+    if by_slot.shape[1] == 0:
+        return np.full((len(by_slot), len(percentiles)), np.nan)
+    ordered = np.sort(by_slot, axis=1)
+    counts = np.count_nonzero(~np.isnan(by_slot), axis=1)
+    positions = np.maximum(counts[:, None] - 1, 0) * (np.asarray(percentiles, dtype=np.float64) / 100.0)
+    lower = np.floor(positions).astype(np.intp)
+    upper = np.ceil(positions).astype(np.intp)
+    rows = np.arange(len(ordered))[:, None]
+    low_values = ordered[rows, lower]
+    high_values = ordered[rows, upper]
+    result = low_values + (high_values - low_values) * (positions - lower)
+    result[counts == 0] = np.nan
+    return result
+
+
+def time_in_ranges(matrix):
+    values = matrix[~np.isnan(matrix)]
+    total = len(values)
+    ranges = {}
+    for name, low, high in TIR_BANDS:
+        mask = np.ones(total, dtype=bool)
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values < high
+        ranges[name] = float(np.count_nonzero(mask) / total * 100) if total else None
+    return ranges
+
+
+def _to_json(value):
+    return None if value is None or np.isnan(value) else round(float(value), 2)
+
+
+def agp_profile(matrix, slot_minutes=15):
+    """
+    Ambulatory Glucose Profile of a (days x 1440) glucose matrix.
+
+    The matrix is reshaped to (slots x days*slot_minutes) so that every time-of-day slot
+    holds all readings of that slot across the range, and the percentile bands are taken
+    in one pass over all slots.
+    """
+    if slot_minutes <= 0 or MINUTES_PER_DAY % slot_minutes:
+        raise ValueError("slot_minutes must be a positive divisor of 1440 (a day in minutes)")
+    slots = MINUTES_PER_DAY // slot_minutes
+
+    by_slot = (
+        matrix.reshape(len(matrix), slots, slot_minutes)
+        .transpose(1, 0, 2)
+        .reshape(slots, -1)
+    )
+    bands = slot_percentiles(by_slot)
+
+    values = matrix[~np.isnan(matrix)]
+    mean_glucose = float(values.mean()) if len(values) else None
+    summary = {
+        "n_days": int(np.count_nonzero((~np.isnan(matrix)).any(axis=1))),
+        "n_readings": int(len(values)),
+        "mean_glucose": _to_json(mean_glucose),
+        "cv": _to_json(values.std() / mean_glucose * 100) if mean_glucose else None,
+        # Glucose management indicator (Bergenstal et al. 2018)
+        "gmi": _to_json(3.31 + 0.02392 * mean_glucose) if mean_glucose else None,
+    }
+
+    profile = [
+        {
+            "minute": slot * slot_minutes,
+            "time": f"{slot * slot_minutes // 60:02d}:{slot * slot_minutes % 60:02d}",
+            **{f"p{p}": _to_json(bands[slot, i]) for i, p in enumerate(AGP_PERCENTILES)}
+        }
+        for slot in range(slots)
+    ]
+
+    return {
+        "slot_minutes": slot_minutes,
+        "profile": profile,
+        "time_in_ranges": time_in_ranges(matrix),
+        "summary": summary,
+    }
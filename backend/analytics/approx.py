@@ -0,0 +1,124 @@
+import math
+
+# Normal quantile of the two-sided 95% intervals reported by approximate views
+CONFIDENCE = 0.95
+Z = 1.959964
+
+TIME_IN_RANGE_BANDS = ("very_high", "high", "target", "low", "very_low")
+
+
+def _fpc(population, n):
+    """Finite population correction for a sample of n drawn without replacement."""
+    if population <= 1 or n >= population:
+        return 0.0
+    return math.sqrt((population - n) / (population - 1))
+
+
+def _interval(estimate, se):
+    if estimate is None or se is None:
+        return None
+    return [estimate - Z * se, estimate + Z * se]
+
+
+def participant_estimates(row):
+    """
+    Estimates with standard errors for one participant's sample aggregates (see GlucoseSampleStore.stats).
+
+    The reservoir is a uniform sample of all `seen` readings, so the `n` sample readings that
+    pass a filter are a uniform sample of the roughly seen * n / sample_size readings that do.
+    Percentages are of the filtered readings, event counts of the whole filtered population.
+    """
+    n, sample_size, seen = int(row["n"]), int(row["sample_size"]), int(row["seen"])
+    population = seen * n / sample_size
+    fpc_filtered = _fpc(population, n)
+    fpc_sample = _fpc(seen, sample_size)
+    sd = float(row["sd"]) if row["sd"] is not None else 0.0
+
+    estimates = {
+        "n": n,
+        "readings": population,
+        "mean": (float(row["mean"]), sd / math.sqrt(n) * fpc_filtered),
+        # Normal approximation of the standard deviation's sampling error
+        "sd": (sd, sd / math.sqrt(2 * (n - 1)) * fpc_filtered if n > 1 else None),
+    }
+    for band in ("very_low", "low", "hypo", "target", "hyper", "high", "very_high"):
+        count = int(row[band])
+        p = count / n
+        estimates[band] = (100 * p, 100 * math.sqrt(p * (1 - p) / n) * fpc_filtered)
+        q = count / sample_size
+        estimates[band + "_events"] = (seen * q, seen * math.sqrt(q * (1 - q) / sample_size) * fpc_sample)
+    return estimates
+
+
+def _average(pairs):
+    # Mean over participants of independent estimates
+    if not pairs:
+        return None, None
+    ses = [se for _, se in pairs]
+    se = math.sqrt(sum(s * s for s in ses)) / len(pairs) if all(s is not None for s in ses) else None
+    return sum(value for value, _ in pairs) / len(pairs), se
+
+
+def _total(pairs):
+    return sum(value for value, _ in pairs), math.sqrt(sum(se * se for _, se in pairs))
+
+
+def approx_cgm_metrics(rows):
+    """The /cgm-metrics payload estimated from the sample, with 95% intervals under "ci"."""
+    per_pid = [(row["pid"], participant_estimates(row)) for row in rows]
+    estimates = [e for _, e in per_pid]
+
+    average_glucose = _average([e["mean"] for e in estimates])
+    time_in_range = _average([e["target"] for e in estimates])
+    variability = _average([e["sd"] for e in estimates])
+    hypo = _total([e["hypo_events"] for e in estimates])
+    hyper = _total([e["hyper_events"] for e in estimates])
+
+    def events(key):
+        return [
+            {"pid": pid, "events": round(e[key][0]), "ci": _interval(*e[key])}
+            for pid, e in per_pid if e[key][0] > 0
+        ]
+
+    metrics = {
+        "average_glucose": average_glucose[0],
+        "time_in_range": time_in_range[0],
+        "total_hypo_events": round(hypo[0]),
+        "total_hyper_events": round(hyper[0]),
+        "total_participants": len(per_pid),
+        "avg_tir_per_participant": time_in_range[0],
+        "glucose_variability": variability[0],
+        "hypoglycemia_events": events("hypo_events"),
+        "hyperglycemia_events": events("hyper_events"),
+        "ci": {
+            "average_glucose": _interval(*average_glucose),
+            "time_in_range": _interval(*time_in_range),
+            "total_hypo_events": _interval(*hypo) if per_pid else None,
+            "total_hyper_events": _interval(*hyper) if per_pid else None,
+            "glucose_variability": _interval(*variability),
+        },
+    }
+    return {
+        "data": metrics,
+        "approximate": True,
+        "confidence": CONFIDENCE,
+        "sample_readings": sum(e["n"] for e in estimates),
+    }
+
+
+def approx_time_in_ranges(rows):
+    """The /participant-time-in-ranges payload estimated from the sample, with 95% intervals per band."""
+    data = []
+    for row in rows:
+        e = participant_estimates(row)
+        item = {"pid": row["pid"]}
+        item.update({band: e[band][0] for band in TIME_IN_RANGE_BANDS})
+        item["ci"] = {band: _interval(*e[band]) for band in TIME_IN_RANGE_BANDS}
+        item["sample_readings"] = e["n"]
+        data.append(item)
+    return {
+        "data": data,
+        "approximate": True,
+        "confidence": CONFIDENCE,
+        "sample_readings": sum(item["sample_readings"] for item in data),
+    }
@@ -0,0 +1,113 @@
+import math
+from collections import deque
+
+# Thresholds shared with the cohort endpoints (mg/dL)
+HYPO_THRESHOLD = 70
+HYPER_THRESHOLD = 180
+
+# Minimum duration before an excursion counts as an episode (consensus definition)
+EPISODE_MINUTES = 15
+
+
+class RollingWindow:
+    """
+    Time-based sliding window over a glucose stream with O(1) amortized updates.
+
+    Running sum, sum of squares and in-range count are adjusted as readings enter and
+    expire, so mean, CV and TIR never rescan the window.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.readings = deque()
+        self.total = 0.0
+        self.total_squares = 0.0
+        self.in_range = 0
+
+    def push(self, timestamp, glucose):
+        self.readings.append((timestamp, glucose))
+        self.total += glucose
+        self.total_squares += glucose * glucose
+        self.in_range += HYPO_THRESHOLD <= glucose <= HYPER_THRESHOLD
+        self.expire(timestamp)
+
+    def expire(self, now):
+        while self.readings and self.readings[0][0] <= now - self.seconds:
+            _, glucose = self.readings.popleft()
+            self.total -= glucose
+            self.total_squares -= glucose * glucose
+            self.in_range -= HYPO_THRESHOLD <= glucose <= HYPER_THRESHOLD
+
+    def metrics(self):
+        count = len(self.readings)
+        if not count:
+            return {"count": 0, "mean": None, "cv": None, "tir": None}
+        mean = self.total / count
+        variance = max(self.total_squares / count - mean * mean, 0.0)
+        return {
+            "count": count,
+            "mean": round(mean, 2),
+            "cv": round(math.sqrt(variance) / mean * 100, 2) if mean else None,
+            "tir": round(self.in_range / count * 100, 2),
+        }
+
+
+class EpisodeTracker:
+    """Current hypo/hyper excursion, confirmed as an episode after EPISODE_MINUTES."""
+
+    def __init__(self):
+        self.state = "normal"
+        self.started_at = None
+        self.last_seen = None
+        self.extreme = None
+
+    def push(self, timestamp, glucose):
+        state = "hypo" if glucose < HYPO_THRESHOLD else "hyper" if glucose > HYPER_THRESHOLD else "normal"
+        if state != self.state:
+            self.state = state
+            self.started_at = timestamp if state != "normal" else None
+            self.extreme = glucose if state != "normal" else None
+        elif state == "hypo":
+            self.extreme = min(self.extreme, glucose)
+        elif state == "hyper":
+            self.extreme = max(self.extreme, glucose)
+        self.last_seen = timestamp
+
+    def snapshot(self):
+        if self.state == "normal":
+            return {"state": "normal"}
+        minutes = (self.last_seen - self.started_at) / 60
+        return {
+            "state": self.state,
+            "started_at": self.started_at,
+            "minutes": round(minutes, 1),
+            "confirmed": minutes >= EPISODE_MINUTES,
+            "extreme": self.extreme,
+        }
+
+
+class LiveGlucoseState:
+    """Rolling 24h/14d metrics and episode state of one participant, fed in timestamp order."""
+
+    def __init__(self):
+        self.day = RollingWindow(24 * 3600)
+        self.fortnight = RollingWindow(14 * 24 * 3600)
+        self.episode = EpisodeTracker()
+        self.last_timestamp = None
+
+    def push(self, timestamp, glucose):
+        """Add a reading (timestamp in epoch seconds); late or duplicate readings are ignored."""
+        if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+            return False
+        self.last_timestamp = timestamp
+        self.day.push(timestamp, glucose)
+        self.fortnight.push(timestamp, glucose)
+        self.episode.push(timestamp, glucose)
+        return True
+
+    def snapshot(self):
+        return {
+            "rolling_24h": self.day.metrics(),
+            "rolling_14d": self.fortnight.metrics(),
+            "episode": self.episode.snapshot(),
+        }
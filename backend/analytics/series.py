@@ -0,0 +1,90 @@
+import numpy as np
+
+# Supported bucket sizes, all of which divide a day evenly
+BUCKETS = {"5m": 5 * 60, "15m": 15 * 60, "1h": 60 * 60, "1d": 24 * 60 * 60}
+
+AGGREGATES = ("mean", "min", "max", "count")
+
+# SQL aggregate for each supported aggregate name
+SQL_AGGREGATES = {"mean": "AVG", "min": "MIN", "max": "MAX", "count": "COUNT"}
+
+# Value columns of the minute-level table that can be aggregated
+MINUTE_LEVEL_COLUMNS = ("sedentary", "light", "moderate_vigorous", "sleep")
+
+
+def parse_bucket(bucket):
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unsupported bucket '{bucket}', expected one of {', '.join(BUCKETS)}")
+    return BUCKETS[bucket]
+
+
+def parse_aggregates(agg):
+    aggregates = [name.strip() for name in agg.split(",") if name.strip()]
+    unknown = [name for name in aggregates if name not in AGGREGATES]
+    if unknown or not aggregates:
+        raise ValueError(f"Unsupported aggregate(s) {', '.join(unknown) or agg!r}, expected any of {', '.join(AGGREGATES)}")
+    return aggregates
+
+
+def bucket_values(timestamps, values, bucket_seconds, aggregates, field="glucose"):
+    """
+    Aggregate a time-sorted series into fixed buckets with NumPy.
+
+    Bucket boundaries are aligned to midnight. Since the input is sorted, every bucket is a
+    contiguous run, so min/max reduce with ufunc.reduceat and sum/count with the run lengths.
+    """
+    if len(timestamps) == 0:
+        return []
+
+    seconds = timestamps.astype('datetime64[s]').astype(np.int64)
+    bucket_ids = seconds // bucket_seconds
+    starts = np.flatnonzero(np.append(True, bucket_ids[1:] != bucket_ids[:-1]))
+    counts = np.diff(np.append(starts, len(bucket_ids)))
+    values = values.astype(np.float64)
+
+    columns = {}
+    for name in aggregates:
+        if name == "mean":
+            columns[f"{field}_mean"] = np.add.reduceat(values, starts) / counts
+        elif name == "min":
+            columns[f"{field}_min"] = np.minimum.reduceat(values, starts)
+        elif name == "max":
+            columns[f"{field}_max"] = np.maximum.reduceat(values, starts)
+        elif name == "count":
+            columns[f"{field}_count"] = counts
+
+    buckets = (bucket_ids[starts] * bucket_seconds).astype('datetime64[s]').tolist()
+    columns = {key: column.tolist() for key, column in columns.items()}
+    return [
+        {"bucket": bucket, **{key: column[i] for key, column in columns.items()}}
+        for i, bucket in enumerate(buckets)
+    ]
+
+
+def minute_level_bucket_query(aggregates, has_start=True, has_end=True, columns=MINUTE_LEVEL_COLUMNS):
+    """
+    Build the bucketed query for minute_level_data.
+
+    Bucketing is done in MySQL from the time of day, so it does not depend on the session
+    time zone, and the range predicate stays on the raw (pid, timestamp) columns so the
+    index can be used.
+    """
+    conditions = ["pid = :pid"]
+    if has_start:
+        conditions.append("timestamp >= :start")
+    if has_end:
+        conditions.append("timestamp < :end")
+    selects = [
+        f"{SQL_AGGREGATES[name]}({column}) AS {column}_{name}"
+        for column in columns
+        for name in aggregates
+    ]
+    return f"""
+        SELECT
+            TIMESTAMPADD(SECOND, FLOOR(TIME_TO_SEC(timestamp) / :bucket_seconds) * :bucket_seconds, DATE(timestamp)) AS bucket,
+            {', '.join(selects)}
+        FROM minute_level_data
+        WHERE {' AND '.join(conditions)}
+        GROUP BY bucket
+        ORDER BY bucket;
+    """
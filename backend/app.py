@@ -1,12 +1,176 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sql.mysql_database import MySQLDatabase  # Import the MySQLDatabase class
+from sql.glucose_series import GlucoseSeriesStore, series_timestamps
+from sql.glucose_histograms import fraction_between, merge, percentiles, rebin
+from analytics.agp import agp_profile, day_matrix
+from analytics.approx import approx_cgm_metrics, approx_time_in_ranges
+from analytics.series import bucket_values, minute_level_bucket_query, parse_aggregates, parse_bucket
+from core.admission import AdmissionController, CostClass
+from core.cache import RecentKeys, ResultCache
+from core.cgm_ingest import CGMIngestQueue, QueueFull
+from core.compression import CompressionMiddleware, EncodedBody, ResponseCompression, parse_levels
+from core.profiling import ProfilingMiddleware, RouteMetrics, TimedRoute, instrument_engine
+from core.glucose_stream import GlucoseStreamHub
+from core.scheduler import JobScheduler
+from core.studies import Study, StudyMiddleware, StudyRegistry, parse_studies
+from sql.cohort_filter import CohortFilter, UnsupportedFilter, group_pids, list_groups, set_group
+from sql.cohort_filter import create_table as create_group_table
+from sql.migrations import check_query_plans, migrate
+from sql.nutrition import NutritionRollupStore, participant_range
+from sql.partitions import PARTITIONED_TABLES, PartitionManager, chain_batches
+from sql.queries import (
+    ACTIVITY_SLEEP_TRACE, CALIBRATION_CHECK, DAILY_AVG_GLUCOSE, FILE_METADATA, FOOD_LOG, PARTICIPANT_DATES,
+    PARTICIPANT_DAY_SUMMARY, PARTICIPANT_NUTRITION, PARTICIPANT_TRENDS, PIDS, QC_DASHBOARD, QC_METRICS, QUERIES, SLEEP_DATA,
+    SLEEP_HOURS_EFFICIENCY, WEAR_TIME, WEAR_VS_NONWEAR
+)
+from sql.query_control import QueryInterrupted, statement_deadline
+from sql.export import (
+    CSV_COMPRESSION, EXPORT_FORMATS, EXPORT_TABLES, PARQUET_COMPRESSION, csv_chunks, export_query, parquet_chunks, stream_rows
+)
+from sqlalchemy import text
+from starlette.background import BackgroundTask
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+import numpy as np
 import os
-from pydantic import BaseModel
-from typing import List
-from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The default study is set up at startup, the others on their first request
+    with studies.use(studies.default) as study:
+        try:
+            studies.prepare(study)
+        except Exception as e:
+            # Serve anyway; StudyMiddleware sets the study up again on its first request
+            print(f"Setting up study {study.key} failed: {e}")
+        await study.cgm_ingest.start()
+    await studies.start()
+    await scheduler.start()
+    yield
+    await scheduler.stop()
+    await studies.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+# Routes record when their endpoint starts and finishes (must be set before routes are declared)
+app.router.route_class = TimedRoute
+
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "archive")
+ARCHIVE_AFTER_MONTHS = int(os.environ["ARCHIVE_AFTER_MONTHS"]) if os.environ.get("ARCHIVE_AFTER_MONTHS") else None
+
+# Precompute and cache-warming jobs, run for every open study (registered at the end of this module)
+scheduler = JobScheduler(max_concurrency=2, ingest_debounce_seconds=30)
+
+
+def open_study(key, db_url):
+    """Database, stores and caches of one study; nothing here connects until first used."""
+    study_database = MySQLDatabase(db_url)
+    instrument_engine(study_database.engine)
+    # Registered statements are compiled once for the server's dialect instead of on every request
+    QUERIES.compile(study_database.engine.dialect)
+    # Packed per-day CGM series, written at ingest (see extract/cgm.py)
+    store = GlucoseSeriesStore(study_database.engine)
+    # Live CGM readings, written to cgm_data and the packed series with group commit; started with
+    # the app for the default study and on their first batch for the others
+    ingest = CGMIngestQueue(study_database.engine, store)
+    # Server-Sent Events of committed readings with incrementally maintained rolling metrics
+    hub = GlucoseStreamHub(store)
+    recent = RecentKeys(max_keys=200, window_seconds=3600)
+
+    def track_ingested_pids(batches):
+        for batch in batches:
+            recent.touch(batch.pid)
+
+    ingest.listeners.extend([hub.on_commit, track_ingested_pids, scheduler.notify_ingest])
+    return Study(
+        key,
+        database=study_database,
+        series_store=store,
+        # Per-(pid, day) nutrition totals, refreshed by the food-log load (see extract/foodLog.py)
+        nutrition=NutritionRollupStore(study_database.engine),
+        # Monthly partitions of cgm_data/minute_level_data (set up with `python -m sql.partitions setup`);
+        # with ARCHIVE_AFTER_MONTHS set, older months are moved to Parquet under ARCHIVE_DIR
+        partitions=PartitionManager(
+            study_database.engine,
+            archive_dir=ARCHIVE_DIR if key == studies.default else os.path.join(ARCHIVE_DIR, "studies", key),
+            archive_after_months=ARCHIVE_AFTER_MONTHS,
+        ),
+        cgm_ingest=ingest,
+        glucose_hub=hub,
+        # Computed AGP results keyed by (pid, range, slot size, data version)
+        agp_cache=ResultCache(max_entries=512),
+        # Unfiltered cohort views recomputed in the background
+        precomputed=ResultCache(max_entries=64),
+        # Filtered cohort views, computed for the selection only and kept briefly
+        filtered_views=ResultCache(max_entries=256, ttl_seconds=60),
+        recent_pids=recent,
+        route_metrics=RouteMetrics(),
+    )
+
+
+def prepare_study(study):
+    engine = study.database.engine
+    # An unreachable database fails the setup as a whole (and it is retried), rather than
+    # every step below failing on its own and the study counting as set up
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    # Create the tables owned by the API if they do not exist yet, apply pending migrations (indexes,
+    # packing readings loaded before the packed series existed), then warn about registered queries
+    # that still scan whole tables. Each step is tried on its own, so a failing migration does not
+    # keep the API's tables from being created.
+    steps = [
+        ("packed series tables", study.series_store.create_table),
+        ("participant groups table", lambda: create_group_table(engine)),
+        ("nutrition rollups table", study.nutrition.create_table),
+        ("partition state table", study.partitions.create_table),
+        ("migrations", lambda: migrate(engine, {"packed_series": study.series_store.backfill_missing})),
+        ("query plan check", lambda: check_query_plans(engine, QUERIES.plan_checks())),
+        ("partition refresh", study.partitions.refresh),
+    ]
+    for name, step in steps:
+        try:
+            step()
+        except Exception as e:
+            print(f"Setup step '{name}' failed for study {study.key}: {e}")
+
+
+async def close_study(study):
+    # Flush queued readings, then close the study's pooled connections
+    await study.cgm_ingest.stop()
+    study.database.dispose()
+
+
+# Studies served by this deployment, each with its own database, pool, caches and metrics.
+# STUDY_DATABASES is e.g. "workwell=mysql+mysqlconnector://...@db1:3306/workwell,glyco=...@db2:3306/glyco";
+# a request picks one with a `/studies/{key}` path prefix or an `X-Study` header, otherwise it goes
+# to DEFAULT_STUDY (whose URL defaults to DATABASE_URL). Pools idle for STUDY_IDLE_SECONDS are closed.
+studies = StudyRegistry(
+    parse_studies(os.environ.get("STUDY_DATABASES")),
+    open_study,
+    prepare_study=prepare_study,
+    close_study=close_study,
+    default=os.environ.get("DEFAULT_STUDY", "default"),
+    idle_seconds=int(os.environ.get("STUDY_IDLE_SECONDS", 15 * 60)),
+)
 
-app = FastAPI()
+# The current request's study (the default one at startup and outside requests)
+database = studies.local("database")
+series_store = studies.local("series_store")
+nutrition = studies.local("nutrition")
+partitions = studies.local("partitions")
+cgm_ingest = studies.local("cgm_ingest")
+glucose_hub = studies.local("glucose_hub")
+agp_cache = studies.local("agp_cache")
+precomputed = studies.local("precomputed")
+filtered_views = studies.local("filtered_views")
+recent_pids = studies.local("recent_pids")
+route_metrics = studies.local("route_metrics")
 
 # Enable CORS
 app.add_middleware(
@@ -17,204 +181,441 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize the database
-database = MySQLDatabase()
+# gzip/br/zstd responses negotiated from Accept-Encoding; COMPRESSION_LEVELS is e.g. "gzip=6,br=5,zstd=3"
+compression = ResponseCompression(
+    minimum_size=int(os.environ.get("COMPRESSION_MIN_BYTES", 1024)),
+    levels=parse_levels(os.environ.get("COMPRESSION_LEVELS")),
+)
+app.add_middleware(CompressionMiddleware, compression=compression)
+
+# Per-route latency split into queue/db/compute/serialize, and `?profile=1` sampling profiles
+# for requests carrying the PROFILE_TOKEN in `X-Profile-Token`
+app.add_middleware(
+    ProfilingMiddleware,
+    metrics=route_metrics,
+    token=os.environ.get("PROFILE_TOKEN"),
+    output_dir=os.environ.get("PROFILE_DIR"),
+)
+
+# Outermost, so the study is current while the middlewares above record metrics for it
+app.add_middleware(StudyMiddleware, registry=studies)
+
+# Admission control: each route holds `weight` units of its cost class while it runs, so a
+# burst of cohort scans queues (and is shed past the queue limits) instead of starving the
+# per-participant lookups; the capacities add up to the connection pool size (5 + 10 overflow).
+# The limits are shared by all studies, so a process never holds more than one pool's worth of
+# connections in total
+admission = AdmissionController([
+    CostClass("dashboard", capacity=4, max_queue=32, queue_timeout_seconds=15),
+    CostClass("cohort", capacity=2, max_queue=64, queue_timeout_seconds=10),
+    CostClass("participant", capacity=7, max_queue=256, queue_timeout_seconds=5),
+    CostClass("export", capacity=2, max_queue=8, queue_timeout_seconds=30),
+])
+
+# Statement deadlines per endpoint tier; in-flight queries are killed when the deadline passes
+# or the client disconnects (handlers using them are plain `def` so they run in the threadpool)
+DASHBOARD_QUERY_DEADLINE = statement_deadline(database, deadline_ms=60_000)
+COHORT_QUERY_DEADLINE = statement_deadline(database, deadline_ms=20_000)
+PARTICIPANT_QUERY_DEADLINE = statement_deadline(database, deadline_ms=10_000)
+
+AGP_DAYS = 14
+MAX_COHORT_AGP_PIDS = 500
+MAX_READINGS_PER_BATCH = 10000
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# Filter accepted by every cohort aggregate (see cohort_filter); filtered results are computed
+# for the selection only and kept briefly, unfiltered ones come from the precompute jobs
+COHORT_FILTER_PARAMS = ("pids", "group", "timepoint", "from", "to")
+
+# Time of a CGM reading; once cgm_data is partitioned its stored copy is used, so date filters prune
+CGM_READING_TIME = "STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i')"
+
+
+def cgm_reading_time():
+    return partitions.time_column("cgm_data") or CGM_READING_TIME
+
+
+def with_archived(response, table, start=None, end=None):
+    # Months moved to Parquet are not read by the dashboards; name the ones [start, end] reaches
+    months = partitions.archived_months(table, start, end)
+    if months:
+        response["archived"] = {"table": table, "months": months}
+    return response
+
+
+def precomputed_ready(key):
+    # Admission bypass for unfiltered views served straight from the precomputed cache
+    return lambda request: key in precomputed and not any(name in request.query_params for name in COHORT_FILTER_PARAMS)
+
+
+def approx_requested(request):
+    return request.query_params.get("approx", "").lower() in ("1", "true", "yes", "on")
+
+
+def sampled_or_precomputed(key):
+    # Approximate views read at most SAMPLE_SIZE sample rows per participant, so they skip the queue too
+    ready = precomputed_ready(key)
+    return lambda request: approx_requested(request) or ready(request)
+
+
+def cohort_filter(
+    pids: Optional[List[str]] = Query(None),
+    group: Optional[str] = None,
+    timepoint: Optional[str] = None,
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None
+):
+    # Shared query parameters of the cohort endpoints; `group` is a named participant list
+    # (PUT /groups/{name}) and is intersected with `pids` when both are given
+    if group is not None:
+        members = group_pids(database.engine, group)
+        if members is None:
+            raise HTTPException(status_code=404, detail=f"Unknown participant group '{group}'")
+        pids = [pid for pid in members if pid in set(pids)] if pids else members
+    return CohortFilter(
+        pids=pids,
+        timepoint=timepoint,
+        start=parse_date(from_) if from_ else None,
+        end=parse_date(to) if to else None,
+    )
+
+
+def cohort_view(key, compute, filters, request):
+    # Cached as serialized JSON plus its compressed variants, so a hit skips both steps
+    if not filters:
+        body = precomputed.get_or_compute(key, lambda: EncodedBody(compute()))
+    else:
+        body = filtered_views.get_or_compute((key, filters.key()), lambda: EncodedBody(compute(filters)))
+    return compression.response(request, body)
+
+
+def approx_view(key, compute, filters, request):
+    # Estimates from the reservoir sample (sql/glucose_sample.py), kept as briefly as filtered views
+    body = filtered_views.get_or_compute(("approx", key, filters.key()), lambda: EncodedBody(compute(filters)))
+    return compression.response(request, body)
 
 
-@app.get("/days-worn")
-async def get_days_worn():
+def sample_stats(filters):
+    where, params = filters.where(pid="s.pid", timepoint="s.timepoint", date="s.reading_time")
+    return series_store.sample.stats(where, params)
+
+
+def compute_approx_cgm_metrics(filters):
+    return approx_cgm_metrics(sample_stats(filters))
+
+
+def compute_approx_time_in_ranges(filters):
+    return approx_time_in_ranges(sample_stats(filters))
+
+
+@app.get("/days-worn", dependencies=[admission.admit("dashboard"), DASHBOARD_QUERY_DEADLINE])
+def get_days_worn(filters: CohortFilter = Depends(cohort_filter)):
     try:
         # SQL query to count the number of days each participant wore the device
-        query = """
+        where, params = filters.where(timepoint="timepoint", date=cgm_reading_time())
+        query = f"""
             SELECT 
                 pid,
                 COUNT(DISTINCT STR_TO_DATE(device_timestamp, '%m-%d-%Y')) AS days_worn
             FROM 
                 cgm_data
+            {where}
             GROUP BY 
                 pid;
         """
 
 
         # Pass the query to the MySQLDatabase class for execution
-        result = database.execute_query(query)
+        result = database.execute_query(query, params)
 
         # Transform the result into a list of dictionaries
         data = [{"pid": row[0], "days_worn": row[1]} for row in result]
 
-        return {"data": data}
+        return with_archived({"data": data}, "cgm_data", filters.start, filters.end)
 
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/cgm-metrics")
-async def get_cgm_metrics():
+
+def compute_cgm_metrics(filters=None):
+    filters = filters or CohortFilter()
+    # SQL query to fetch the glucose readings of the selected participants, timepoint and dates
+    where, params = filters.where(timepoint="timepoint", date=cgm_reading_time())
+    query = f"""
+        SELECT 
+            pid, 
+            AVG(historic_glucose_mg_dl) AS avg_glucose,
+            SUM(CASE WHEN historic_glucose_mg_dl BETWEEN 70 AND 180 THEN 1 ELSE 0 END) / COUNT(*) * 100 AS tir,
+            SUM(CASE WHEN historic_glucose_mg_dl < 70 THEN 1 ELSE 0 END) AS hypo_events,
+            SUM(CASE WHEN historic_glucose_mg_dl > 180 THEN 1 ELSE 0 END) AS hyper_events,
+            STDDEV(historic_glucose_mg_dl) AS glucose_variability
+        FROM 
+            cgm_data
+        {where}
+        GROUP BY 
+            pid;
+    """
+
+    # Execute the query
+    result = database.execute_query(query, params)
+    # Averages over participants; None when the filter selects nobody
+    n = len(result) or None
+    # Calculate the sum of hypo and hyper events
+    total_hypo_events = sum(row[3] for row in result)
+    total_hyper_events = sum(row[4] for row in result)
+    total_participants = len(result)  # Calculate total participants
+    avg_tir_per_participant = sum(row[2] for row in result) / n if n else None
+    avg_glucose_variability = sum(row[5] for row in result) / n if n else None  # Calculate average glucose variability
+
+    # Process the result to calculate additional metrics
+    metrics = {
+        "average_glucose": sum(row[1] for row in result) / n if n else None,
+        "time_in_range": avg_tir_per_participant,
+        "total_hypo_events": total_hypo_events,
+        "total_hyper_events": total_hyper_events,
+        "total_participants": total_participants,
+        "avg_tir_per_participant": avg_tir_per_participant,
+        "glucose_variability": avg_glucose_variability,
+        "hypoglycemia_events": [{"pid": row[0], "events": row[3]} for row
+                                in result if row[3] > 0],
+        "hyperglycemia_events": [{"pid": row[0], "events": row[4]} for row
+                                 in result if row[4] > 0]
+    }
+    return with_archived({"data": metrics}, "cgm_data", filters.start, filters.end)
+
+
+@app.get("/cgm-metrics", dependencies=[
+    admission.admit("dashboard", bypass=sampled_or_precomputed("cgm-metrics")), DASHBOARD_QUERY_DEADLINE
+])
+def get_cgm_metrics(request: Request, filters: CohortFilter = Depends(cohort_filter), approx: bool = False):
     try:
-        # SQL query to fetch all glucose readings
-        query = """
-            SELECT 
-                pid, 
-                AVG(historic_glucose_mg_dl) AS avg_glucose,
-                SUM(CASE WHEN historic_glucose_mg_dl BETWEEN 70 AND 180 THEN 1 ELSE 0 END) / COUNT(*) * 100 AS tir,
-                SUM(CASE WHEN historic_glucose_mg_dl < 70 THEN 1 ELSE 0 END) AS hypo_events,
-                SUM(CASE WHEN historic_glucose_mg_dl > 180 THEN 1 ELSE 0 END) AS hyper_events,
-                STDDEV(historic_glucose_mg_dl) AS glucose_variability
-            FROM 
-                cgm_data
-            GROUP BY 
-                pid;
-        """
+        if approx:
+            return approx_view("cgm-metrics", compute_approx_cgm_metrics, filters, request)
+        return cohort_view("cgm-metrics", compute_cgm_metrics, filters, request)
 
-        # Execute the query
-        result = database.execute_query(query)
-        # Calculate the sum of hypo and hyper events
-        total_hypo_events = sum(row[3] for row in result)
-        total_hyper_events = sum(row[4] for row in result)
-        total_participants = len(result)  # Calculate total participants
-        avg_tir_per_participant = sum(row[2] for row in result) / len(result)
-        avg_glucose_variability = sum(row[5] for row in result) / len(result)  # Calculate average glucose variability
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Process the result to calculate additional metrics
-        metrics = {
-            "average_glucose": sum(row[1] for row in result) / len(result),
-            "time_in_range": sum(row[2] for row in result) / len(result),
-            "total_hypo_events": total_hypo_events,
-            "total_hyper_events": total_hyper_events,
-            "total_participants": total_participants,
-            "avg_tir_per_participant": avg_tir_per_participant,
-            "glucose_variability": avg_glucose_variability,
-            "hypoglycemia_events": [{"pid": row[0], "events": row[3]} for row
-                                    in result if row[3] > 0],
-            "hyperglycemia_events": [{"pid": row[0], "events": row[4]} for row
-                                     in result if row[4] > 0]
-        }
-        return {"data": metrics}
 
+def compute_time_in_ranges(filters=None):
+    filters = filters or CohortFilter()
+    where, params = filters.where(timepoint="timepoint", date=cgm_reading_time())
+    query = f"""
+        SELECT 
+            pid,
+            SUM(CASE WHEN historic_glucose_mg_dl > 250 THEN 1 ELSE 0 END) / COUNT(*) * 100 AS very_high,
+            SUM(CASE WHEN historic_glucose_mg_dl BETWEEN 180 AND 250 THEN 1 ELSE 0 END) / COUNT(*) * 100 AS high,
+            SUM(CASE WHEN historic_glucose_mg_dl BETWEEN 70 AND 180 THEN 1 ELSE 0 END) / COUNT(*) * 100 AS target,
+            SUM(CASE WHEN historic_glucose_mg_dl BETWEEN 54 AND 70 THEN 1 ELSE 0 END) / COUNT(*) * 100 AS low,
+            SUM(CASE WHEN historic_glucose_mg_dl < 54 THEN 1 ELSE 0 END) / COUNT(*) * 100 AS very_low
+        FROM 
+            cgm_data
+        {where}
+        GROUP BY 
+            pid;
+    """
+
+    result = database.execute_query(query, params)
+    time_in_ranges = [{"pid": row[0], "very_high": row[1], "high": row[2], "target": row[3], "low": row[4], "very_low": row[5]} for row in result]
+
+    return with_archived({"data": time_in_ranges}, "cgm_data", filters.start, filters.end)
+
+
+@app.get("/participant-time-in-ranges", dependencies=[
+    admission.admit("dashboard", bypass=sampled_or_precomputed("participant-time-in-ranges")), DASHBOARD_QUERY_DEADLINE
+])
+def get_time_in_ranges(request: Request, filters: CohortFilter = Depends(cohort_filter), approx: bool = False):
+    try:
+        if approx:
+            return approx_view("participant-time-in-ranges", compute_approx_time_in_ranges, filters, request)
+        return cohort_view("participant-time-in-ranges", compute_time_in_ranges, filters, request)
+
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/participant-time-in-ranges")
-async def get_time_in_ranges():
+def compute_qa_dashboard(filters=None):
+    filters = filters or CohortFilter()
+    cohort, params = filters.and_where(timepoint="timepoint", date=cgm_reading_time())
+
+    # Event Detection Over Time by PID
+    event_detection_query = f"""
+        SELECT 
+            pid,
+            DATE(STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i')) AS date,
+            SUM(CASE WHEN historic_glucose_mg_dl < 70 THEN 1 ELSE 0 END) AS hypo_events,
+            SUM(CASE WHEN historic_glucose_mg_dl > 180 THEN 1 ELSE 0 END) AS hyper_events
+        FROM 
+            cgm_data
+        WHERE
+        timepoint IS NOT NULL
+        AND STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i') IS NOT NULL{cohort}
+        GROUP BY 
+            pid,
+            DATE(STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i'));
+    """
+    event_detection_result = database.execute_query(event_detection_query, params)
+
+    # Glucose Level Distribution by PID, summed from the per-day 1 mg/dL histograms
+    glucose_distribution = series_store.histograms.distribution(
+        filters.pids, filters.start, filters.end, bin_width=10, timepoint=filters.timepoint
+    )
+
+    # Daily Averages and Peaks by PID
+    daily_avg_peaks_query = f"""
+        SELECT 
+            pid,
+            DATE(STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i')) AS date,
+            AVG(historic_glucose_mg_dl) AS avg_glucose,
+            MAX(historic_glucose_mg_dl) AS peak_glucose
+        FROM 
+            cgm_data
+        WHERE
+        timepoint IS NOT NULL
+        AND STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i') IS NOT NULL{cohort}
+        GROUP BY 
+            pid,
+            DATE(STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i'));
+    """
+    daily_avg_peaks_result = database.execute_query(daily_avg_peaks_query, params)
+
+    # Process and return the results
+    qa_dashboard_data = {
+        "event_detection_over_time": [{"pid": row[0], "date": row[1], "hypo_events": row[2], "hyper_events": row[3]} for row in event_detection_result],
+        "glucose_distribution": glucose_distribution,
+        "daily_avg_peaks": [{"pid": row[0], "date": row[1], "avg_glucose": row[2], "peak_glucose": row[3]} for row in daily_avg_peaks_result]
+    }
+
+    return with_archived({"data": qa_dashboard_data}, "cgm_data", filters.start, filters.end)
+
+
+@app.get("/qa-dashboard", dependencies=[
+    admission.admit("dashboard", weight=3, bypass=precomputed_ready("qa-dashboard")), DASHBOARD_QUERY_DEADLINE
+])
+def get_qa_dashboard(request: Request, filters: CohortFilter = Depends(cohort_filter)):
     try:
-        query = """
-            SELECT 
-                pid,
-                SUM(CASE WHEN historic_glucose_mg_dl > 250 THEN 1 ELSE 0 END) / COUNT(*) * 100 AS very_high,
-                SUM(CASE WHEN historic_glucose_mg_dl BETWEEN 180 AND 250 THEN 1 ELSE 0 END) / COUNT(*) * 100 AS high,
-                SUM(CASE WHEN historic_glucose_mg_dl BETWEEN 70 AND 180 THEN 1 ELSE 0 END) / COUNT(*) * 100 AS target,
-                SUM(CASE WHEN historic_glucose_mg_dl BETWEEN 54 AND 70 THEN 1 ELSE 0 END) / COUNT(*) * 100 AS low,
-                SUM(CASE WHEN historic_glucose_mg_dl < 54 THEN 1 ELSE 0 END) / COUNT(*) * 100 AS very_low
-            FROM 
-                cgm_data
-            GROUP BY 
-                pid;
-        """
+        return cohort_view("qa-dashboard", compute_qa_dashboard, filters, request)
+
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        result = database.execute_query(query)
-        time_in_ranges = [{"pid": row[0], "very_high": row[1], "high": row[2], "target": row[3], "low": row[4], "very_low": row[5]} for row in result]
 
-        return {"data": time_in_ranges}
+HISTOGRAM_PERCENTILES = (5, 25, 50, 75, 95)
 
+
+@app.get("/glucose-histogram", dependencies=[admission.admit("cohort"), COHORT_QUERY_DEADLINE])
+def get_glucose_histogram(
+    filters: CohortFilter = Depends(cohort_filter),
+    bin_width: int = Query(10, ge=1, le=100),
+    combine: bool = False
+):
+    # Answered from the per-day histograms: the range, cohort subset and bin width only change
+    # which small arrays are summed, never how much of cgm_data is read
+    try:
+        merged = series_store.histograms.merged(filters.pids, filters.start, filters.end, filters.timepoint)
+        if combine:
+            merged = {"all": merge((0, total) for total in merged.values())}
+        data = [
+            {
+                "pid": pid,
+                "n_readings": int(total.sum()),
+                "bins": [{"glucose_range": low, "occurrences": count} for low, count in rebin(total, bin_width)],
+                "percentiles": dict(zip(HISTOGRAM_PERCENTILES, percentiles(total, HISTOGRAM_PERCENTILES))),
+                "time_in_range": fraction_between(total, 70, 180),
+            }
+            for pid, total in merged.items()
+        ]
+        return {"data": data, "bin_width": bin_width}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/qa-dashboard")
-async def get_qa_dashboard():
-    try:
-        # Event Detection Over Time by PID
-        event_detection_query = """
-            SELECT 
-                pid,
-                DATE(STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i')) AS date,
-                SUM(CASE WHEN historic_glucose_mg_dl < 70 THEN 1 ELSE 0 END) AS hypo_events,
-                SUM(CASE WHEN historic_glucose_mg_dl > 180 THEN 1 ELSE 0 END) AS hyper_events
-            FROM 
-                cgm_data
-            WHERE
-            timepoint IS NOT NULL
-            AND STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i') IS NOT NULL
-            GROUP BY 
-                pid,
-                DATE(STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i'));
-        """
-        event_detection_result = database.execute_query(event_detection_query)
 
-        # Glucose Level Distribution by PID
-        glucose_distribution_query = """
-            SELECT 
-                pid,
-                FLOOR(historic_glucose_mg_dl / 10) * 10 AS glucose_range,
-                COUNT(*) AS occurrences
-            FROM 
-                cgm_data
-            GROUP BY 
-                pid,
-                glucose_range;
-        """
-        glucose_distribution_result = database.execute_query(glucose_distribution_query)
+@app.get("/participant/{pid}/nutrition", dependencies=[admission.admit("participant"), PARTICIPANT_QUERY_DEADLINE])
+def get_participant_nutrition(pid: str, from_: Optional[str] = Query(None, alias="from"), to: Optional[str] = None):
+    # Daily nutrient totals from the rollups; from/to are inclusive dates
+    try:
+        params = {"pid": pid, **participant_range(parse_date(from_) if from_ else None, parse_date(to) if to else None)}
+        return {"data": [row._asdict() for row in database.fetch(PARTICIPANT_NUTRITION, params)]}
 
-        # Daily Averages and Peaks by PID
-        daily_avg_peaks_query = """
-            SELECT 
-                pid,
-                DATE(STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i')) AS date,
-                AVG(historic_glucose_mg_dl) AS avg_glucose,
-                MAX(historic_glucose_mg_dl) AS peak_glucose
-            FROM 
-                cgm_data
-            WHERE
-            timepoint IS NOT NULL
-            AND STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i') IS NOT NULL
-            GROUP BY 
-                pid,
-                DATE(STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i'));
-        """
-        daily_avg_peaks_result = database.execute_query(daily_avg_peaks_query)
+    except HTTPException:
+        raise
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Process and return the results
-        qa_dashboard_data = {
-            "event_detection_over_time": [{"pid": row[0], "date": row[1], "hypo_events": row[2], "hyper_events": row[3]} for row in event_detection_result],
-            "glucose_distribution": [{"pid": row[0], "glucose_range": row[1], "occurrences": row[2]} for row in glucose_distribution_result],
-            "daily_avg_peaks": [{"pid": row[0], "date": row[1], "avg_glucose": row[2], "peak_glucose": row[3]} for row in daily_avg_peaks_result]
-        }
 
-        return {"data": qa_dashboard_data}
+@app.get("/nutrition/daily", dependencies=[admission.admit("cohort"), COHORT_QUERY_DEADLINE])
+def get_cohort_nutrition(filters: CohortFilter = Depends(cohort_filter)):
+    # Average daily intake per participant and per calendar day, from the rollups
+    try:
+        where, params = filters.where(timepoint="timepoint", date="date")
+        return {"data": nutrition.cohort_intake(where, params)}
 
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/participant/{pid}/daily-avg-glucose")
-async def get_daily_avg_glucose(pid: str):
+@app.get("/nutrition/diet-glucose", dependencies=[admission.admit("cohort"), COHORT_QUERY_DEADLINE])
+def get_diet_glucose(filters: CohortFilter = Depends(cohort_filter)):
+    # Daily glycemic load against that day's mean glucose and time in range, both from rollups
     try:
-        query = """
-            SELECT 
-                DATE(STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i')) AS date,
-                AVG(historic_glucose_mg_dl) AS avg_glucose
-            FROM 
-                cgm_data
-            WHERE 
-                pid = :pid
-            GROUP BY 
-                DATE(STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i'))
-            ORDER BY 
-                DATE(STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i'));
-        """
+        return nutrition.diet_glucose(series_store.histograms, filters)
 
-        params = {"pid": pid}
-        result = database.get_query(query, params)
-        return {"data": result}
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/participant/{pid}/daily-avg-glucose", dependencies=[
+    admission.admit("participant"), PARTICIPANT_QUERY_DEADLINE
+])
+def get_daily_avg_glucose(pid: str):
+    try:
+        days = series_store.load(pid)
+        if days:
+            data = [
+                {"date": day.date, "avg_glucose": float(day.readings['glucose'].mean())}
+                for day in days if len(day.readings)
+            ]
+            return {"data": data}
+
+        # Fall back to the row table for participants that have not been packed yet
+        result = database.fetch(DAILY_AVG_GLUCOSE, {"pid": pid})
+        return {"data": [row._asdict() for row in result]}
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         print(f"Error occurred: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
 
-@app.get("/participant/{pid}/hourly-glucose/{date}")
+@app.get("/participant/{pid}/hourly-glucose/{date}", dependencies=[
+    admission.admit("participant"), PARTICIPANT_QUERY_DEADLINE
+])
 def get_hourly_glucose(pid: str, date: str):
     try:
-        # Query to get CGM data
-        cgm_query = """
+        # Query to get CGM data (fallback when the packed series has no entry for the day); once
+        # cgm_data is partitioned the day is a range on the partition column, which prunes to one month
+        reading_time = partitions.time_column("cgm_data")
+        if reading_time:
+            day_filter = f"{reading_time} >= :start AND {reading_time} < :end"
+        else:
+            day_filter = "DATE(STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i')) = :date"
+        cgm_query = f"""
             SELECT
                 STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i') AS timestamp,
                 historic_glucose_mg_dl AS glucose_level,
@@ -227,407 +628,696 @@ def get_hourly_glucose(pid: str, date: str):
                 cgm_data
             WHERE
                 pid = :pid
-                AND DATE(STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i')) = :date
+                AND {day_filter}
             ORDER BY
                 timestamp;
         """
 
-        # Query to get food log data
-        food_log_query = """
-            SELECT
-                timestamp AS meal_timestamp,
-                total_carbs_g,
-                total_fat_g,
-                protein_g,
-                raw_data,
-                calories,
-                glycemic_load
-            FROM
-                dietary_data
-            WHERE
-                pid = :pid
-                AND DATE(STR_TO_DATE(date, '%Y-%m-%d')) = :date
-            ORDER BY
-                meal_timestamp;
-        """
-
         params = {"pid": pid, "date": date}
+        day = parse_date(date)
         print(params)
-        print(food_log_query)
-        cgm_data = database.get_query(cgm_query, params)
-        food_log_data = database.get_query(food_log_query, params)
+        days = series_store.load(pid, date, date)
+        if days:
+            timestamps, glucose = series_timestamps(days)
+            status = np.where(glucose < 70, 'hypo', np.where(glucose > 180, 'hyper', 'normal'))
+            cgm_data = [
+                {"timestamp": ts, "glucose_level": level, "status": state}
+                for ts, level, state in zip(timestamps.astype('datetime64[s]').tolist(), glucose.tolist(), status.tolist())
+            ]
+        else:
+            cgm_data = database.get_query(cgm_query, {**params, **day_range(pid, day)})
+        food_log_data = [row._asdict() for row in database.fetch(FOOD_LOG, day_range(pid, day))]
 
         print(cgm_data)
         print(food_log_data)
 
         return {"cgm_data": cgm_data, "food_log_data": food_log_data}
+    except HTTPException:
+        raise
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def parse_date(value: str):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+def day_range(pid, day):
+    # Bind parameters for `column >= :start AND column < :end` covering one day, which unlike
+    # DATE(column) = :date lets MySQL range-scan the (pid, column) index
+    return {"pid": pid, "start": day.isoformat(), "end": (day + timedelta(days=1)).isoformat()}
+
+
+def participant_agp(pid, start_date=None, end_date=None, slot_minutes=15):
+    # Default to the standard 14-day AGP ending at the participant's last day of data
+    if end_date is None:
+        end_date = start_date + timedelta(days=AGP_DAYS - 1) if start_date else series_store.date_bounds(pid)[1]
+        if end_date is None:
+            return None
+    if start_date is None:
+        start_date = end_date - timedelta(days=AGP_DAYS - 1)
+
+    version = series_store.version(pid, start_date, end_date)
+    agp = agp_cache.get_or_compute(
+        ("agp", pid, start_date, end_date, slot_minutes, version),
+        lambda: agp_profile(day_matrix(series_store.load(pid, start_date, end_date)), slot_minutes)
+    )
+    return {"pid": pid, "start": start_date, "end": end_date, **agp}
+
+
+@app.get("/participant/{pid}/agp", dependencies=[admission.admit("participant"), PARTICIPANT_QUERY_DEADLINE])
+def get_agp(pid: str, start: Optional[str] = None, end: Optional[str] = None, slot_minutes: int = 15):
+    try:
+        recent_pids.touch(pid)
+        agp = participant_agp(pid, parse_date(start) if start else None, parse_date(end) if end else None, slot_minutes)
+        if agp is None:
+            raise HTTPException(status_code=404, detail=f"No CGM series found for participant {pid}")
+        return {"data": agp}
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+class CohortAGPRequest(BaseModel):
+    pids: List[str]
+    start: str
+    end: str
+    slot_minutes: int = 15
+
+
+# Reads every participant's series for the range in one go, so it takes the whole cohort class
+@app.post("/agp/cohort", dependencies=[admission.admit("cohort", weight=2), COHORT_QUERY_DEADLINE])
+def get_cohort_agp(request: CohortAGPRequest):
+    try:
+        if not request.pids:
+            raise HTTPException(status_code=400, detail="No participant IDs provided.")
+        if len(request.pids) > MAX_COHORT_AGP_PIDS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_COHORT_AGP_PIDS} participants per cohort AGP.")
+
+        start_date, end_date = parse_date(request.start), parse_date(request.end)
+        slot_minutes = request.slot_minutes
+        pids = sorted(set(request.pids))
+        versions = series_store.versions(pids, start_date, end_date)
+
+        cohort_key = ("agp-cohort", tuple(pids), start_date, end_date, slot_minutes,
+                      tuple(versions[pid] for pid in pids))
+        result = agp_cache.get(cohort_key)
+        if result is None:
+            # One read for the whole cohort; each participant's profile is cached on its own too
+            matrices = {pid: day_matrix(days) for pid, days in series_store.load_many(pids, start_date, end_date).items()}
+            participants = {
+                pid: agp_cache.get_or_compute(
+                    ("agp", pid, start_date, end_date, slot_minutes, versions.get(pid, "0:0")),
+                    lambda matrix=matrix: agp_profile(matrix, slot_minutes)
+                )
+                for pid, matrix in matrices.items()
+            }
+            # No participant with data in the range gives an empty (all-NaN) profile
+            cohort = agp_profile(np.concatenate([day_matrix([]), *matrices.values()]), slot_minutes)
+            result = {"cohort": cohort, "participants": participants}
+            agp_cache.set(cohort_key, result)
+
+        return {"data": {"start": start_date, "end": end_date, **result}}
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def parse_datetime(value: str):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid timestamp '{value}', expected ISO 8601")
+
+
+def cgm_readings(pid, start=None, end=None):
+    """(datetime64[m] timestamps, glucose) of a participant's cgm_data rows in [start, end), in time order."""
+    reading_time = partitions.time_column("cgm_data") or "STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i')"
+    conditions, params = ["pid = :pid", "historic_glucose_mg_dl IS NOT NULL", f"{reading_time} IS NOT NULL"], {"pid": pid}
+    if start:
+        conditions.append(f"{reading_time} >= :start")
+        params["start"] = start
+    if end:
+        conditions.append(f"{reading_time} < :end")
+        params["end"] = end
+    rows = database.execute_query(f"""
+        SELECT {reading_time} AS timestamp, historic_glucose_mg_dl AS glucose
+        FROM cgm_data
+        WHERE {' AND '.join(conditions)}
+        ORDER BY timestamp
+    """, params)
+    timestamps = np.array([row[0] for row in rows], dtype='datetime64[m]')
+    glucose = np.array([row[1] for row in rows], dtype=np.float64)
+    return timestamps, glucose
+
+
+@app.get("/participant/{pid}/series/{source}", dependencies=[
+    admission.admit("participant", weight=2), PARTICIPANT_QUERY_DEADLINE
+])
+def get_participant_series(
+    pid: str,
+    source: str,
+    bucket: str = "1h",
+    agg: str = "mean",
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None
+):
+    try:
+        bucket_seconds = parse_bucket(bucket)
+        aggregates = parse_aggregates(agg)
+        # Half-open range [from, to)
+        start = parse_datetime(from_) if from_ else None
+        end = parse_datetime(to) if to else None
+
+        # Dates covered by [from, to), for the archived months the row tables no longer hold
+        first_day = start.date() if start else None
+        last_day = (end - timedelta(microseconds=1)).date() if end else None
+        archived_table = None
+
+        if source == "cgm":
+            # Bucketed in NumPy over the packed series, one read for the whole range
+            days = series_store.load(pid, start.date() if start else None, end.date() if end else None)
+            if days:
+                timestamps, glucose = series_timestamps(days)
+            else:
+                # Fall back to the row table for participants that have not been packed yet
+                timestamps, glucose = cgm_readings(pid, start, end)
+                archived_table = "cgm_data"
+            mask = np.ones(len(timestamps), dtype=bool)
+            if start:
+                mask &= timestamps >= np.datetime64(start, 'm')
+            if end:
+                mask &= timestamps < np.datetime64(end, 'm')
+            data = bucket_values(timestamps[mask], glucose[mask], bucket_seconds, aggregates)
+
+        elif source == "minute_level":
+            # Bucketed in MySQL with a range predicate on (pid, timestamp)
+            query = minute_level_bucket_query(aggregates, has_start=start is not None, has_end=end is not None)
+            params = {"pid": pid, "bucket_seconds": bucket_seconds}
+            if start:
+                params["start"] = start
+            if end:
+                params["end"] = end
+            data = database.get_query(query, params)
+            archived_table = "minute_level_data"
+
+        else:
+            raise HTTPException(status_code=404, detail=f"Unknown series source '{source}', expected 'cgm' or 'minute_level'")
+
+        response = {"data": data, "bucket": bucket, "agg": aggregates}
+        return with_archived(response, archived_table, first_day, last_day) if archived_table else response
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+class CGMReading(BaseModel):
+    timestamp: datetime  # Device local time
+    glucose: float = Field(..., ge=0, le=1000)
+    record_type: int = 0
+
+
+class CGMReadingsBatch(BaseModel):
+    pid: str
+    timepoint: str
+    device: Optional[str] = None
+    serial_number: Optional[str] = None
+    readings: List[CGMReading]
+
+
+@app.post("/cgm/readings", status_code=201)
+async def post_cgm_readings(batch: CGMReadingsBatch, response: Response, wait: bool = True):
+    # wait=true (default) acknowledges only after the readings are committed,
+    # wait=false returns 202 as soon as they are queued
+    if not batch.readings:
+        raise HTTPException(status_code=400, detail="No readings provided.")
+    if len(batch.readings) > MAX_READINGS_PER_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_READINGS_PER_BATCH} readings per batch.")
+
+    try:
+        if not cgm_ingest.running:
+            await cgm_ingest.start()
+        await cgm_ingest.submit(batch, wait=wait)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Readings were not committed: {str(e)}")
+
+    if not wait:
+        response.status_code = 202
+    return {"pid": batch.pid, "accepted": len(batch.readings), "committed": wait}
+
+
+@app.get("/participant/{pid}/glucose-stream")
+async def stream_participant_glucose(pid: str, request: Request):
+    subscription = await glucose_hub.subscribe([pid])
+    return StreamingResponse(glucose_hub.events(request, subscription), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.get("/cohort/glucose-stream")
+async def stream_cohort_glucose(request: Request, pids: List[str] = Query(...)):
+    if len(pids) > 500:
+        raise HTTPException(status_code=400, detail="At most 500 participants per stream.")
+    subscription = await glucose_hub.subscribe(pids)
+    return StreamingResponse(glucose_hub.events(request, subscription), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+def export_response(table, pids, format, compression, start, end, cost_class):
+    # Streamed from an unbuffered cursor: one chunk of rows in memory, compressed as it is written
+    query = export_query(table, pids, start, end, date_expression=partitions.time_column(table))
+    batches = stream_rows(database.engine, *query, kill_query=database.kill_query)
+    # Months already archived to Parquet are read back first and followed by the rows still in MySQL
+    archived = partitions.archived_batches(table, pids, start, end) if table in PARTITIONED_TABLES else None
+    if archived is not None:
+        batches = chain_batches(archived, batches)
+    if format == "parquet":
+        chunks = parquet_chunks(batches, compression)
+        media_type, extension = "application/vnd.apache.parquet", "parquet"
+    else:
+        chunks = csv_chunks(batches, compression)
+        media_type, extension = ("application/gzip", "csv.gz") if compression == "gzip" else ("text/csv", "csv")
+
+    # The export slot is held until the body is fully sent or the client goes away
+    released = False
+
+    def release():
+        nonlocal released
+        if not released:
+            released = True
+            cost_class.release(1)
+
+    async def body():
+        try:
+            async for chunk in iterate_in_threadpool(chunks):
+                yield chunk
+        finally:
+            try:
+                # Kills the query if the stream stopped early
+                await run_in_threadpool(chunks.close)
+            except ValueError:
+                pass
+            release()
+
+    suffix = f"-{pids[0]}" if pids and len(pids) == 1 else ""
+    headers = {"Content-Disposition": f'attachment; filename="{table}{suffix}.{extension}"'}
+    return StreamingResponse(body(), media_type=media_type, headers=headers, background=BackgroundTask(release))
+
+
+@app.get("/export/{table}")
+async def export_table(
+    table: str,
+    request: Request,
+    pids: Optional[List[str]] = Query(None),
+    format: str = "csv",
+    compression: Optional[str] = None,
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None
+):
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=404, detail=f"Unknown table '{table}', expected one of {', '.join(EXPORT_TABLES)}")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format '{format}', expected one of {', '.join(EXPORT_FORMATS)}")
+    allowed = PARQUET_COMPRESSION if format == "parquet" else CSV_COMPRESSION
+    compression = compression or allowed[0]
+    if compression not in allowed:
+        raise HTTPException(status_code=400, detail=f"Unknown {format} compression '{compression}', expected one of {', '.join(allowed)}")
+    start = parse_date(from_) if from_ else None
+    end = parse_date(to) if to else None
+
+    cost_class = admission.classes["export"]
+    await cost_class.acquire(1, request)
+    try:
+        # In the threadpool: looking up archived months reads the archive manifest
+        return await run_in_threadpool(export_response, table, pids, format, compression, start, end, cost_class)
+    except Exception as e:
+        cost_class.release(1)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/participant/{pid}/export/{table}")
+async def export_participant_table(
+    pid: str,
+    table: str,
+    request: Request,
+    format: str = "csv",
+    compression: Optional[str] = None,
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None
+):
+    return await export_table(table, request, [pid], format, compression, from_, to)
+
+
 #2
 
 
 # 1. Get QC Dashboard Data (summary of wear time, file sizes, calibration, etc.)
-@app.get("/qc-dashboard")
-async def get_qc_dashboard():
+@app.get("/qc-dashboard", dependencies=[admission.admit("dashboard"), DASHBOARD_QUERY_DEADLINE])
+def get_qc_dashboard():
     try:
-        # SQL query to fetch QC dashboard data
-        query = """
-            SELECT 
-                pid,
-                file_size,
-                file_deviceID,
-                file_startTime,
-                file_endTime,
-                data_wearTime_overall_days,
-                data_nonWearTime_overall_days,
-                data_quality_goodCalibration
-            FROM ukb_summary;
-        """
-        result = database.execute_query(query)
+        result = database.fetch(QC_DASHBOARD)
 
         # Process and format the results into a dictionary
         qc_data = [
             {
-                "participant_id": row[0],
-                "file_size_MB": row[1] / (1024 ** 2),  # Convert file size to MB
-                "device_id": row[2],
-                "start_time": row[3].strftime('%Y-%m-%d %H:%M:%S'),
-                "end_time": row[4].strftime('%Y-%m-%d %H:%M:%S'),
-                "wear_time_days": row[5],
-                "non_wear_time_days": row[6],
-                "good_calibration": bool(row[7])
+                "participant_id": row.pid,
+                "file_size_MB": row.file_size / (1024 ** 2),  # Convert file size to MB
+                "device_id": row.file_deviceID,
+                "start_time": row.file_startTime.strftime('%Y-%m-%d %H:%M:%S'),
+                "end_time": row.file_endTime.strftime('%Y-%m-%d %H:%M:%S'),
+                "wear_time_days": row.data_wearTime_overall_days,
+                "non_wear_time_days": row.data_nonWearTime_overall_days,
+                "good_calibration": bool(row.data_quality_goodCalibration)
             }
             for row in result
         ]
 
         return {"data": qc_data}
 
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # 2. Get QC Metrics (total files processed, average wear/non-wear time, calibration)
-@app.get("/qc-metrics")
-async def get_qc_metrics():
+@app.get("/qc-metrics", dependencies=[admission.admit("dashboard"), DASHBOARD_QUERY_DEADLINE])
+def get_qc_metrics():
     try:
-        # SQL queries to fetch QC metrics
-        total_files_query = "SELECT COUNT(*) FROM summary_data;"
-        avg_wear_time_query = "SELECT AVG(wearTime_overall) FROM summary_data;"
-        good_calibration_query = "SELECT AVG(file_size)  FROM summary_data;"
-        avg_non_wear_time_query = "SELECT AVG(nonWearTime_overall) FROM summary_data;"
-
-        # Execute queries
-        total_files = database.execute_query(total_files_query)[0][0]
-        avg_wear_time = database.execute_query(avg_wear_time_query)[0][0]
-        good_calibration_count = database.execute_query(good_calibration_query)[0][0]
-        avg_non_wear_time = database.execute_query(avg_non_wear_time_query)[0][0]
+        # All four aggregates in one query
+        row = database.fetch(QC_METRICS)[0]
 
         # QC Metrics data
         metrics = {
-            "total_files_processed": total_files,
-            "average_wear_time_days": round(avg_wear_time, 2),
-            "good_calibration_count": good_calibration_count,
-            "average_non_wear_time_days": round(avg_non_wear_time, 2)
+            "total_files_processed": row.total_files,
+            "average_wear_time_days": round(row.avg_wear_time, 2),
+            "good_calibration_count": row.avg_file_size,
+            "average_non_wear_time_days": round(row.avg_non_wear_time, 2)
         }
 
         return {"data": metrics}
 
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # 3. Wear vs Non-Wear Time (comparison of wear and non-wear time per participant)
-@app.get("/wear-vs-nonwear")
-async def get_wear_vs_nonwear():
+@app.get("/wear-vs-nonwear", dependencies=[admission.admit("dashboard"), DASHBOARD_QUERY_DEADLINE])
+def get_wear_vs_nonwear():
     try:
-        query = """
-            SELECT 
-                pid, 
-                wearTime_overall,
-                nonWearTime_overall
-            FROM summary_data;
-        """
-        result = database.execute_query(query)
+        result = database.fetch(WEAR_VS_NONWEAR)
 
         # Format the result into a dictionary
         wear_nonwear_data = [
             {
-                "participant_id": row[0],
-                "wear_time_days": row[1],
-                "non_wear_time_days": row[2]
+                "participant_id": row.pid,
+                "wear_time_days": row.wearTime_overall,
+                "non_wear_time_days": row.nonWearTime_overall
             }
             for row in result
         ]
 
         return {"data": wear_nonwear_data}
 
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # 4. Calibration Check (check the number of participants with good calibration)
-@app.get("/calibration-check")
-async def get_calibration_check():
+@app.get("/calibration-check", dependencies=[admission.admit("dashboard"), DASHBOARD_QUERY_DEADLINE])
+def get_calibration_check():
     try:
-        query = """
-            SELECT 
-                participant_id,
-                data_quality_goodCalibration
-            FROM ukb_summary
-            WHERE data_quality_goodCalibration = 1;
-        """
-        result = database.execute_query(query)
+        result = database.fetch(CALIBRATION_CHECK)
 
-        calibration_data = [{"participant_id": row[0]} for row in result]
+        calibration_data = [{"participant_id": row.participant_id} for row in result]
 
         return {"data": calibration_data}
 
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # 5. Get Detailed File Metadata for each participant
-@app.get("/file-metadata")
-async def get_file_metadata():
+@app.get("/file-metadata", dependencies=[admission.admit("dashboard"), DASHBOARD_QUERY_DEADLINE])
+def get_file_metadata():
     try:
-        query = """
-            SELECT 
-                pid,
-                file_name,
-                file_deviceID,
-                file_size,
-                file_startTime,
-                file_endTime
-            FROM summary_data;
-        """
-        result = database.execute_query(query)
+        result = database.fetch(FILE_METADATA)
 
         metadata = [
             {
-                "participant_id": row[0],
-                "file_name": os.path.basename(row[1]),
-                "device_id": row[2],
-                "file_size_MB": row[3] / (1024 ** 2),  # Convert file size to MB
-                "start_time": row[4].strftime('%Y-%m-%d %H:%M:%S'),
-                "end_time": row[5].strftime('%Y-%m-%d %H:%M:%S')
+                "participant_id": row.pid,
+                "file_name": os.path.basename(row.file_name),
+                "device_id": row.file_deviceID,
+                "file_size_MB": row.file_size / (1024 ** 2),  # Convert file size to MB
+                "start_time": row.file_startTime.strftime('%Y-%m-%d %H:%M:%S'),
+                "end_time": row.file_endTime.strftime('%Y-%m-%d %H:%M:%S')
             }
             for row in result
         ]
 
         return {"data": metadata}
 
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/participant/{pid}")
-async def get_participant_data(pid: str):
+@app.get("/participant/{pid}", dependencies=[admission.admit("participant"), PARTICIPANT_QUERY_DEADLINE])
+def get_participant_data(pid: str):
         try:
-            query = """
-                SELECT 
-                    calendar_date,
-                    dur_day_total_IN_min,
-                    dur_day_total_LIG_min,
-                    dur_day_total_MOD_min,
-                    dur_day_total_VIG_min,
-                    dur_spt_min,
-                    nonwear_perc_day_spt
-                FROM day_summary
-                WHERE pid = :pid;
-            """
-            result = database.get_query(query, {'pid': pid})
-            participant_data = [dict(row) for row in result]
+            result = database.fetch(PARTICIPANT_DAY_SUMMARY, {'pid': pid})
+            participant_data = [row._asdict() for row in result]
             return {"data": participant_data}
 
+        except QueryInterrupted as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/participant/{pid}/sleep-data")
-async def get_sleep_data(pid: str):
+@app.get("/participant/{pid}/sleep-data", dependencies=[admission.admit("participant"), PARTICIPANT_QUERY_DEADLINE])
+def get_sleep_data(pid: str):
     try:
-        # SQL query to fetch sleep data for the specified participant
-        query = """
-            SELECT 
-                calendar_date,
-                sleeponset_ts,
-                wakeup_ts,
-                sleep_efficiency_after_onset
-            FROM day_summary
-            WHERE pid = :pid;
-        """
-        result = database.get_query(query, {'pid': pid})
-        sleep_data = [dict(row) for row in result]
+        result = database.fetch(SLEEP_DATA, {'pid': pid})
+        sleep_data = [row._asdict() for row in result]
         return {"data": sleep_data}
 
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/participant/{pid}/dates")
-async def getDatesForPid(pid: str):
+@app.get("/participant/{pid}/dates", dependencies=[admission.admit("participant"), PARTICIPANT_QUERY_DEADLINE])
+def getDatesForPid(pid: str):
     try:
-        # Query to fetch distinct date parts (YYYY-MM-DD) for the given PID
-        query = f"""
-                     SELECT DISTINCT(DATE(calendar_date)) as date 
-                     FROM wear_time 
-                     WHERE pid = '{pid}';
-                """
-        result = database.execute_query(query)
-        dates = [row[0] for row in result]
+        result = database.fetch(PARTICIPANT_DATES, {'pid': pid})
+        dates = sorted({row.calendar_date.date() if isinstance(row.calendar_date, datetime) else row.calendar_date
+                        for row in result})
         return {"data": dates}
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         # Handle any exceptions that may occur
         raise HTTPException(status_code=500, detail=str(e))
-@app.get("/pids")
-async def getPids():
-    try:
-        query = """
-                     SELECT DISTINCT(pid) as pid from wear_time;
-                """
-        result  = database.execute_query(query)
-        pids = [row[0] for row in result]
+@app.get("/pids", dependencies=[admission.admit("cohort"), COHORT_QUERY_DEADLINE])
+def getPids():
+    try:
+        pids = [row.pid for row in database.fetch(PIDS)]
         return {"data":pids}
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         # Handle any exceptions that may occur
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/participant/{pid}/wear-time")
-async def get_wear_time_data(pid: str):
+
+class GroupRequest(BaseModel):
+    pids: List[str]
+
+
+@app.get("/groups", dependencies=[admission.admit("dashboard"), DASHBOARD_QUERY_DEADLINE])
+def get_groups():
+    try:
+        return {"data": list_groups(database.engine)}
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.put("/groups/{name}", dependencies=[admission.admit("dashboard"), DASHBOARD_QUERY_DEADLINE])
+def put_group(name: str, request: GroupRequest):
+    # Named participant subsets for the `group=` filter of the cohort endpoints
+    try:
+        set_group(database.engine, name, request.pids)
+        filtered_views.clear()
+        return {"data": {"group": name, "participants": len(set(request.pids))}}
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/participant/{pid}/wear-time", dependencies=[admission.admit("participant"), PARTICIPANT_QUERY_DEADLINE])
+def get_wear_time_data(pid: str):
     try:
-        # SQL query to fetch wear time data for the specified participant
-        query = """
-            SELECT 
-                calendar_date,
-                day,
-                recorded_wear_time_hrs
-            FROM wear_time
-            WHERE pid = :pid
-            ORDER BY calendar_date;
-        """
         # Execute the query and pass the pid
-        result = database.get_query(query, {'pid': pid})
+        result = database.fetch(WEAR_TIME, {'pid': pid})
 
         # Convert the result into a dictionary for the response
-        wear_time_data = [dict(row) for row in result]
+        wear_time_data = [row._asdict() for row in result]
         return {"data": wear_time_data}
 
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         # Handle any exceptions that may occur
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/participant/{pid}/sleep-hours-efficiency")
-async def get_sleep_hours_efficiency(pid: str):
+@app.get("/participant/{pid}/sleep-hours-efficiency", dependencies=[
+    admission.admit("participant"), PARTICIPANT_QUERY_DEADLINE
+])
+def get_sleep_hours_efficiency(pid: str):
     try:
-        # SQL query to fetch sleep hours and sleep efficiency for the participant
-        query = """
-            SELECT 
-                calendar_date,
-                dur_spt_sleep_min / 60 AS sleep_hours,  -- Convert minutes to hours
-                sleeponset_ts,wakeup_ts,
-                sleep_efficiency_after_onset
-            FROM day_summary
-            WHERE pid = :pid
-            ORDER BY calendar_date;
-        """
-        result = database.get_query(query, {'pid': pid})
+        result = database.fetch(SLEEP_HOURS_EFFICIENCY, {'pid': pid})
 
         # Convert the result into a list of dictionaries
-        sleep_data = [dict(row) for row in result]
+        sleep_data = [row._asdict() for row in result]
 
         # Return the sleep data
         return {"data": sleep_data}
 
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/participant/{pid}/activity-sleep-trace")
-async def get_activity_sleep_trace(pid: str, date: str):
+@app.get("/participant/{pid}/activity-sleep-trace", dependencies=[
+    admission.admit("participant"), PARTICIPANT_QUERY_DEADLINE
+])
+def get_activity_sleep_trace(pid: str, date: str):
     try:
-        # SQL query to fetch activity and sleep data for the specified participant and date
-        query = """
-            SELECT 
-                timestamp,
-                sedentary,
-                light,
-                moderate_vigorous,
-                sleep
-            FROM minute_level_data
-            WHERE pid = :pid
-            AND DATE(timestamp) = :date
-            ORDER BY timestamp;
-        """
-        result = database.get_query(query, {'pid': pid, 'date': date})
-        trace_data = [dict(row) for row in result]
-        return {"data": trace_data}
-
+        day = parse_date(date)
+        result = database.fetch(ACTIVITY_SLEEP_TRACE, day_range(pid, day))
+        trace_data = [row._asdict() for row in result]
+        return with_archived({"data": trace_data}, "minute_level_data", day, day)
+
+    except HTTPException:
+        raise
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/wear-time-boxplot")
-async def get_wear_time_boxplot():
-    try:
-        # SQL query to calculate global wear time statistics
-        query_global = """
-            WITH ranked_wear_time AS (
-                SELECT 
-                    wearTime_overall,
-                    ROW_NUMBER() OVER (ORDER BY wearTime_overall) AS rn,
-                    COUNT(*) OVER () AS total_count
-                FROM summary_data
-            )
-            SELECT 
-                MIN(wearTime_overall) AS min,  -- Min wear time
-                MAX(CASE WHEN rn = FLOOR(total_count * 0.25) THEN wearTime_overall END) AS q1,  -- Q1 (25th percentile)
-                MAX(CASE WHEN rn = FLOOR(total_count * 0.5) THEN wearTime_overall END) AS median,  -- Median (50th percentile)
-                MAX(CASE WHEN rn = FLOOR(total_count * 0.75) THEN wearTime_overall END) AS q3,  -- Q3 (75th percentile)
-                MAX(wearTime_overall) AS max  -- Max wear time
-            FROM ranked_wear_time;
-        """
-        result_global = database.execute_query(query_global)
-
-        # Debugging: print or log the result to check the query output
-        print(f"Global wear time result: {result_global}")
-
-        # Ensure result_global is not empty or None
-        if not result_global or len(result_global) == 0:
-            raise HTTPException(status_code=404, detail="Global wear time statistics not found")
-
-        # The query returns a list of tuples, we use result_global[0] for the first row
-        row_global = result_global[0]
-
-        # Prepare the global box plot data
-        boxplot_data = {
-            "min": row_global[0],
-            "q1": row_global[1],
-            "median": row_global[2],
-            "q3": row_global[3],
-            "max": row_global[4]
-        }
 
-        # SQL query to fetch individual wear time data points for each PID
-        query_individual = """
+def compute_wear_time_boxplot(filters=None):
+    # Per-file accelerometer summaries have no timepoint; the filter applies by pid and recording start
+    where, params = (filters or CohortFilter()).where(date="file_startTime")
+    # SQL query to calculate global wear time statistics
+    query_global = f"""
+        WITH ranked_wear_time AS (
             SELECT 
-                pid, wearTime_overall
+                wearTime_overall,
+                ROW_NUMBER() OVER (ORDER BY wearTime_overall) AS rn,
+                COUNT(*) OVER () AS total_count
             FROM summary_data
-        """
-        result_individual = database.execute_query(query_individual)
-
-        # Debugging: print or log the result to check the query output
-        print(f"Individual wear time result: {result_individual}")
-
-        # Ensure result_individual is not empty or None
-        if not result_individual or len(result_individual) == 0:
-            raise HTTPException(status_code=404, detail="Individual wear time data not found")
-
-        # Prepare the individual data points for plotting
-        individual_data = [{"pid": row[0], "wearTime_overall": row[1]} for row in result_individual]
-
-        return {"boxplot": boxplot_data, "individuals": individual_data}
-
+            {where}
+        )
+        SELECT 
+            MIN(wearTime_overall) AS min,  -- Min wear time
+            MAX(CASE WHEN rn = FLOOR(total_count * 0.25) THEN wearTime_overall END) AS q1,  -- Q1 (25th percentile)
+            MAX(CASE WHEN rn = FLOOR(total_count * 0.5) THEN wearTime_overall END) AS median,  -- Median (50th percentile)
+            MAX(CASE WHEN rn = FLOOR(total_count * 0.75) THEN wearTime_overall END) AS q3,  -- Q3 (75th percentile)
+            MAX(wearTime_overall) AS max  -- Max wear time
+        FROM ranked_wear_time;
+    """
+    result_global = database.execute_query(query_global, params)
+
+    # Debugging: print or log the result to check the query output
+    print(f"Global wear time result: {result_global}")
+
+    # Ensure result_global is not empty or None
+    if not result_global or len(result_global) == 0:
+        raise HTTPException(status_code=404, detail="Global wear time statistics not found")
+
+    # The query returns a list of tuples, we use result_global[0] for the first row
+    row_global = result_global[0]
+
+    # Prepare the global box plot data
+    boxplot_data = {
+        "min": row_global[0],
+        "q1": row_global[1],
+        "median": row_global[2],
+        "q3": row_global[3],
+        "max": row_global[4]
+    }
+
+    # SQL query to fetch individual wear time data points for each PID
+    query_individual = f"""
+        SELECT 
+            pid, wearTime_overall
+        FROM summary_data
+        {where}
+    """
+    result_individual = database.execute_query(query_individual, params)
+
+    # Debugging: print or log the result to check the query output
+    print(f"Individual wear time result: {result_individual}")
+
+    # Ensure result_individual is not empty or None
+    if not result_individual or len(result_individual) == 0:
+        raise HTTPException(status_code=404, detail="Individual wear time data not found")
+
+    # Prepare the individual data points for plotting
+    individual_data = [{"pid": row[0], "wearTime_overall": row[1]} for row in result_individual]
+
+    return {"boxplot": boxplot_data, "individuals": individual_data}
+
+
+@app.get("/wear-time-boxplot", dependencies=[
+    admission.admit("dashboard", weight=2, bypass=precomputed_ready("wear-time-boxplot")), DASHBOARD_QUERY_DEADLINE
+])
+def get_wear_time_boxplot(request: Request, filters: CohortFilter = Depends(cohort_filter)):
+    try:
+        return cohort_view("wear-time-boxplot", compute_wear_time_boxplot, filters, request)
+
+    except HTTPException:
+        raise
+    except UnsupportedFilter as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         # Log the exception for debugging
         print(f"Error occurred: {str(e)}")
@@ -635,136 +1325,167 @@ async def get_wear_time_boxplot():
 
 
 # API to fetch avg sleep data for box plot
-@app.get("/avg-sleep-boxplot")
-async def get_avg_sleep_boxplot():
-    try:
-        # SQL query to calculate global average sleep statistics (converted to hours)
-        query_global = """
-            WITH ranked_sleep AS (
-                SELECT 
-                    AVG(dur_spt_sleep_min / 60.0) AS avg_sleep_hours,
-                    ROW_NUMBER() OVER (ORDER BY AVG(dur_spt_sleep_min / 60.0)) AS rn,
-                    COUNT(*) OVER () AS total_count
-                FROM day_summary
-                GROUP BY pid
-            )
+def compute_avg_sleep_boxplot(filters=None):
+    # GGIR day summaries have no timepoint; the filter applies by pid and calendar date
+    where, params = (filters or CohortFilter()).where(date="calendar_date")
+    # SQL query to calculate global average sleep statistics (converted to hours)
+    query_global = f"""
+        WITH ranked_sleep AS (
             SELECT 
-                MIN(avg_sleep_hours) AS min,  -- Min average sleep time
-                MAX(CASE WHEN rn = FLOOR(total_count * 0.25) THEN avg_sleep_hours END) AS q1,  -- Q1 (25th percentile)
-                MAX(CASE WHEN rn = FLOOR(total_count * 0.5) THEN avg_sleep_hours END) AS median,  -- Median (50th percentile)
-                MAX(CASE WHEN rn = FLOOR(total_count * 0.75) THEN avg_sleep_hours END) AS q3,  -- Q3 (75th percentile)
-                MAX(avg_sleep_hours) AS max  -- Max average sleep time
-            FROM ranked_sleep;
-        """
-        result_global = database.execute_query(query_global)
-
-        # Debugging: print or log the result to check the query output
-        print(f"Global average sleep result: {result_global}")
-
-        # Ensure result_global is not empty or None
-        if not result_global or len(result_global) == 0:
-            raise HTTPException(status_code=404, detail="Global sleep statistics not found")
-
-        # The query returns a list of tuples, we use result_global[0] for the first row
-        row_global = result_global[0]
-
-        # Prepare the global box plot data
-        boxplot_data = {
-            "min": row_global[0],
-            "q1": row_global[1],
-            "median": row_global[2],
-            "q3": row_global[3],
-            "max": row_global[4]
-        }
-
-        # SQL query to fetch individual average sleep data points for each PID
-        query_individual = """
-            SELECT 
-                pid, AVG(dur_spt_sleep_min / 60.0) AS avg_sleep_hours
+                AVG(dur_spt_sleep_min / 60.0) AS avg_sleep_hours,
+                ROW_NUMBER() OVER (ORDER BY AVG(dur_spt_sleep_min / 60.0)) AS rn,
+                COUNT(*) OVER () AS total_count
             FROM day_summary
+            {where}
             GROUP BY pid
-        """
-        result_individual = database.execute_query(query_individual)
-
-        # Debugging: print or log the result to check the query output
-        print(f"Individual sleep data result: {result_individual}")
-
-        # Ensure result_individual is not empty or None
-        if not result_individual or len(result_individual) == 0:
-            raise HTTPException(status_code=404, detail="Individual sleep data not found")
-
-        # Prepare the individual data points for plotting
-        individual_data = [{"pid": row[0], "avg_sleep": row[1]} for row in result_individual]
-
-        return {"boxplot": boxplot_data, "individuals": individual_data}
-
+        )
+        SELECT 
+            MIN(avg_sleep_hours) AS min,  -- Min average sleep time
+            MAX(CASE WHEN rn = FLOOR(total_count * 0.25) THEN avg_sleep_hours END) AS q1,  -- Q1 (25th percentile)
+            MAX(CASE WHEN rn = FLOOR(total_count * 0.5) THEN avg_sleep_hours END) AS median,  -- Median (50th percentile)
+            MAX(CASE WHEN rn = FLOOR(total_count * 0.75) THEN avg_sleep_hours END) AS q3,  -- Q3 (75th percentile)
+            MAX(avg_sleep_hours) AS max  -- Max average sleep time
+        FROM ranked_sleep;
+    """
+    result_global = database.execute_query(query_global, params)
+
+    # Debugging: print or log the result to check the query output
+    print(f"Global average sleep result: {result_global}")
+
+    # Ensure result_global is not empty or None
+    if not result_global or len(result_global) == 0:
+        raise HTTPException(status_code=404, detail="Global sleep statistics not found")
+
+    # The query returns a list of tuples, we use result_global[0] for the first row
+    row_global = result_global[0]
+
+    # Prepare the global box plot data
+    boxplot_data = {
+        "min": row_global[0],
+        "q1": row_global[1],
+        "median": row_global[2],
+        "q3": row_global[3],
+        "max": row_global[4]
+    }
+
+    # SQL query to fetch individual average sleep data points for each PID
+    query_individual = f"""
+        SELECT 
+            pid, AVG(dur_spt_sleep_min / 60.0) AS avg_sleep_hours
+        FROM day_summary
+        {where}
+        GROUP BY pid
+    """
+    result_individual = database.execute_query(query_individual, params)
+
+    # Debugging: print or log the result to check the query output
+    print(f"Individual sleep data result: {result_individual}")
+
+    # Ensure result_individual is not empty or None
+    if not result_individual or len(result_individual) == 0:
+        raise HTTPException(status_code=404, detail="Individual sleep data not found")
+
+    # Prepare the individual data points for plotting
+    individual_data = [{"pid": row[0], "avg_sleep": row[1]} for row in result_individual]
+
+    return {"boxplot": boxplot_data, "individuals": individual_data}
+
+
+@app.get("/avg-sleep-boxplot", dependencies=[
+    admission.admit("dashboard", weight=2, bypass=precomputed_ready("avg-sleep-boxplot")), DASHBOARD_QUERY_DEADLINE
+])
+def get_avg_sleep_boxplot(request: Request, filters: CohortFilter = Depends(cohort_filter)):
+    try:
+        return cohort_view("avg-sleep-boxplot", compute_avg_sleep_boxplot, filters, request)
+
+    except HTTPException:
+        raise
+    except UnsupportedFilter as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         # Log the exception for debugging
         print(f"Error occurred: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/file-size-boxplot")
-async def get_file_size_boxplot():
-    try:
-        # SQL query to calculate global file size statistics (converted to MB)
-        query_global = """
-            WITH ranked_file_size AS (
-                SELECT 
-                    file_size / (1024 * 1024) AS file_size_mb,  -- Convert bytes to MB
-                    ROW_NUMBER() OVER (ORDER BY file_size / (1024 * 1024)) AS rn,
-                    COUNT(*) OVER () AS total_count
-                FROM summary_data
-            )
+def compute_file_size_boxplot(filters=None):
+    where, params = (filters or CohortFilter()).where(date="file_startTime")
+    # SQL query to calculate global file size statistics (converted to MB)
+    query_global = f"""
+        WITH ranked_file_size AS (
             SELECT 
-                MIN(file_size_mb) AS min,  -- Min file size
-                MAX(CASE WHEN rn = FLOOR(total_count * 0.25) THEN file_size_mb END) AS q1,  -- Q1 (25th percentile)
-                MAX(CASE WHEN rn = FLOOR(total_count * 0.5) THEN file_size_mb END) AS median,  -- Median (50th percentile)
-                MAX(CASE WHEN rn = FLOOR(total_count * 0.75) THEN file_size_mb END) AS q3,  -- Q3 (75th percentile)
-                MAX(file_size_mb) AS max  -- Max file size
-            FROM ranked_file_size;
-        """
-        result_global = database.execute_query(query_global)
-
-        # Debugging: print or log the result to check the query output
-        print(f"Global file size result: {result_global}")
-
-        # Ensure result_global is not empty or None
-        if not result_global or len(result_global) == 0:
-            raise HTTPException(status_code=404, detail="Global file size statistics not found")
-
-        # The query returns a list of tuples, we use result_global[0] for the first row
-        row_global = result_global[0]
-
-        # Prepare the global box plot data
-        boxplot_data = {
-            "min": row_global[0],
-            "q1": row_global[1],
-            "median": row_global[2],
-            "q3": row_global[3],
-            "max": row_global[4]
-        }
-
-        # SQL query to fetch individual file size data points for each PID
-        query_individual = """
-            SELECT 
-                pid, file_size / (1024 * 1024) AS file_size_mb  -- Convert bytes to MB
+                file_size / (1024 * 1024) AS file_size_mb,  -- Convert bytes to MB
+                ROW_NUMBER() OVER (ORDER BY file_size / (1024 * 1024)) AS rn,
+                COUNT(*) OVER () AS total_count
             FROM summary_data
-        """
-        result_individual = database.execute_query(query_individual)
-
-        # Debugging: print or log the result to check the query output
-        print(f"Individual file size data result: {result_individual}")
-
-        # Ensure result_individual is not empty or None
-        if not result_individual or len(result_individual) == 0:
-            raise HTTPException(status_code=404, detail="Individual file size data not found")
-
-        # Prepare the individual data points for plotting
-        individual_data = [{"pid": row[0], "file_size": row[1]} for row in result_individual]
-
-        return {"boxplot": boxplot_data, "individuals": individual_data}
-
+            {where}
+        )
+        SELECT 
+            MIN(file_size_mb) AS min,  -- Min file size
+            MAX(CASE WHEN rn = FLOOR(total_count * 0.25) THEN file_size_mb END) AS q1,  -- Q1 (25th percentile)
+            MAX(CASE WHEN rn = FLOOR(total_count * 0.5) THEN file_size_mb END) AS median,  -- Median (50th percentile)
+            MAX(CASE WHEN rn = FLOOR(total_count * 0.75) THEN file_size_mb END) AS q3,  -- Q3 (75th percentile)
+            MAX(file_size_mb) AS max  -- Max file size
+        FROM ranked_file_size;
+    """
+    result_global = database.execute_query(query_global, params)
+
+    # Debugging: print or log the result to check the query output
+    print(f"Global file size result: {result_global}")
+
+    # Ensure result_global is not empty or None
+    if not result_global or len(result_global) == 0:
+        raise HTTPException(status_code=404, detail="Global file size statistics not found")
+
+    # The query returns a list of tuples, we use result_global[0] for the first row
+    row_global = result_global[0]
+
+    # Prepare the global box plot data
+    boxplot_data = {
+        "min": row_global[0],
+        "q1": row_global[1],
+        "median": row_global[2],
+        "q3": row_global[3],
+        "max": row_global[4]
+    }
+
+    # SQL query to fetch individual file size data points for each PID
+    query_individual = f"""
+        SELECT 
+            pid, file_size / (1024 * 1024) AS file_size_mb  -- Convert bytes to MB
+        FROM summary_data
+        {where}
+    """
+    result_individual = database.execute_query(query_individual, params)
+
+    # Debugging: print or log the result to check the query output
+    print(f"Individual file size data result: {result_individual}")
+
+    # Ensure result_individual is not empty or None
+    if not result_individual or len(result_individual) == 0:
+        raise HTTPException(status_code=404, detail="Individual file size data not found")
+
+    # Prepare the individual data points for plotting
+    individual_data = [{"pid": row[0], "file_size": row[1]} for row in result_individual]
+
+    return {"boxplot": boxplot_data, "individuals": individual_data}
+
+
+@app.get("/file-size-boxplot", dependencies=[
+    admission.admit("dashboard", weight=2, bypass=precomputed_ready("file-size-boxplot")), DASHBOARD_QUERY_DEADLINE
+])
+def get_file_size_boxplot(request: Request, filters: CohortFilter = Depends(cohort_filter)):
+    try:
+        return cohort_view("file-size-boxplot", compute_file_size_boxplot, filters, request)
+
+    except HTTPException:
+        raise
+    except UnsupportedFilter as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         # Log the exception for debugging
         print(f"Error occurred: {str(e)}")
@@ -776,36 +1497,25 @@ async def get_file_size_boxplot():
 class ParticipantTrendsRequest(BaseModel):
     pids: List[str]
 
-from sqlalchemy import text, bindparam
 
-@app.post("/participant-trends")
-async def get_participant_trends(request: ParticipantTrendsRequest):
+@app.post("/participant-trends", dependencies=[admission.admit("cohort", weight=2), COHORT_QUERY_DEADLINE])
+def get_participant_trends(request: ParticipantTrendsRequest):
     try:
         if not request.pids:
             raise HTTPException(status_code=400, detail="No participant IDs provided.")
 
-        query = text("""
-            SELECT 
-                pid, 
-                calendar_date, 
-                recorded_wear_time_hrs
-            FROM wear_time
-            WHERE pid IN :pids
-            ORDER BY pid, calendar_date;
-        """).bindparams(bindparam('pids', expanding=True))
-
-        result = database.get_query_in(query, {'pids': request.pids})
+        result = database.fetch(PARTICIPANT_TRENDS, {'pids': request.pids})
 
         trends = {}
         for row in result:
-            pid = row['pid']
-            date = row['calendar_date']
+            pid = row.pid
+            date = row.calendar_date
             # Convert the string to a datetime object
             date_obj = datetime.strptime(str(date), "%Y-%m-%d %H:%M:%S")
 
             # Format the datetime object to only include the date part
             formatted_date = date_obj.strftime("%Y-%m-%d")
-            wear_time = row['recorded_wear_time_hrs']
+            wear_time = row.recorded_wear_time_hrs
             if pid not in trends:
                 trends[pid] = {'dates': [], 'wear_times': []}
             trends[pid]['dates'].append(formatted_date)
@@ -813,10 +1523,85 @@ async def get_participant_trends(request: ParticipantTrendsRequest):
 
         return {"data": trends}
 
+    except QueryInterrupted as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+
+# Background precompute of the heavy cohort views and warming of per-participant caches
+PRECOMPUTED_VIEWS = {
+    "qa-dashboard": compute_qa_dashboard,
+    "cgm-metrics": compute_cgm_metrics,
+    "participant-time-in-ranges": compute_time_in_ranges,
+    "wear-time-boxplot": compute_wear_time_boxplot,
+    "avg-sleep-boxplot": compute_avg_sleep_boxplot,
+    "file-size-boxplot": compute_file_size_boxplot,
+}
+PRECOMPUTE_INTERVAL_SECONDS = 15 * 60
+
+
+def precompute_job(key, compute):
+    return lambda: studies.for_each(lambda: precomputed.set(key, EncodedBody(compute())))
+
+
+def warm_participant_caches():
+    for pid in recent_pids.recent():
+        participant_agp(pid)
+
+
+def maintain_partitions():
+    partitions.maintain()
+
+
+# Each job runs once per open study, with that study current
+for key, compute in PRECOMPUTED_VIEWS.items():
+    scheduler.register(key, precompute_job(key, compute), interval_seconds=PRECOMPUTE_INTERVAL_SECONDS, on_ingest=True)
+scheduler.register("warm-participant-caches", lambda: studies.for_each(warm_participant_caches),
+                   interval_seconds=5 * 60, on_ingest=True, run_at_start=False)
+scheduler.register("partition-maintenance", lambda: studies.for_each(maintain_partitions), interval_seconds=24 * 60 * 60)
+
+
+@app.get("/jobs/status")
+async def get_jobs_status():
+    return {"data": {**scheduler.status(), "cache": precomputed.stats()}}
+
+
+@app.get("/metrics/routes")
+async def get_route_metrics():
+    # Metrics of the requested study only
+    return {"data": route_metrics.summary()}
+
+
+@app.get("/studies")
+async def get_studies():
+    return {"data": studies.status()}
+
+
+@app.get("/partitions/status")
+def get_partitions_status():
+    try:
+        return {"data": partitions.status()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/admission/status")
+async def get_admission_status():
+    return {"data": admission.status()}
+
+
+@app.post("/jobs/{name}/run", status_code=202)
+async def run_job(name: str):
+    # Lets offline loaders refresh the precomputed views once an ingest finishes
+    try:
+        scheduler.trigger(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{name}'")
+    return {"data": {"triggered": name}}
+
+
 
 if __name__ == "__main__":
     import uvicorn
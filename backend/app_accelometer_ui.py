@@ -5,7 +5,8 @@ import pandas as pd
 from pymongo import MongoClient
 import altair as alt
 from st_aggrid import AgGrid
-from dateutil import parser
+from qc_data import ensure_indexes, metadata_page
+from qc_cache import ParticipantCache, SummaryCache
 import plotly.graph_objects as go
 
 # Set page configuration to wide mode
@@ -17,29 +18,45 @@ collection_summary = db['ukb_summary']
 collection_participant = db['ggir_results']  # Assuming this collection contains the participant-level data
 
 
-# Load data
-@st.cache(allow_output_mutation=True)
-def load_data():
-    data = list(collection_summary.find({}, {'_id': 0}))  # Excluding the MongoDB ID from the data
-    df = pd.json_normalize(data, sep='_')  # Flatten the 'data' node
-    df['data_file-size'] = df['data_file-size'].apply(lambda x: x / (1024 ** 2))  # Convert file size to MB
+PAGE_SIZE = 100
 
-    # Extract timezone and clean datetime fields
-    def extract_timezone(dt):
-        return dt.split('[')[-1].strip(']')
 
-    def clean_datetime(dt):
-        clean_dt = dt.split('+')[0].strip()  # Remove the timezone offset
-        return parser.parse(clean_dt)
+@st.cache_resource
+def prepare_collection():
+    ensure_indexes(collection_summary)
+    return True
 
-    df['timezone'] = df['data_file-startTime'].apply(extract_timezone)
-    df['data_file-startTime'] = df['data_file-startTime'].apply(clean_datetime).dt.strftime('%Y-%m-%d %H:%M:%S')
-    df['data_file-endTime'] = df['data_file-endTime'].apply(clean_datetime).dt.strftime('%Y-%m-%d %H:%M:%S')
 
-    return df
+prepare_collection()
+
+
+# Shared across sessions; refreshes only fetch documents newer than the cached high-water mark
+@st.cache_resource
+def summary_cache():
+    return SummaryCache(collection_summary)
+
+
+@st.cache_resource
+def participant_cache():
+    return ParticipantCache(collection_participant)
 
 
-df = load_data()
+@st.cache_data(ttl=300)
+def load_metadata_page(after, page_size):
+    return metadata_page(collection_summary, after, page_size)
+
+
+# Range paging: the key each visited page starts after, so Previous/Next never skip() through the collection
+def metadata_table_page(page_count):
+    if 'page_starts' not in st.session_state:
+        st.session_state.page_starts = [None]
+    starts = st.session_state.page_starts
+    df, next_key = load_metadata_page(starts[-1], PAGE_SIZE)
+    previous_col, label_col, next_col = st.columns([1, 4, 1])
+    previous_col.button('Previous', on_click=starts.pop, disabled=len(starts) == 1)
+    label_col.markdown(f"Page {len(starts)} of {page_count}")
+    next_col.button('Next', on_click=starts.append, args=(next_key,), disabled=next_key is None)
+    return df
 
 
 # Function to convert column names for table display
@@ -53,7 +70,6 @@ def format_column_name(name):
 columns_for_display = ['participant_id', 'date', 'data_totalReads', 'data_file-size', 'data_file-deviceID',
                        'timezone', 'data_file-startTime', 'data_file-endTime', 'data_quality-daylightSavingsCrossover']
 formatted_columns = {col: format_column_name(col) for col in columns_for_display}
-df_display = df[columns_for_display].rename(columns=formatted_columns)
 
 # Custom CSS for styling
 st.markdown("""
@@ -92,23 +108,26 @@ page = st.sidebar.radio("Go to", ["Overview", "Participant Dashboard"])
 
 
 if page == "Overview":
+    kpis = summary_cache().kpis()
+    wear_df = summary_cache().wear_nonwear()
+
     # Displaying metrics in cards using columns
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.markdown(f'<div class="card"><h1 class="big-font">{df.shape[0]}</h1><p>Total Files Processed</p></div>',
+        st.markdown(f'<div class="card"><h1 class="big-font">{kpis["total_files"]}</h1><p>Total Files Processed</p></div>',
                     unsafe_allow_html=True)
     with col2:
-        average_wear_time = df['data_wearTime-overall(days)'].mean()
+        average_wear_time = kpis['average_wear_time'] or 0
         st.markdown(
             f'<div class="card"><h1 class="big-font">{average_wear_time:.2f} days</h1><p>Average Wear Time</p></div>',
             unsafe_allow_html=True)
     with col3:
-        good_calibration_count = df[df['data_quality-goodCalibration'] == 1].shape[0]
+        good_calibration_count = kpis['good_calibration_count']
         st.markdown(
             f'<div class="card"><h1 class="big-font">{good_calibration_count}</h1><p>Participants with Good Calibration</p></div>',
             unsafe_allow_html=True)
     with col4:
-        average_nonwear_time = df['data_nonWearTime-overall(days)'].mean()
+        average_nonwear_time = kpis['average_non_wear_time'] or 0
         st.markdown(
             f'<div class="card"><h1 class="big-font">{average_nonwear_time:.2f} days</h1><p>Average Non-Wear Time</p></div>',
             unsafe_allow_html=True)
@@ -116,8 +135,8 @@ if page == "Overview":
     st.markdown('##')
 
     # Altair chart for visualizing wear and non-wear times
-    if 'participant_id' in df.columns and 'data_wearTime-overall(days)' in df.columns and 'data_nonWearTime-overall(days)' in df.columns:
-        melted_df = df.melt(id_vars=['participant_id'],
+    if not wear_df.empty:
+        melted_df = wear_df.melt(id_vars=['participant_id'],
                             value_vars=['data_wearTime-overall(days)', 'data_nonWearTime-overall(days)'],
                             var_name='Type', value_name='Days')
         chart = alt.Chart(melted_df).mark_bar().encode(
@@ -139,6 +158,8 @@ if page == "Overview":
     # Display the file metadata table at the end
     st.markdown('##')
     st.markdown("### File Metadata")
+    page_count = max(1, -(-kpis['total_files'] // PAGE_SIZE))
+    df_display = metadata_table_page(page_count)[columns_for_display].rename(columns=formatted_columns)
     st.dataframe(df_display, height=600)
 
 elif page == "Participant Dashboard":
@@ -146,23 +167,13 @@ elif page == "Participant Dashboard":
     st.title("Participant Dashboard")
 
     # Load participant IDs
-    participant_ids = df['participant_id'].unique()
+    pids = summary_cache().participant_ids()
 
     # Dropdown for selecting participant ID
-    selected_pid = st.selectbox("Select Participant ID", participant_ids)
-
-    # Function to load participant-specific data
-    @st.cache(allow_output_mutation=True)
-    def load_participant_data(pid):
-        data = list(collection_participant.find({'_id': pid}, {'_id': 0, 'data': 1, 'calendar_date': 1}))
-        if data:
-            participant_df = pd.DataFrame(data[0]['data'])
-            participant_df = participant_df.drop_duplicates()
-            return participant_df
-        else:
-            return pd.DataFrame()
-
-    participant_df = load_participant_data(selected_pid)
+    selected_pid = st.selectbox("Select Participant ID", pids)
+
+    # Participant-specific data, incrementally refreshed and evicted when inactive
+    participant_df = participant_cache().get(selected_pid)
 
     if not participant_df.empty:
         st.markdown(f"### Participant ID: {selected_pid}")
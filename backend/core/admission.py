@@ -0,0 +1,115 @@
+import asyncio
+import time
+from collections import deque
+
+from fastapi import Depends, HTTPException, Request
+
+
+class CostClass:
+    """
+    Weighted concurrency limit of one class of routes.
+
+    A request holds `weight` of the class `capacity` while its handler runs. Waiters are
+    served in arrival order, so a heavy request at the head is not overtaken forever by
+    lighter ones. At most `max_queue` requests wait, each for up to `queue_timeout_seconds`;
+    anything beyond that is shed with a 503 instead of piling up on the connection pool.
+    """
+
+    def __init__(self, name, capacity, max_queue, queue_timeout_seconds):
+        self.name = name
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.in_use = 0
+        self.waiters = deque()  # (weight, future)
+        self.stats = {"admitted": 0, "waited": 0, "shed_queue_full": 0, "shed_timeout": 0, "abandoned": 0}
+
+    async def acquire(self, weight, request=None):
+        weight = min(weight, self.capacity)
+        if not self.waiters and self.in_use + weight <= self.capacity:
+            self.in_use += weight
+            self.stats["admitted"] += 1
+            return
+        if len(self.waiters) >= self.max_queue:
+            self.stats["shed_queue_full"] += 1
+            raise HTTPException(status_code=503, detail=f"Too many pending {self.name} requests, retry later",
+                                headers={"Retry-After": str(max(int(self.queue_timeout_seconds), 1))})
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (weight, future)
+        self.waiters.append(entry)
+        self.stats["waited"] += 1
+        deadline = time.monotonic() + self.queue_timeout_seconds
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats["shed_timeout"] += 1
+                    raise HTTPException(status_code=503, detail=f"Timed out waiting for a {self.name} slot, retry later",
+                                        headers={"Retry-After": str(max(int(self.queue_timeout_seconds), 1))})
+                try:
+                    # Wake up periodically to drop requests whose client already left
+                    await asyncio.wait_for(asyncio.shield(future), min(remaining, 1.0))
+                    self.stats["admitted"] += 1
+                    return
+                except asyncio.TimeoutError:
+                    if request is not None and await request.is_disconnected():
+                        self.stats["abandoned"] += 1
+                        raise HTTPException(status_code=499, detail="Client disconnected while queued")
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # Admitted just as we gave up: hand the slot back
+                self.release(weight)
+            else:
+                future.cancel()
+                self.waiters.remove(entry)
+                self._wake()
+            raise
+
+    def release(self, weight):
+        self.in_use -= min(weight, self.capacity)
+        self._wake()
+
+    def _wake(self):
+        while self.waiters:
+            weight, future = self.waiters[0]
+            if self.in_use + weight > self.capacity:
+                break
+            self.waiters.popleft()
+            self.in_use += weight
+            future.set_result(True)
+
+    def status(self):
+        return {"capacity": self.capacity, "in_use": self.in_use, "queued": len(self.waiters),
+                "max_queue": self.max_queue, "queue_timeout_seconds": self.queue_timeout_seconds, **self.stats}
+
+
+class AdmissionController:
+    """Cost classes shared by all routes; each route declares its class and weight with `admit`."""
+
+    def __init__(self, classes):
+        self.classes = {cost_class.name: cost_class for cost_class in classes}
+
+    def admit(self, class_name, weight=1, bypass=None):
+        """
+        Route dependency holding `weight` units of `class_name` for the duration of the request.
+
+        `bypass` is an optional callable taking the request; when it returns True the request
+        skips the queue (e.g. the result is already precomputed and no query will run).
+        """
+        cost_class = self.classes[class_name]
+
+        async def dependency(request: Request):
+            if bypass is not None and bypass(request):
+                yield
+                return
+            await cost_class.acquire(weight, request)
+            try:
+                yield
+            finally:
+                cost_class.release(weight)
+
+        return Depends(dependency)
+
+    def status(self):
+        return {name: cost_class.status() for name, cost_class in self.classes.items()}
@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache for computed API results.
+
+    Keys should carry everything the result depends on (participant, range and the data
+    version of the source rows), so entries never need explicit invalidation; stale
+    versions simply age out of the LRU.
+    """
+
+    def __init__(self, max_entries=256, ttl_seconds=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, stored_at = entry
+            if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and (
+                self.ttl_seconds is None or time.monotonic() - entry[1] <= self.ttl_seconds
+            )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class RecentKeys:
+    """Bounded, thread-safe record of recently used keys (e.g. participants being viewed)."""
+
+    def __init__(self, max_keys=200, window_seconds=3600):
+        self.max_keys = max_keys
+        self.window_seconds = window_seconds
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def touch(self, key):
+        with self._lock:
+            self._keys[key] = time.monotonic()
+            self._keys.move_to_end(key)
+            while len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+
+    def recent(self):
+        cutoff = time.monotonic() - self.window_seconds
+        with self._lock:
+            return [key for key, seen in reversed(self._keys.items()) if seen >= cutoff]
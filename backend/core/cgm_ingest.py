@@ -0,0 +1,181 @@
+import asyncio
+from collections import deque
+
+import pandas as pd
+from sqlalchemy import text
+
+from sql.glucose_series import CGM_TIMESTAMP_FORMAT
+
+
+class QueueFull(Exception):
+    pass
+
+
+CGM_UPSERT = text("""
+    INSERT INTO cgm_data (pid, timepoint, device_timestamp, device, serial_number, record_type, historic_glucose_mg_dl)
+    VALUES (:pid, :timepoint, :device_timestamp, :device, :serial_number, :record_type, :historic_glucose_mg_dl)
+    ON DUPLICATE KEY UPDATE
+        device = VALUES(device),
+        serial_number = VALUES(serial_number),
+        record_type = VALUES(record_type),
+        historic_glucose_mg_dl = VALUES(historic_glucose_mg_dl)
+""")
+
+
+class CGMIngestQueue:
+    """
+    In-memory queue of incoming CGM batches, written with group commit.
+
+    Batches are accumulated until `max_batch_rows` readings are pending or `flush_interval_ms`
+    has passed since the flusher woke up, then written in one transaction with a multi-row
+    upsert into cgm_data and the merge into the packed series, so the two tables never
+    disagree about a batch that was (or was not) acknowledged. A submitter that waits is only
+    acknowledged once the transaction holding its readings has committed. When more than
+    `max_pending_rows` readings are queued or in flight, new batches are rejected with
+    QueueFull so callers can back off.
+
+    `listeners` are called on the event loop with the list of committed batches; their errors
+    are logged and counted, not raised.
+    """
+
+    def __init__(self, engine, series_store=None, max_batch_rows=5000, flush_interval_ms=50, max_pending_rows=200_000):
+        self.engine = engine
+        self.series_store = series_store
+        self.max_batch_rows = max_batch_rows
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_pending_rows = max_pending_rows
+        self.listeners = []
+        self.stats = {"committed_rows": 0, "commits": 0, "rejected_batches": 0, "failed_commits": 0,
+                      "failed_listeners": 0}
+        self._pending = deque()
+        self._pending_rows = 0
+        self._queued_rows = 0  # pending + in flight, bounded by max_pending_rows
+        self._task = None
+        self._closing = False
+        self._wakeup = None
+        self._full = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done() and not self._closing
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._full = asyncio.Event()
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Flush whatever is still queued before shutting down
+        self._closing = True
+        if self._task is not None:
+            self._wakeup.set()
+            self._full.set()
+            await self._task
+            self._task = None
+
+    async def submit(self, batch, wait=True):
+        rows = len(batch.readings)
+        if not self.running:
+            raise RuntimeError("CGM ingest queue is not running")
+        if self._queued_rows + rows > self.max_pending_rows:
+            self.stats["rejected_batches"] += 1
+            raise QueueFull(f"Ingest queue is full ({self._queued_rows} readings pending), retry later")
+
+        future = asyncio.get_running_loop().create_future() if wait else None
+        self._pending.append((batch, future))
+        self._pending_rows += rows
+        self._queued_rows += rows
+        self._wakeup.set()
+        if self._pending_rows >= self.max_batch_rows:
+            self._full.set()
+        if future is not None:
+            await future
+
+    def _take_group(self):
+        group, rows = [], 0
+        while self._pending and (not group or rows + len(self._pending[0][0].readings) <= self.max_batch_rows):
+            batch, future = self._pending.popleft()
+            group.append((batch, future))
+            rows += len(batch.readings)
+        self._pending_rows -= rows
+        if self._pending_rows < self.max_batch_rows:
+            self._full.clear()
+        return group, rows
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                if self._closing:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            # Let the group fill up for one interval unless it is already full
+            if self._pending_rows < self.max_batch_rows and not self._closing:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+            group, rows = self._take_group()
+            batches = [batch for batch, _ in group]
+            try:
+                await asyncio.to_thread(self._write, batches)
+            except Exception as e:
+                self.stats["failed_commits"] += 1
+                for _, future in group:
+                    if future is not None and not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self._queued_rows -= rows
+
+            self.stats["commits"] += 1
+            self.stats["committed_rows"] += rows
+            for _, future in group:
+                if future is not None and not future.done():
+                    future.set_result(True)
+            for listener in self.listeners:
+                # A failing listener must not take the flusher down with it
+                try:
+                    listener(batches)
+                except Exception as e:
+                    self.stats["failed_listeners"] += 1
+                    print(f"CGM ingest listener {getattr(listener, '__name__', listener)} failed: {e}")
+
+    def _write(self, batches):
+        rows = [
+            {
+                "pid": batch.pid,
+                "timepoint": batch.timepoint,
+                "device_timestamp": reading.timestamp.strftime(CGM_TIMESTAMP_FORMAT),
+                "device": batch.device,
+                "serial_number": batch.serial_number,
+                "record_type": reading.record_type,
+                "historic_glucose_mg_dl": reading.glucose,
+            }
+            for batch in batches
+            for reading in batch.readings
+        ]
+        with self.engine.begin() as conn:
+            conn.execute(CGM_UPSERT, rows)
+
+            if self.series_store is not None:
+                # One packed-series merge per participant and timepoint in the group, in the same
+                # transaction as the upsert
+                frame = pd.DataFrame(rows)
+                frame["timestamp"] = pd.to_datetime(frame["device_timestamp"], format=CGM_TIMESTAMP_FORMAT)
+                for (pid, timepoint), readings in frame.groupby(["pid", "timepoint"], sort=False):
+                    devices = readings["device"].dropna()
+                    serials = readings["serial_number"].dropna()
+                    self.series_store.write_readings(
+                        pid,
+                        timepoint,
+                        readings["timestamp"],
+                        readings["historic_glucose_mg_dl"],
+                        device=devices.iloc[-1] if not devices.empty else None,
+                        serial_number=serials.iloc[-1] if not serials.empty else None,
+                        conn=conn
+                    )
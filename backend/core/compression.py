@@ -0,0 +1,190 @@
+import gzip
+import json
+import threading
+
+import anyio
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+from starlette.datastructures import Headers, MutableHeaders
+
+
+def _gzip(data, level):
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _brotli(data, level):
+    import brotli
+
+    return brotli.compress(data, quality=level)
+
+
+def _zstd(data, level):
+    import zstandard
+
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def _available(module):
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+# Content codings in server preference order; brotli and zstd need the optional `brotli` and
+# `zstandard` packages and are only offered when those are installed
+ENCODERS = {"zstd": _zstd, "br": _brotli, "gzip": _gzip}
+OPTIONAL_MODULES = {"zstd": "zstandard", "br": "brotli"}
+DEFAULT_LEVELS = {"zstd": 3, "br": 5, "gzip": 6}
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+UNCOMPRESSIBLE_TYPES = ("text/event-stream",)
+
+# Bodies above this size are compressed off the event loop
+THREAD_THRESHOLD = 64 * 1024
+
+
+def parse_levels(value):
+    """'gzip=6,br=4' -> {'gzip': 6, 'br': 4}"""
+    levels = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = int(level)
+    return levels
+
+
+class ResponseCompression:
+    """
+    Content negotiation and compression settings shared by the middleware and cached bodies.
+
+    Parameters:
+    -----------
+    minimum_size : int
+        Bodies smaller than this many bytes are sent uncompressed
+    levels : dict
+        Compression level per coding, e.g. {"gzip": 6, "br": 5, "zstd": 3}
+    encodings : list
+        Codings to offer, in preference order; defaults to every installed one
+    """
+
+    def __init__(self, minimum_size=1024, levels=None, encodings=None):
+        self.minimum_size = minimum_size
+        self.levels = {**DEFAULT_LEVELS, **(levels or {})}
+        self.encodings = [
+            name for name in (encodings or ENCODERS)
+            if name in ENCODERS and (name not in OPTIONAL_MODULES or _available(OPTIONAL_MODULES[name]))
+        ]
+
+    def negotiate(self, accept_encoding):
+        """The preferred coding the client accepts (highest q, then server preference), or None."""
+        if not accept_encoding:
+            return None
+        accepted = {}
+        for part in accept_encoding.split(","):
+            name, _, params = part.partition(";")
+            q = 1.0
+            for param in params.split(";"):
+                key, _, value = param.strip().partition("=")
+                if key == "q":
+                    try:
+                        q = float(value)
+                    except ValueError:
+                        q = 0.0
+            accepted[name.strip().lower()] = q
+        best, best_q = None, 0.0
+        for name in self.encodings:
+            q = accepted.get(name, accepted.get("*", 0.0))
+            if q > best_q:
+                best, best_q = name, q
+        return best
+
+    def compress(self, data, encoding):
+        return ENCODERS[encoding](data, self.levels[encoding])
+
+    def response(self, request, body):
+        """Response for a cached EncodedBody, compressed once per coding and reused by later hits."""
+        encoding = self.negotiate(request.headers.get("accept-encoding"))
+        if encoding is None or len(body.json) < self.minimum_size:
+            return Response(body.json, media_type="application/json", headers={"Vary": "Accept-Encoding"})
+        return Response(body.encoded(encoding, self), media_type="application/json",
+                        headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"})
+
+
+class EncodedBody:
+    """A cached result with its JSON bytes and, once requested, its compressed variants."""
+
+    __slots__ = ("value", "json", "_encoded", "_lock")
+
+    def __init__(self, value):
+        self.value = value
+        self.json = json.dumps(jsonable_encoder(value), separators=(",", ":")).encode("utf-8")
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding, compression):
+        data = self._encoded.get(encoding)
+        if data is None:
+            with self._lock:
+                data = self._encoded.get(encoding)
+                if data is None:
+                    data = self._encoded[encoding] = compression.compress(self.json, encoding)
+        return data
+
+
+def _compressible(headers):
+    content_type = headers.get("content-type", "")
+    return content_type.startswith(COMPRESSIBLE_TYPES) and not content_type.startswith(UNCOMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing complete responses with the negotiated coding.
+
+    Streamed responses (exports, Server-Sent Events) and responses that already carry a
+    Content-Encoding, such as precompressed cache hits, pass through untouched.
+    """
+
+    def __init__(self, app, compression):
+        self.app = app
+        self.compression = compression
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = self.compression.negotiate(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+
+        async def compressing_send(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+            held, start = start, None
+            headers = MutableHeaders(raw=held["headers"])
+            body = message.get("body", b"")
+            if (message.get("more_body") or "content-encoding" in headers or not _compressible(headers)
+                    or len(body) < self.compression.minimum_size):
+                await send(held)
+                await send(message)
+                return
+            if len(body) > THREAD_THRESHOLD:
+                body = await anyio.to_thread.run_sync(self.compression.compress, body, encoding)
+            else:
+                body = self.compression.compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(held)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, compressing_send)
@@ -0,0 +1,143 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from analytics.rolling import LiveGlucoseState
+from sql.glucose_series import series_timestamps
+
+EPOCH = datetime(1970, 1, 1)
+
+# Days of packed history used to seed the rolling state of a newly watched participant
+SEED_DAYS = 14
+
+
+def to_seconds(timestamp):
+    return (timestamp.replace(tzinfo=None) - EPOCH).total_seconds()
+
+
+def from_seconds(seconds):
+    return (EPOCH + timedelta(seconds=seconds)).isoformat()
+
+
+def format_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+
+class Subscription:
+    def __init__(self, pids, max_events=100):
+        self.pids = set(pids)
+        self.queue = asyncio.Queue(maxsize=max_events)
+
+    def put(self, message):
+        # A slow client loses its oldest events rather than holding memory for everyone
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+
+class GlucoseStreamHub:
+    """
+    Fan-out of committed CGM readings to Server-Sent Events subscribers.
+
+    Registered as a listener of the ingest queue. Rolling state is only kept for watched
+    participants: it is seeded once from the packed series when the first subscriber
+    arrives, updated incrementally on every commit, and dropped when the last one leaves.
+    Idle subscribers cost one small queue each.
+    """
+
+    def __init__(self, series_store):
+        self.series_store = series_store
+        self.subscribers = {}  # pid -> set of Subscription
+        self.states = {}  # pid -> LiveGlucoseState
+        self._seeding = {}  # pid -> committed batches buffered while the seed read runs
+
+    async def subscribe(self, pids, max_events=100):
+        subscription = Subscription(pids, max_events)
+        for pid in subscription.pids:
+            self.subscribers.setdefault(pid, set()).add(subscription)
+        to_seed = [pid for pid in subscription.pids if pid not in self.states and pid not in self._seeding]
+        for pid in to_seed:
+            self._seeding[pid] = []
+        await asyncio.gather(*(self._seed(pid) for pid in to_seed))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        for pid in subscription.pids:
+            watchers = self.subscribers.get(pid)
+            if watchers is None:
+                continue
+            watchers.discard(subscription)
+            if not watchers:
+                del self.subscribers[pid]
+                self.states.pop(pid, None)
+
+    async def _seed(self, pid):
+        try:
+            state = await asyncio.to_thread(self._load_state, pid)
+        except Exception:
+            state = LiveGlucoseState()
+        buffered = self._seeding.pop(pid)
+        if pid not in self.subscribers:
+            return
+        self.states[pid] = state
+        for batch in buffered:
+            self._apply(pid, batch)
+
+    def _load_state(self, pid):
+        state = LiveGlucoseState()
+        _, last = self.series_store.date_bounds(pid)
+        if last is None:
+            return state
+        timestamps, glucose = series_timestamps(self.series_store.load(pid, last - timedelta(days=SEED_DAYS)))
+        seconds = timestamps.astype('datetime64[s]').astype(np.int64).tolist()
+        for timestamp, value in zip(seconds, glucose.tolist()):
+            state.push(float(timestamp), float(value))
+        return state
+
+    def snapshot(self, pid):
+        state = self.states.get(pid)
+        if state is None:
+            return None
+        metrics = state.snapshot()
+        if metrics["episode"].get("started_at") is not None:
+            metrics["episode"]["started_at"] = from_seconds(metrics["episode"]["started_at"])
+        return {"pid": pid, "last_reading_at": from_seconds(state.last_timestamp) if state.last_timestamp else None,
+                **metrics}
+
+    def on_commit(self, batches):
+        for batch in batches:
+            if batch.pid in self._seeding:
+                self._seeding[batch.pid].append(batch)
+            elif batch.pid in self.states:
+                self._apply(batch.pid, batch)
+
+    def _apply(self, pid, batch):
+        state = self.states[pid]
+        readings = []
+        for reading in sorted(batch.readings, key=lambda r: r.timestamp):
+            if state.push(to_seconds(reading.timestamp), reading.glucose):
+                readings.append({"timestamp": reading.timestamp.replace(tzinfo=None).isoformat(), "glucose": reading.glucose})
+        if not readings:
+            return
+        message = format_event("readings", {"readings": readings, **self.snapshot(pid)})
+        for subscription in self.subscribers.get(pid, ()):
+            subscription.put(message)
+
+    async def events(self, request, subscription, keepalive_seconds=15):
+        """SSE body: a snapshot per participant, then pushed readings with keep-alive comments."""
+        try:
+            for pid in sorted(subscription.pids):
+                snapshot = self.snapshot(pid)
+                if snapshot is not None:
+                    yield format_event("snapshot", snapshot)
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscription.queue.get(), keepalive_seconds)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+        finally:
+            self.unsubscribe(subscription)
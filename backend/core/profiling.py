@@ -0,0 +1,336 @@
+import asyncio
+import functools
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from urllib.parse import parse_qs
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+
+
+class RequestTimings:
+    """Phase timestamps and DB time of one request, shared with the threadpool through a context variable."""
+
+    __slots__ = ("route", "started", "route_started", "endpoint_started", "endpoint_finished", "route_finished",
+                 "db_seconds", "db_statements", "threads")
+
+    def __init__(self):
+        self.route = None
+        self.started = time.perf_counter()
+        self.route_started = self.endpoint_started = self.endpoint_finished = self.route_finished = None
+        self.db_seconds = 0.0
+        self.db_statements = 0
+        self.threads = {threading.get_ident()}
+
+    def phases(self, finished):
+        """Split the request into queue (dependencies, admission), db, compute, serialize and send seconds."""
+        if self.endpoint_started is None or self.endpoint_finished is None:
+            return {"total": finished - self.started}
+        handler = self.endpoint_finished - self.endpoint_started
+        return {
+            "total": finished - self.started,
+            "queue": self.endpoint_started - (self.route_started or self.started),
+            "db": self.db_seconds,
+            "compute": max(handler - self.db_seconds, 0.0),
+            "serialize": (self.route_finished or finished) - self.endpoint_finished,
+            "send": finished - (self.route_finished or finished),
+        }
+
+
+current_timings = ContextVar("current_timings", default=None)
+
+
+def instrument_engine(engine):
+    """
+    Accumulate statement time of `engine` into the current request's timings, including
+    statements that fail or are cancelled (`handle_error`).
+    """
+
+    def finished(conn):
+        started = conn.info["query_started"].pop()
+        timings = current_timings.get()
+        if timings is not None:
+            timings.db_seconds += time.perf_counter() - started
+            timings.db_statements += 1
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        finished(conn)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        # Also raised for failures outside a statement (connecting), which pushed nothing
+        conn = context.connection
+        if conn is not None and conn.info.get("query_started"):
+            finished(conn)
+
+
+class TimedRoute(APIRoute):
+    """APIRoute recording when the endpoint itself starts and finishes, to separate it from serialization."""
+
+    def __init__(self, path, endpoint, **kwargs):
+        if asyncio.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def timed_endpoint(*args, **kw):
+                timings = _endpoint_started()
+                try:
+                    return await endpoint(*args, **kw)
+                finally:
+                    if timings is not None:
+                        timings.endpoint_finished = time.perf_counter()
+        else:
+            @functools.wraps(endpoint)
+            def timed_endpoint(*args, **kw):
+                timings = _endpoint_started()
+                try:
+                    return endpoint(*args, **kw)
+                finally:
+                    if timings is not None:
+                        timings.endpoint_finished = time.perf_counter()
+        super().__init__(path, timed_endpoint, **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        path = self.path
+
+        async def timed_handler(request):
+            timings = current_timings.get()
+            if timings is None:
+                return await handler(request)
+            timings.route = path
+            timings.route_started = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                timings.route_finished = time.perf_counter()
+
+        return timed_handler
+
+
+def _endpoint_started():
+    timings = current_timings.get()
+    if timings is not None:
+        timings.threads.add(threading.get_ident())
+        timings.endpoint_started = time.perf_counter()
+    return timings
+
+
+class RouteMetrics:
+    """Per-route latency totals by phase, plus a window of recent totals for percentiles."""
+
+    def __init__(self, window=512):
+        self.window = window
+        self.routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, phases, status, statements):
+        with self._lock:
+            route = self.routes.get(key)
+            if route is None:
+                route = self.routes[key] = {"count": 0, "errors": 0, "statements": 0, "seconds": {},
+                                            "recent": deque(maxlen=self.window)}
+            route["count"] += 1
+            route["errors"] += status >= 500
+            route["statements"] += statements
+            for phase, seconds in phases.items():
+                route["seconds"][phase] = route["seconds"].get(phase, 0.0) + seconds
+            route["recent"].append(phases["total"])
+
+    def summary(self):
+        with self._lock:
+            routes = {key: (route["count"], route["errors"], route["statements"], dict(route["seconds"]),
+                            sorted(route["recent"])) for key, route in self.routes.items()}
+        summary = []
+        for key, (count, errors, statements, seconds, recent) in sorted(routes.items()):
+            summary.append({
+                "route": key,
+                "count": count,
+                "errors": errors,
+                "statements_per_request": round(statements / count, 2),
+                "mean_ms": {phase: round(total / count * 1000, 3) for phase, total in seconds.items()},
+                "p50_ms": round(recent[len(recent) // 2] * 1000, 3),
+                "p95_ms": round(recent[min(int(len(recent) * 0.95), len(recent) - 1)] * 1000, 3),
+            })
+        return summary
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler over a set of threads (the event loop and the request's worker).
+
+    Stacks are read from `sys._current_frames()` every `interval_seconds` by a daemon thread,
+    so nothing is traced and the profiled code runs at full speed between samples.
+    """
+
+    def __init__(self, threads, interval_seconds=0.005):
+        self.threads = threads
+        self.interval_seconds = interval_seconds
+        self.samples = []  # (thread id, stack tuple of (function, file, first line), root first)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self.started = self.finished = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.finished = time.perf_counter()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval_seconds):
+            frames = sys._current_frames()
+            for thread_id in list(self.threads):
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_qualname if hasattr(code, "co_qualname") else code.co_name,
+                                  code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                stack.reverse()
+                self.samples.append((thread_id, tuple(stack)))
+
+    def speedscope(self, name):
+        """Profile in speedscope's sampled file format, one profile per thread."""
+        frames, index = [], {}
+        profiles = {}
+        for thread_id, stack in self.samples:
+            ids = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                ids.append(index[frame])
+            profile = profiles.setdefault(thread_id, {"samples": [], "weights": []})
+            profile["samples"].append(ids)
+            profile["weights"].append(self.interval_seconds)
+        duration = (self.finished or time.perf_counter()) - self.started
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "shared": {"frames": frames},
+            "profiles": [
+                {"type": "sampled", "name": f"{name} (thread {thread_id})", "unit": "seconds",
+                 "startValue": 0, "endValue": duration, **profile}
+                for thread_id, profile in profiles.items()
+            ],
+        }
+
+    def collapsed(self):
+        """Folded stacks ("a;b;c count") for flamegraph.pl / inferno."""
+        counts = {}
+        for _, stack in self.samples:
+            key = ";".join(f"{name} ({os.path.basename(file)}:{line})" for name, file, line in stack)
+            counts[key] = counts.get(key, 0) + 1
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items()))
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware recording the per-route phase breakdown of every request.
+
+    A request with `?profile=1` and an `X-Profile-Token` header matching `token` is run under
+    the sampling profiler and answered with the profile instead of its body (speedscope
+    JSON, or folded stacks with `&profile_format=collapsed`); with `output_dir` set the
+    profile is also saved there. Without a token configured profiling is disabled. When
+    not profiling the cost is a few `perf_counter` calls per request.
+    """
+
+    def __init__(self, app, metrics, token=None, output_dir=None, interval_ms=5):
+        self.app = app
+        self.metrics = metrics
+        self.token = token
+        self.output_dir = output_dir
+        self.interval_seconds = interval_ms / 1000
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        current_timings.set(timings)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            if self.token and self._requested(scope) and self._authorized(scope):
+                status = await self._profile(scope, receive, send, timings)
+            else:
+                await self.app(scope, receive, send_with_status)
+        finally:
+            key = f"{scope['method']} {timings.route or 'unmatched'}"
+            self.metrics.record(key, timings.phases(time.perf_counter()), status, timings.db_statements)
+
+    @staticmethod
+    def _requested(scope):
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        return query.get("profile", [""])[0] == "1"
+
+    def _authorized(self, scope):
+        for name, value in scope["headers"]:
+            if name == b"x-profile-token":
+                # Compared as bytes: a str comparison raises TypeError for non-ASCII header values
+                return hmac.compare_digest(value, self.token.encode())
+        return False
+
+    async def _profile(self, scope, receive, send, timings):
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        collapsed = query.get("profile_format", [""])[0] == "collapsed"
+        status = 500
+
+        async def capture(message):
+            # The original response is dropped; only its status is reported
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        profiler = SamplingProfiler(timings.threads, self.interval_seconds)
+        profiler.start()
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            profiler.stop()
+
+        name = f"{scope['method']} {timings.route or scope['path']}"
+        if collapsed:
+            body, content_type, extension = profiler.collapsed().encode(), b"text/plain; charset=utf-8", "folded"
+        else:
+            body, content_type, extension = json.dumps(profiler.speedscope(name)).encode(), b"application/json", "speedscope.json"
+        headers = [(b"content-type", content_type), (b"content-length", str(len(body)).encode()),
+                   (b"x-profiled-status", str(status).encode()), (b"x-profile-samples", str(len(profiler.samples)).encode())]
+        if self.output_dir:
+            file_name = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}.{extension}"
+            await asyncio.to_thread(_write_profile, os.path.join(self.output_dir, file_name), body)
+            headers.append((b"x-profile-file", file_name.encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+        return status
+
+
+def _write_profile(path, body):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(body)
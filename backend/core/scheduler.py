@@ -0,0 +1,133 @@
+import asyncio
+import time
+from datetime import datetime
+
+
+class Job:
+    def __init__(self, name, func, interval_seconds=None, on_ingest=False):
+        self.name = name
+        self.func = func
+        self.interval_seconds = interval_seconds
+        self.on_ingest = on_ingest
+        self.running = False
+        self.next_run = None
+        self.runs = 0
+        self.failures = 0
+        self.last_started = None
+        self.last_success = None
+        self.last_duration_seconds = None
+        self.last_error = None
+
+    def status(self):
+        return {
+            "name": self.name,
+            "interval_seconds": self.interval_seconds,
+            "on_ingest": self.on_ingest,
+            "running": self.running,
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_started": self.last_started,
+            "last_success": self.last_success,
+            "last_duration_seconds": self.last_duration_seconds,
+            "last_error": self.last_error,
+        }
+
+
+class JobScheduler:
+    """
+    In-process scheduler for precompute and cache-warming jobs.
+
+    Jobs are plain (blocking) functions run in worker threads. They run every
+    `interval_seconds`, after an ingest (debounced by `ingest_debounce_seconds` so a burst
+    of commits triggers one recompute), or on demand. At most `max_concurrency` jobs run
+    at once and a job never overlaps with itself, so background work cannot take more
+    than a few connections away from live traffic.
+    """
+
+    def __init__(self, max_concurrency=2, ingest_debounce_seconds=30, tick_seconds=1):
+        self.jobs = {}
+        self.max_concurrency = max_concurrency
+        self.ingest_debounce_seconds = ingest_debounce_seconds
+        self.tick_seconds = tick_seconds
+        self._ingest_due = None
+        self._task = None
+        self._semaphore = None
+        self._running = set()
+
+    def register(self, name, func, interval_seconds=None, on_ingest=False, run_at_start=True):
+        job = Job(name, func, interval_seconds, on_ingest)
+        job.next_run = time.monotonic() if run_at_start else (
+            time.monotonic() + interval_seconds if interval_seconds else None
+        )
+        self.jobs[name] = job
+        return job
+
+    def notify_ingest(self, *args):
+        # Called after every commit, the first call of a burst arms the debounce timer
+        if self._ingest_due is None:
+            self._ingest_due = time.monotonic() + self.ingest_debounce_seconds
+
+    def trigger(self, name):
+        if name not in self.jobs:
+            raise KeyError(name)
+        self.jobs[name].next_run = time.monotonic()
+
+    async def start(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._running):
+            task.cancel()
+
+    async def _loop(self):
+        while True:
+            now = time.monotonic()
+            if self._ingest_due is not None and now >= self._ingest_due:
+                self._ingest_due = None
+                for job in self.jobs.values():
+                    if job.on_ingest:
+                        job.next_run = now
+            for job in self.jobs.values():
+                if job.next_run is not None and now >= job.next_run and not job.running:
+                    job.running = True
+                    job.next_run = None
+                    task = asyncio.create_task(self._run(job))
+                    self._running.add(task)
+                    task.add_done_callback(self._running.discard)
+            await asyncio.sleep(self.tick_seconds)
+
+    async def _run(self, job):
+        try:
+            async with self._semaphore:
+                job.last_started = datetime.now()
+                started = time.perf_counter()
+                try:
+                    await asyncio.to_thread(job.func)
+                except Exception as e:
+                    job.failures += 1
+                    job.last_error = str(e)
+                else:
+                    job.last_success = datetime.now()
+                    job.last_error = None
+                finally:
+                    job.runs += 1
+                    job.last_duration_seconds = round(time.perf_counter() - started, 3)
+        finally:
+            job.running = False
+            if job.interval_seconds and job.next_run is None:
+                job.next_run = time.monotonic() + job.interval_seconds
+
+    def status(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "ingest_pending": self._ingest_due is not None,
+            "jobs": [job.status() for job in self.jobs.values()],
+        }
@@ -0,0 +1,298 @@
+import asyncio
+import inspect
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy.engine import make_url
+from starlette.responses import JSONResponse
+
+# `/studies/{key}/...` selects a study by path; the rest of the path is routed as usual
+STUDY_PATH = re.compile(r"^/studies/([A-Za-z0-9_-]+)(/.*)?$")
+STUDY_HEADER = b"x-study"
+
+
+class UnknownStudy(KeyError):
+    pass
+
+
+def parse_studies(value):
+    """'workwell=mysql+mysqlconnector://...,glyco=mysql+mysqlconnector://...' -> {'workwell': url, 'glyco': url}"""
+    studies = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            key, url = item.split("=", 1)
+            studies[key.strip()] = url.strip()
+    return studies
+
+
+class Study:
+    """One study's database and the state built on it (stores, caches, ingest, metrics)."""
+
+    def __init__(self, key, **resources):
+        self.key = key
+        self.__dict__.update(resources)
+        self.prepared = False
+        self.leases = 0
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+
+current_study = ContextVar("current_study", default=None)
+
+
+class StudyRegistry:
+    """
+    Studies served by this process, opened on first use and closed again once idle.
+
+    Parameters:
+    -----------
+    databases : dict
+        Study key -> database URL (None for MySQLDatabase's default)
+    open_study : callable
+        (key, url) -> Study; builds the engine and everything keyed to it, without touching the database
+    prepare_study : callable
+        Study -> None; one-time setup (tables, migrations), run in a worker thread before the first request;
+        if it raises, the study stays unprepared and is set up again on its next request
+    close_study : callable
+        Study -> None or awaitable; stops background work and disposes the pools
+    default : str
+        Study of requests that do not name one; it is never evicted
+    idle_seconds : int
+        Studies without requests for this long are closed by the sweep
+    """
+
+    def __init__(self, databases, open_study, prepare_study=None, close_study=None, default="default",
+                 idle_seconds=900, sweep_seconds=60):
+        self.databases = dict(databases)
+        self.databases.setdefault(default, None)
+        self.open_study = open_study
+        self.prepare_study = prepare_study
+        self.close_study = close_study
+        self.default = default
+        self.idle_seconds = idle_seconds
+        self.sweep_seconds = sweep_seconds
+        self.stats = {"opened": 0, "evicted": 0}
+        self._studies = {}
+        self._lock = threading.Lock()
+        self._task = None
+
+    def _open(self, key):
+        # Called with the lock held
+        study = self._studies.get(key)
+        if study is None:
+            if key not in self.databases:
+                raise UnknownStudy(key)
+            study = self._studies[key] = self.open_study(key, self.databases[key])
+            self.stats["opened"] += 1
+        return study
+
+    def get(self, key):
+        with self._lock:
+            return self._open(key)
+
+    def acquire(self, key, touch=True, reopen=True):
+        """The study for `key` with one more lease (None when it is closed and `reopen` is False)."""
+        with self._lock:
+            if not reopen and key not in self._studies:
+                return None
+            study = self._open(key)
+            study.leases += 1
+            if touch:
+                study.last_used = time.monotonic()
+            return study
+
+    def release(self, study, touch=True):
+        with self._lock:
+            study.leases -= 1
+            if touch:
+                study.last_used = time.monotonic()
+
+    def prepare(self, study):
+        with study.lock:
+            if not study.prepared:
+                if self.prepare_study is not None:
+                    self.prepare_study(study)
+                study.prepared = True
+        return study
+
+    @contextmanager
+    def use(self, key, touch=True, reopen=True):
+        """Make `key` the current study; a study in use is not evicted."""
+        study = self.acquire(key, touch=touch, reopen=reopen)
+        if study is None:
+            yield None
+            return
+        token = current_study.set(study)
+        try:
+            yield study
+        finally:
+            current_study.reset(token)
+            self.release(study, touch=touch)
+
+    def current(self):
+        """The study of the current request, or the default one outside requests."""
+        study = current_study.get()
+        return study if study is not None else self.get(self.default)
+
+    def local(self, name):
+        return StudyLocal(self, name)
+
+    def for_each(self, func):
+        """Run `func` once per open study with that study current (for background jobs)."""
+        errors = []
+        with self._lock:
+            keys = list(self._studies)
+        for key in keys:
+            # Background work does not count as use, so it does not keep an idle study open
+            with self.use(key, touch=False, reopen=False) as study:
+                if study is None:
+                    continue
+                try:
+                    func()
+                except Exception as e:
+                    errors.append(e)
+        if errors:
+            raise errors[0]
+
+    def idle(self):
+        now = time.monotonic()
+        with self._lock:
+            idle = [
+                study for key, study in self._studies.items()
+                if key != self.default and study.leases == 0 and now - study.last_used > self.idle_seconds
+            ]
+            for study in idle:
+                del self._studies[study.key]
+            self.stats["evicted"] += len(idle)
+        return idle
+
+    async def _close(self, study):
+        if self.close_study is not None:
+            result = self.close_study(study)
+            if inspect.isawaitable(result):
+                await result
+
+    async def start(self):
+        self._task = asyncio.create_task(self._sweep())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        with self._lock:
+            studies = list(self._studies.values())
+            self._studies.clear()
+        for study in studies:
+            await self._close(study)
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self.sweep_seconds)
+            for study in self.idle():
+                try:
+                    await self._close(study)
+                except Exception as e:
+                    print(f"Closing study {study.key} failed: {e}")
+
+    def status(self):
+        now = time.monotonic()
+        with self._lock:
+            studies = dict(self._studies)
+        return {
+            "default": self.default,
+            "idle_seconds": self.idle_seconds,
+            **self.stats,
+            "studies": [
+                {
+                    "study": key,
+                    "database": make_url(url).render_as_string(hide_password=True) if url else None,
+                    "open": key in studies,
+                    "prepared": key in studies and studies[key].prepared,
+                    "requests_in_flight": studies[key].leases if key in studies else 0,
+                    "idle_seconds": round(now - studies[key].last_used, 1) if key in studies else None,
+                }
+                for key, url in sorted(self.databases.items())
+            ],
+        }
+
+
+class StudyLocal:
+    """
+    Stand-in for one attribute of the current study.
+
+    Module-level code keeps using `database`, `series_store`, `precomputed`, ... and reaches
+    the instance of the study the request was routed to.
+    """
+
+    __slots__ = ("_registry", "_name")
+
+    def __init__(self, registry, name):
+        self._registry = registry
+        self._name = name
+
+    def _resolve(self):
+        return getattr(self._registry.current(), self._name)
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+    def __contains__(self, key):
+        return key in self._resolve()
+
+    def __repr__(self):
+        return f"<StudyLocal {self._name}>"
+
+
+class StudyMiddleware:
+    """
+    ASGI middleware routing each request to a study, by `/studies/{key}/...` prefix or `X-Study` header.
+
+    The prefix is stripped (and moved to `root_path`) so the routes are declared once. The
+    study stays current for the whole request, streamed bodies included, and is set up on
+    its first request; when that setup fails (database unreachable) the request gets a 503
+    and the next one retries it. Requests naming neither go to the registry's default study.
+    """
+
+    def __init__(self, app, registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        key = None
+        match = STUDY_PATH.match(scope["path"])
+        if match:
+            key, rest = match.group(1), match.group(2) or "/"
+            prefix = f"/studies/{key}"
+            scope = {**scope, "path": rest, "raw_path": rest.encode(), "root_path": scope.get("root_path", "") + prefix}
+        header = next((value.decode("latin-1") for name, value in scope["headers"] if name == STUDY_HEADER), None)
+        if header is not None and key is not None and header != key:
+            await JSONResponse({"detail": f"Study '{header}' in X-Study does not match '{key}' in the path"},
+                               status_code=400)(scope, receive, send)
+            return
+        key = key or header or self.registry.default
+        if key not in self.registry.databases:
+            await JSONResponse({"detail": f"Unknown study '{key}'"}, status_code=404)(scope, receive, send)
+            return
+
+        with self.registry.use(key) as study:
+            if not study.prepared:
+                try:
+                    await asyncio.to_thread(self.registry.prepare, study)
+                except Exception as e:
+                    # Left unprepared, so the study's next request tries again
+                    print(f"Setting up study {key} failed: {e}")
+                    await JSONResponse({"detail": f"Study '{key}' is not available yet, retry later"}, status_code=503,
+                                       headers={"Retry-After": "5"})(scope, receive, send)
+                    return
+            await self.app(scope, receive, send)
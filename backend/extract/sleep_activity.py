@@ -0,0 +1,196 @@
+import argparse
+import contextlib
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+# Date formats of the Fitbit-style export
+SLEEP_DATE_FORMAT = '%m/%d/%y %H:%M'
+ACTIVITY_DATE_FORMAT = '%m/%d/%y'
+
+SLEEP_COLUMNS = [
+    'participant_id', 'sleep_date', 'is_main_sleep', 'minutes_to_fall_asleep',
+    'minutes_awake', 'minutes_asleep', 'minutes_after_wakeup', 'time_in_bed',
+    'efficiency', 'deep_minutes', 'light_minutes', 'rem_minutes', 'wake_minutes',
+    'deep_count', 'light_count', 'rem_count', 'wake_count',
+    'sol_from_stages', 'waso_dur_from_stages', 'waso_cnt_from_stages', 'snooze_from_stages'
+]
+
+ACTIVITY_COLUMNS = [
+    'participant_id', 'activity_date', 'steps', 'sedentary_mins',
+    'lightly_active_mins', 'fairly_active_mins', 'very_active_mins',
+    'total_dist', 'sedentary_dist', 'lightly_active_dist',
+    'moderately_active_dist', 'very_active_dist'
+]
+
+# Raw export columns needed to build the two frames above
+INPUT_COLUMNS = (
+    ['participant_id', 'api_date_sleep', 'readable_date']
+    + [col for col in SLEEP_COLUMNS + ACTIVITY_COLUMNS
+       if col not in ('participant_id', 'sleep_date', 'activity_date')]
+)
+
+
+def align_sleep_activity(df):
+    """
+    Align last night's sleep with today's activity for an in-memory frame.
+
+    Sleep records are shifted forward by one day (vectorized on datetime64) and inner-joined
+    with the activity of the same participant on that next day.
+    """
+    sleep_date = pd.to_datetime(df['api_date_sleep'], format=SLEEP_DATE_FORMAT).dt.normalize()
+    activity_date = pd.to_datetime(df['readable_date'], format=ACTIVITY_DATE_FORMAT)
+
+    sleep_data = df.assign(sleep_date=sleep_date)[SLEEP_COLUMNS]
+    activity_data = df.assign(activity_date=activity_date)[ACTIVITY_COLUMNS]
+
+    # Shift sleep forward by one day to match "last night's sleep" with "today's activity"
+    sleep_data = sleep_data.assign(next_day=sleep_data['sleep_date'] + pd.Timedelta(days=1))
+
+    shifted_df = pd.merge(
+        sleep_data,
+        activity_data,
+        left_on=['participant_id', 'next_day'],
+        right_on=['participant_id', 'activity_date'],
+        how='inner'  # Only keep rows where we have both sleep and next day's activity
+    )
+
+    shifted_df = shifted_df.drop(['next_day'], axis=1)
+    shifted_df = shifted_df.rename(columns={
+        'sleep_date': 'night_of_sleep',
+        'activity_date': 'day_of_activity'
+    })
+    shifted_df['night_of_sleep'] = shifted_df['night_of_sleep'].dt.date
+    shifted_df['day_of_activity'] = shifted_df['day_of_activity'].dt.date
+
+    shifted_df['active_minutes_total'] = (
+            shifted_df['lightly_active_mins'] +
+            shifted_df['fairly_active_mins'] +
+            shifted_df['very_active_mins']
+    )
+
+    return shifted_df.sort_values(['participant_id', 'night_of_sleep'])
+
+
+def partition_by_participant(input_filepath, work_dir, n_partitions, chunksize):
+    """
+    Stream the export in chunks and spill rows into hash partitions by participant_id,
+    so every participant's rows end up in exactly one partition file.
+    """
+    paths = {}
+    total_rows = 0
+    reader = pd.read_csv(input_filepath, usecols=INPUT_COLUMNS, chunksize=chunksize, dtype={'participant_id': str})
+    for chunk in reader:
+        total_rows += len(chunk)
+        buckets = pd.util.hash_pandas_object(chunk['participant_id'], index=False).to_numpy() % n_partitions
+        for bucket, part in chunk.groupby(buckets):
+            path = os.path.join(work_dir, f'part-{bucket:05d}.csv')
+            part.to_csv(path, mode='a', header=bucket not in paths, index=False)
+            paths[bucket] = path
+    return sorted(paths.values()), total_rows
+
+
+def _align_partition(partition_path, output_format):
+    df = pd.read_csv(partition_path, dtype={'participant_id': str})
+    shifted_df = align_sleep_activity(df)
+    output_path = os.path.splitext(partition_path)[0] + ('.aligned.parquet' if output_format == 'parquet' else '.aligned.csv')
+    if output_format == 'parquet':
+        shifted_df.to_parquet(output_path, index=False)
+    else:
+        shifted_df.to_csv(output_path, index=False)
+    os.remove(partition_path)
+    return output_path, len(shifted_df)
+
+
+def generate_shifted_output(input_filepath, output_filepath, output_format=None, n_partitions=64,
+                            chunksize=500_000, workers=None, work_dir=None):
+    """
+    Out-of-core version of the sleep/activity alignment.
+
+    Parameters:
+    -----------
+    input_filepath : str
+        Path to the original CSV export containing sleep and activity data
+    output_filepath : str
+        Output CSV file, or Parquet file when output_format is 'parquet' (or the path ends in .parquet)
+    n_partitions : int
+        Number of participant hash partitions; raise it when a partition does not fit in memory
+    chunksize : int
+        Rows per input chunk while partitioning
+    workers : int
+        Processes aligning partitions in parallel, defaults to the number of cores
+
+    Memory stays bounded by one input chunk in the partition pass, and by one partition per
+    worker in the align pass. Finished partitions are appended to the output as they
+    complete, so rows are grouped and date-sorted per participant but participants are not
+    globally ordered.
+    """
+    if output_format is None:
+        output_format = 'parquet' if output_filepath.endswith('.parquet') else 'csv'
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+        print(f"Partitioning {input_filepath} into {n_partitions} participant partitions...")
+        partitions, input_rows = partition_by_participant(input_filepath, tmp_dir, n_partitions, chunksize)
+
+        print(f"Aligning {len(partitions)} partitions...")
+        output_rows = 0
+        writer = None
+        with open(output_filepath, 'wb') if output_format == 'csv' else contextlib.nullcontext() as csv_out, \
+                ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_align_partition, path, output_format) for path in partitions]
+            for future in as_completed(futures):
+                aligned_path, rows = future.result()
+                output_rows += rows
+                if output_format == 'parquet':
+                    writer = _append_parquet(writer, aligned_path, output_filepath)
+                else:
+                    _append_csv(csv_out, aligned_path, header=csv_out.tell() == 0)
+                os.remove(aligned_path)
+        if writer is not None:
+            writer.close()
+
+    print(f"Original dataset rows: {input_rows}")
+    print(f"Shifted dataset rows: {output_rows}")
+    print(f"Successfully created shifted {output_format} file at {output_filepath}")
+    return output_rows
+
+
+def _append_csv(out, path, header):
+    with open(path, 'rb') as part:
+        first_line = part.readline()
+        if header:
+            out.write(first_line)
+        shutil.copyfileobj(part, out)
+
+
+def _append_parquet(writer, path, output_filepath):
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(path)
+    if writer is None:
+        writer = pq.ParquetWriter(output_filepath, table.schema)
+    # Each finished partition becomes one row group of the output file
+    writer.write_table(table.cast(writer.schema))
+    return writer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Align last night's sleep with today's activity, out of core.")
+    parser.add_argument('input', help='Fitbit-style CSV export')
+    parser.add_argument('output', help='Output .csv or .parquet file')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default=None)
+    parser.add_argument('--partitions', type=int, default=64)
+    parser.add_argument('--chunksize', type=int, default=500_000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--work-dir', default=None, help='Directory for temporary partition files')
+    args = parser.parse_args()
+
+    generate_shifted_output(args.input, args.output, output_format=args.format, n_partitions=args.partitions,
+                            chunksize=args.chunksize, workers=args.workers, work_dir=args.work_dir)
+
+
+if __name__ == "__main__":
+    main()
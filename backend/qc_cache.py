@@ -0,0 +1,158 @@
+# Incremental (high-water mark) caches for the Streamlit participant dashboard
+
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from qc_data import CALIBRATION_FIELD, NON_WEAR_FIELD, WEAR_FIELD
+
+
+class SummaryCache:
+    """
+    Running KPI totals and per-participant wear sums over `ukb_summary`.
+
+    The high-water mark is the largest ObjectId seen; a refresh only aggregates documents
+    inserted after it and merges their sums into the cached state. ObjectIds are generated
+    by the writers, so a document from a slow concurrent writer can land below the mark;
+    a full rebuild every `full_refresh_seconds` picks those up.
+    """
+
+    def __init__(self, collection, refresh_seconds=30, full_refresh_seconds=3600):
+        self.collection = collection
+        self.refresh_seconds = refresh_seconds
+        self.full_refresh_seconds = full_refresh_seconds
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.watermark, self.totals, self.wear = self._empty()
+        self.refreshed_at = 0.0
+        self.rebuilt_at = time.monotonic()
+
+    @staticmethod
+    def _empty():
+        totals = {'total_files': 0, 'wear_sum': 0.0, 'wear_count': 0,
+                  'non_wear_sum': 0.0, 'non_wear_count': 0, 'good_calibration_count': 0}
+        wear = pd.DataFrame(columns=['data_wearTime-overall(days)', 'data_nonWearTime-overall(days)'],
+                            index=pd.Index([], name='participant_id'), dtype=float)
+        return None, totals, wear
+
+    def refresh(self, force=False):
+        with self._lock:
+            now = time.monotonic()
+            rebuild = now - self.rebuilt_at > self.full_refresh_seconds
+            if not rebuild and not force and now - self.refreshed_at < self.refresh_seconds:
+                return
+
+            # The new state is built aside and swapped in whole, so the totals and wear frame
+            # handed out to readers are never modified in place
+            watermark, totals, wear = self._empty() if rebuild else (self.watermark, dict(self.totals), self.wear)
+            match = [{'$match': {'_id': {'$gt': watermark}}}] if watermark is not None else []
+            rows = list(self.collection.aggregate(match + [
+                {'$group': {
+                    '_id': '$participant_id',
+                    'last_id': {'$max': '$_id'},
+                    'files': {'$sum': 1},
+                    'wear_sum': {'$sum': f'${WEAR_FIELD}'},
+                    'wear_count': {'$sum': {'$cond': [{'$isNumber': f'${WEAR_FIELD}'}, 1, 0]}},
+                    'non_wear_sum': {'$sum': f'${NON_WEAR_FIELD}'},
+                    'non_wear_count': {'$sum': {'$cond': [{'$isNumber': f'${NON_WEAR_FIELD}'}, 1, 0]}},
+                    'good_calibration_count': {'$sum': {'$cond': [{'$eq': [f'${CALIBRATION_FIELD}', 1]}, 1, 0]}},
+                }},
+            ], allowDiskUse=True))
+
+            if rows:
+                new = pd.DataFrame(rows).set_index('_id')
+                watermark = new['last_id'].max()
+                totals['total_files'] += int(new['files'].sum())
+                for key in ('wear_sum', 'wear_count', 'non_wear_sum', 'non_wear_count', 'good_calibration_count'):
+                    totals[key] += new[key].sum()
+
+                delta = new[['wear_sum', 'non_wear_sum']].rename(columns={
+                    'wear_sum': 'data_wearTime-overall(days)',
+                    'non_wear_sum': 'data_nonWearTime-overall(days)',
+                })
+                delta.index.name = 'participant_id'
+                wear = wear.add(delta, fill_value=0)
+
+            self.watermark, self.totals, self.wear = watermark, totals, wear
+            self.refreshed_at = now
+            if rebuild:
+                self.rebuilt_at = now
+
+    def _snapshot(self):
+        self.refresh()
+        with self._lock:
+            return self.totals, self.wear
+
+    def kpis(self):
+        totals, _ = self._snapshot()
+        return {
+            'total_files': totals['total_files'],
+            'average_wear_time': totals['wear_sum'] / totals['wear_count'] if totals['wear_count'] else 0.0,
+            'good_calibration_count': int(totals['good_calibration_count']),
+            'average_non_wear_time': totals['non_wear_sum'] / totals['non_wear_count'] if totals['non_wear_count'] else 0.0,
+        }
+
+    def wear_nonwear(self):
+        _, wear = self._snapshot()
+        return wear.reset_index()
+
+    def participant_ids(self):
+        _, wear = self._snapshot()
+        # Documents without a participant group under a null key (NaN once in the index)
+        return sorted(wear.index.dropna())
+
+
+class ParticipantCache:
+    """
+    LRU of participant frames from `ggir_results`, refreshed by high-water mark.
+
+    The mark is the latest `calendar_date` cached for the participant, so a refresh only
+    pulls the day rows after it out of the participant's `data` array. Participants not
+    viewed recently are evicted once more than `max_participants` are cached.
+    """
+
+    def __init__(self, collection, max_participants=50, refresh_seconds=30):
+        self.collection = collection
+        self.max_participants = max_participants
+        self.refresh_seconds = refresh_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _fetch(self, pid, watermark):
+        rows = '$data'
+        if watermark is not None:
+            rows = {'$filter': {'input': '$data', 'as': 'row', 'cond': {'$gt': ['$$row.calendar_date', watermark]}}}
+        result = list(self.collection.aggregate([
+            {'$match': {'_id': pid}},
+            {'$project': {'_id': 0, 'data': rows}},
+        ]))
+        if not result or not result[0].get('data'):
+            return pd.DataFrame()
+        return pd.DataFrame(result[0]['data'])
+
+    def get(self, pid):
+        with self._lock:
+            now = time.monotonic()
+            entry = self._entries.get(pid)
+            if entry is not None and now - entry['refreshed_at'] < self.refresh_seconds:
+                self._entries.move_to_end(pid)
+                return entry['frame'].copy()
+
+            frame = entry['frame'] if entry is not None else pd.DataFrame()
+            watermark = entry['watermark'] if entry is not None else None
+            new = self._fetch(pid, watermark)
+            if not new.empty:
+                frame = pd.concat([frame, new], ignore_index=True).drop_duplicates(ignore_index=True)
+                if 'calendar_date' in frame.columns:
+                    watermark = frame['calendar_date'].max()
+
+            self._entries[pid] = {'frame': frame, 'watermark': watermark, 'refreshed_at': now}
+            self._entries.move_to_end(pid)
+            while len(self._entries) > self.max_participants:
+                self._entries.popitem(last=False)
+            # The dashboard adds derived columns, keep the cached frame pristine
+            return frame.copy()
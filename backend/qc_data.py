@@ -0,0 +1,175 @@
+# Server-side queries for the Streamlit QC dashboards (Hello.py, app_accelometer_ui.py)
+
+import argparse
+import time
+
+import pandas as pd
+
+WEAR_FIELD = 'data.wearTime-overall(days)'
+NON_WEAR_FIELD = 'data.nonWearTime-overall(days)'
+CALIBRATION_FIELD = 'data.quality-goodCalibration'
+
+# Fields shown in the file metadata table, as stored in the summary documents
+METADATA_FIELDS = ['participant_id', 'date', 'data.totalReads', 'data.file-size', 'data.file-deviceID',
+                   'data.file-startTime', 'data.file-endTime', 'data.quality-daylightSavingsCrossover']
+
+
+# Order of the metadata table; `_id` breaks ties so every document has a unique position to page from
+PAGE_SORT = [('participant_id', 1), ('date', 1), ('_id', 1)]
+
+
+def ensure_indexes(collection):
+    # Supports the range-paged, participant-ordered metadata table and participant lookups
+    collection.create_index(PAGE_SORT)
+
+
+def summary_kpis(collection):
+    """KPI card values computed with a single $group on the server."""
+    result = list(collection.aggregate([
+        {'$group': {
+            '_id': None,
+            'total_files': {'$sum': 1},
+            'average_wear_time': {'$avg': f'${WEAR_FIELD}'},
+            'good_calibration_count': {'$sum': {'$cond': [{'$eq': [f'${CALIBRATION_FIELD}', 1]}, 1, 0]}},
+            'average_non_wear_time': {'$avg': f'${NON_WEAR_FIELD}'},
+        }},
+        {'$project': {'_id': 0}},
+    ]))
+    if not result:
+        return {'total_files': 0, 'average_wear_time': 0.0, 'good_calibration_count': 0, 'average_non_wear_time': 0.0}
+    return result[0]
+
+
+def wear_nonwear_by_participant(collection):
+    """Wear and non-wear days per participant, summed on the server (what the stacked bar chart shows)."""
+    rows = list(collection.aggregate([
+        {'$group': {
+            '_id': '$participant_id',
+            'data_wearTime-overall(days)': {'$sum': f'${WEAR_FIELD}'},
+            'data_nonWearTime-overall(days)': {'$sum': f'${NON_WEAR_FIELD}'},
+        }},
+        {'$sort': {'_id': 1}},
+    ], allowDiskUse=True))
+    df = pd.DataFrame(rows, columns=['_id', 'data_wearTime-overall(days)', 'data_nonWearTime-overall(days)'])
+    return df.rename(columns={'_id': 'participant_id'})
+
+
+def participant_ids(collection):
+    return sorted(pid for pid in collection.distinct('participant_id') if pid is not None)
+
+
+def clean_summary_times(df):
+    """
+    Vectorized timezone extraction and timestamp cleaning for 'YYYY-MM-DD HH:MM:SS.fff+ZZZZ [Region/City]' strings.
+    """
+    start = df['data_file-startTime'].astype(str)
+    df['timezone'] = start.str.extract(r'\[([^\[\]]*)\]\s*$')[0]
+    for column in ('data_file-startTime', 'data_file-endTime'):
+        local = df[column].astype(str).str.extract(r'^(\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(?::\d{2})?(?:\.\d+)?)')[0]
+        df[column] = pd.to_datetime(local, errors='coerce').dt.strftime('%Y-%m-%d %H:%M:%S')
+    return df
+
+
+def page_key(document):
+    """Sort key of a document in the metadata table order, to page on from."""
+    return tuple(document.get(field) for field, _ in PAGE_SORT)
+
+
+def after_key(key):
+    """
+    Filter for the documents sorting after `key` in PAGE_SORT order.
+
+    A range on the sort key instead of skip(): the server seeks in the index to the start of
+    the page rather than walking every document before it. A missing or null value sorts
+    first, so "greater than null" is "not null".
+    """
+    branches = []
+    for i, (field, _) in enumerate(PAGE_SORT):
+        branch = {prefix: key[j] for j, (prefix, _) in enumerate(PAGE_SORT[:i])}
+        branch[field] = {'$ne': None} if key[i] is None else {'$gt': key[i]}
+        branches.append(branch)
+    return {'$or': branches}
+
+
+def metadata_page(collection, after=None, page_size=100):
+    """
+    One page of the file metadata table, projecting only the displayed fields.
+
+    Returns (frame, next key); pass the key as `after` for the following page. The key is
+    None on the last page.
+    """
+    documents = list(
+        collection.find(after_key(after) if after is not None else {}, {field: 1 for field in METADATA_FIELDS})
+        .sort(PAGE_SORT)
+        .limit(page_size + 1)
+    )
+    next_key = page_key(documents[page_size - 1]) if len(documents) > page_size else None
+    df = pd.json_normalize([{k: v for k, v in doc.items() if k != '_id'} for doc in documents[:page_size]], sep='_')
+    for field in METADATA_FIELDS:
+        column = field.replace('.', '_')
+        if column not in df.columns:
+            df[column] = None
+    if df.empty:
+        df['timezone'] = None
+        return df, next_key
+    df['data_file-size'] = df['data_file-size'] / (1024 ** 2)  # Convert file size to MB
+    return clean_summary_times(df), next_key
+
+
+def benchmark(n_documents, mongo_url='mongodb://localhost:27017/', page_size=100):
+    """Seed a scratch collection on a local mongod and time the dashboard queries."""
+    from pymongo import MongoClient
+
+    collection = MongoClient(mongo_url)['accelerometer_data']['ukb_summary_benchmark']
+    collection.drop()
+    batch = []
+    for i in range(n_documents):
+        batch.append({
+            'participant_id': f'P{i % 5000:05d}',
+            'date': f'2024-01-{i % 28 + 1:02d}',
+            'data': {
+                'totalReads': 1000000 + i,
+                'file-size': 250 * 1024 ** 2,
+                'file-deviceID': 40000 + i % 100,
+                'file-startTime': '2024-01-01 10:00:00.000+0000 [Europe/London]',
+                'file-endTime': '2024-01-08 10:00:00.000+0000 [Europe/London]',
+                'quality-daylightSavingsCrossover': 0,
+                'quality-goodCalibration': i % 2,
+                'wearTime-overall(days)': 6.5,
+                'nonWearTime-overall(days)': 0.5,
+            },
+        })
+        if len(batch) == 10000:
+            collection.insert_many(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch)
+    ensure_indexes(collection)
+    # The key the last page starts after, found from the other end of the index
+    last_page = (
+        collection.find({}, {field: 1 for field, _ in PAGE_SORT})
+        .sort([(field, -1) for field, _ in PAGE_SORT])
+        .skip(page_size)
+        .limit(1)
+    )
+    last_key = page_key(next(last_page))
+
+    for name, run in [
+        ('summary_kpis', lambda: summary_kpis(collection)),
+        ('wear_nonwear_by_participant', lambda: wear_nonwear_by_participant(collection)),
+        ('metadata_page (first)', lambda: metadata_page(collection, None, page_size)),
+        ('metadata_page (last)', lambda: metadata_page(collection, last_key, page_size)),
+    ]:
+        started = time.perf_counter()
+        run()
+        print(f"{name}: {time.perf_counter() - started:.3f}s for {n_documents} documents")
+
+    collection.drop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the QC dashboard queries against a local mongod.')
+    parser.add_argument('--documents', type=int, default=200000)
+    parser.add_argument('--mongo-url', default='mongodb://localhost:27017/')
+    args = parser.parse_args()
+    benchmark(args.documents, args.mongo_url)
@@ -0,0 +1,114 @@
+from datetime import timedelta
+
+from sqlalchemy import Column, String, text
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.schema import PrimaryKeyConstraint
+
+Base = declarative_base()
+
+
+class ParticipantGroup(Base):
+    # Named participant subsets (sub-studies, sites, arms) usable as `group=` on cohort endpoints
+    __tablename__ = 'participant_group'
+
+    group_name = Column(String(100), nullable=False)
+    pid = Column(String(50), nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('group_name', 'pid', name='participant_group_pk'),
+    )
+
+
+class UnsupportedFilter(ValueError):
+    pass
+
+
+class CohortFilter:
+    """
+    Participant subset, study timepoint and date range shared by the cohort endpoints.
+
+    `conditions` renders the filter as WHERE terms on a table's own columns, so aggregates
+    only read the selected participants and days through the (pid, ...) indexes instead of
+    the whole study. `end` is inclusive. An empty filter selects everything.
+    """
+
+    def __init__(self, pids=None, timepoint=None, start=None, end=None):
+        self.pids = sorted(set(pids)) if pids is not None else None
+        self.timepoint = timepoint
+        self.start = start
+        self.end = end
+
+    def __bool__(self):
+        return any(value is not None for value in (self.pids, self.timepoint, self.start, self.end))
+
+    def key(self):
+        """Hashable form for cache keys."""
+        return (tuple(self.pids) if self.pids is not None else None, self.timepoint, self.start, self.end)
+
+    def conditions(self, pid="pid", timepoint=None, date=None):
+        """
+        (terms, params) for a table whose participant, timepoint and date columns (or
+        expressions) are given. A filter on a column the table does not have raises
+        UnsupportedFilter rather than being dropped, so a filtered result is never the whole study.
+        """
+        if self.timepoint is not None and not timepoint:
+            raise UnsupportedFilter("This endpoint cannot filter by timepoint")
+        if (self.start is not None or self.end is not None) and not date:
+            raise UnsupportedFilter("This endpoint cannot filter by date")
+        terms, params = [], {}
+        if self.pids is not None:
+            if not self.pids:
+                terms.append("1 = 0")
+            else:
+                names = [f"cohort_pid_{i}" for i in range(len(self.pids))]
+                terms.append(f"{pid} IN ({', '.join(':' + name for name in names)})")
+                params.update(zip(names, self.pids))
+        if self.timepoint is not None:
+            terms.append(f"{timepoint} = :cohort_timepoint")
+            params["cohort_timepoint"] = self.timepoint
+        if self.start is not None:
+            terms.append(f"{date} >= :cohort_start")
+            params["cohort_start"] = self.start.isoformat()
+        if self.end is not None:
+            terms.append(f"{date} < :cohort_end")
+            params["cohort_end"] = (self.end + timedelta(days=1)).isoformat()
+        return terms, params
+
+    def where(self, pid="pid", timepoint=None, date=None):
+        """("WHERE ..." or "", params) for a query without other conditions."""
+        terms, params = self.conditions(pid, timepoint, date)
+        return (f"WHERE {' AND '.join(terms)}" if terms else ""), params
+
+    def and_where(self, pid="pid", timepoint=None, date=None):
+        """("AND ..." or "", params) to append to an existing WHERE clause."""
+        terms, params = self.conditions(pid, timepoint, date)
+        return "".join(f" AND {term}" for term in terms), params
+
+
+def create_table(engine):
+    Base.metadata.create_all(engine)
+
+
+def group_pids(engine, group_name):
+    """Participants of a group, or None when the group does not exist."""
+    with engine.connect() as conn:
+        pids = [row[0] for row in conn.execute(
+            text("SELECT pid FROM participant_group WHERE group_name = :group ORDER BY pid"), {"group": group_name}
+        )]
+    return pids or None
+
+
+def set_group(engine, group_name, pids):
+    """Replace the members of a group."""
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM participant_group WHERE group_name = :group"), {"group": group_name})
+        if pids:
+            conn.execute(text("INSERT INTO participant_group (group_name, pid) VALUES (:group, :pid)"),
+                         [{"group": group_name, "pid": pid} for pid in sorted(set(pids))])
+
+
+def list_groups(engine):
+    with engine.connect() as conn:
+        return {name: count for name, count in conn.execute(
+            text("SELECT group_name, COUNT(*) FROM participant_group GROUP BY group_name ORDER BY group_name")
+        )}
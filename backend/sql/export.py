@@ -0,0 +1,236 @@
+import csv
+import io
+import zlib
+from datetime import timedelta
+
+from sqlalchemy import text
+
+# Exportable tables and the expression their date-range filter applies to
+EXPORT_TABLES = {
+    "cgm_data": "STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i')",
+    "dietary_data": "date",  # ISO date strings compare in date order
+    "day_summary": "calendar_date",
+    "wear_time": "calendar_date",
+    "minute_level_data": "timestamp",
+}
+EXPORT_FORMATS = ("csv", "parquet")
+CSV_COMPRESSION = ("gzip", "none")
+PARQUET_COMPRESSION = ("zstd", "snappy", "gzip", "none")
+
+# Rows fetched from the server-side cursor at a time; also the Parquet row group size
+CHUNK_ROWS = 50_000
+
+
+# MySQL protocol field types (cursor.description[1]) -> Arrow types, so a Parquet file's schema
+# comes from the result's columns rather than from whatever values the first batch happens to hold
+MYSQL_ARROW_TYPES = {
+    0: "decimal", 246: "decimal",
+    1: "int8", 2: "int16", 3: "int32", 9: "int32", 8: "int64", 13: "int16", 16: "int64",
+    4: "float32", 5: "float64",
+    7: "timestamp", 12: "timestamp",
+    10: "date", 14: "date",
+    11: "time",
+    249: "blob", 250: "blob", 251: "blob", 252: "blob",
+}
+MYSQL_UNSIGNED_FLAG = 32
+MYSQL_BINARY_FLAG = 128
+
+
+class Columns(list):
+    """Column names of a result, with the Arrow schema of its values when it is known."""
+
+    def __init__(self, names, schema=None):
+        super().__init__(names)
+        self.schema = schema
+
+
+def arrow_schema(description):
+    """
+    Arrow schema of a MySQL result from its DBAPI cursor description.
+
+    Types the mapping does not know (VARCHAR, TEXT, JSON, ENUM, ...) are strings. DECIMAL is
+    decimal256(65, 30), which holds any MySQL DECIMAL exactly.
+    """
+    import pyarrow as pa
+
+    fields = []
+    for column in description:
+        name, type_code = column[0], column[1]
+        flags = column[7] if len(column) > 7 and column[7] is not None else 0
+        kind = MYSQL_ARROW_TYPES.get(type_code, "string")
+        if kind == "decimal":
+            arrow_type = pa.decimal256(65, 30)
+        elif kind.startswith("int"):
+            arrow_type = getattr(pa, ("u" if flags & MYSQL_UNSIGNED_FLAG else "") + kind)()
+        elif kind == "timestamp":
+            arrow_type = pa.timestamp("us")
+        elif kind == "date":
+            arrow_type = pa.date32()
+        elif kind == "time":
+            arrow_type = pa.duration("us")
+        elif kind == "blob":
+            arrow_type = pa.binary() if flags & MYSQL_BINARY_FLAG else pa.string()
+        elif kind == "string":
+            arrow_type = pa.string()
+        else:
+            arrow_type = getattr(pa, kind)()
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+
+def export_query(table, pids=None, start=None, end=None, date_expression=None):
+    """
+    SELECT for one export, as (sql, params). `end` is inclusive. `date_expression` overrides
+    the table's date expression, e.g. with its partition column so the range prunes partitions.
+
+    Rows come out grouped by participant (the pid index order) rather than sorted by time,
+    so MySQL can stream them without a filesort of the whole range.
+    """
+    date_expression = date_expression or EXPORT_TABLES[table]
+    conditions, params = [], {}
+    if pids:
+        names = [f"pid_{i}" for i in range(len(pids))]
+        conditions.append(f"pid IN ({', '.join(':' + name for name in names)})")
+        params.update(zip(names, pids))
+    if start is not None:
+        conditions.append(f"{date_expression} >= :start")
+        params["start"] = start.isoformat()
+    if end is not None:
+        conditions.append(f"{date_expression} < :end")
+        params["end"] = (end + timedelta(days=1)).isoformat()
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"SELECT * FROM {table} {where} ORDER BY pid", params
+
+
+def stream_rows(engine, sql, params, kill_query=None, chunk_rows=CHUNK_ROWS):
+    """
+    Yield the column names (as Columns, with the Arrow schema of the result), then lists of
+    up to `chunk_rows` rows, from an unbuffered cursor.
+
+    Only one chunk is held in memory. The DBAPI connection is used directly because
+    SQLAlchemy does not offer server-side cursors for mysql-connector. If the consumer
+    stops early (client disconnected), the query is killed and the connection discarded
+    instead of draining the remaining rows.
+    """
+    compiled = text(sql).compile(dialect=engine.dialect)
+    bind = compiled.construct_params(params)
+    if compiled.positiontup is not None:
+        bind = [bind[name] for name in compiled.positiontup]
+
+    connection = engine.raw_connection()
+    finished = False
+    try:
+        try:
+            cursor = connection.cursor(buffered=False)
+        except TypeError:
+            cursor = connection.cursor()
+        cursor.execute(compiled.string, bind)
+        yield Columns([column[0] for column in cursor.description], arrow_schema(cursor.description))
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield rows
+        finished = True
+        cursor.close()
+    finally:
+        if finished:
+            connection.close()
+        else:
+            connection_id = getattr(connection.dbapi_connection, "connection_id", None)
+            if kill_query is not None and connection_id is not None:
+                try:
+                    kill_query(connection_id)
+                except Exception:
+                    pass
+            connection.invalidate()
+
+
+def csv_chunks(batches, compression="gzip"):
+    """Encode (columns, rows...) batches as CSV, gzip-compressed on the fly unless compression is "none"."""
+    try:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compression == "gzip" else None
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(next(batches))
+        for rows in batches:
+            writer.writerows(rows)
+            chunk = buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+        tail = buffer.getvalue().encode("utf-8")  # header only, for an empty export
+        if compressor is not None:
+            tail = compressor.compress(tail) + compressor.flush()
+        if tail:
+            yield tail
+    finally:
+        # Closing early releases the cursor (see stream_rows)
+        batches.close()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file collecting what the Parquet writer emits until it is drained."""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def parquet_chunks(batches, compression="zstd"):
+    """
+    Encode (columns, rows...) batches as a Parquet file, one row group per batch.
+
+    The schema is fixed before the first row is written: the one carried by the columns (see
+    Columns), or for plain column names the types of the first batch, with all-NULL columns as
+    strings.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    try:
+        columns = next(batches)
+        sink = _ChunkSink()
+        schema = getattr(columns, "schema", None)
+        writer = None
+        for rows in batches:
+            data = dict(zip(columns, (list(values) for values in zip(*rows))))
+            if schema is None:
+                table = pa.Table.from_pydict(data)
+                # Columns that are all NULL in the first batch would get the null type for the whole file
+                schema = pa.schema([pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f for f in table.schema])
+                table = table.cast(schema)
+            else:
+                table = pa.Table.from_pydict(data, schema=schema)
+            if writer is None:
+                writer = pq.ParquetWriter(sink, schema, compression=compression)
+            writer.write_table(table, row_group_size=len(rows))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+        if writer is None:
+            writer = pq.ParquetWriter(sink, schema or pa.schema([pa.field(name, pa.string()) for name in columns]),
+                                      compression=compression)
+        writer.close()
+        yield sink.drain()
+    finally:
+        batches.close()
@@ -0,0 +1,179 @@
+from collections import namedtuple
+
+import numpy as np
+from sqlalchemy import Column, Date, Integer, LargeBinary, SmallInteger, String, bindparam, text
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.schema import PrimaryKeyConstraint
+
+# Per-(pid, day) glucose histograms with 1 mg/dL bins, stored as uint16 counts from the lowest
+# reading of the day to the highest (a day has at most 1440 readings, so a bin never overflows).
+# Histograms are mergeable by addition: any range, cohort, bin width or percentile is answered
+# by summing small arrays instead of rescanning readings.
+COUNTS_DTYPE = np.dtype('<u2')
+
+Base = declarative_base()
+
+
+class CGMHistogram(Base):
+    __tablename__ = 'cgm_histogram'
+
+    pid = Column(String(50), nullable=False)
+    date = Column(Date, nullable=False)
+    low = Column(SmallInteger, nullable=False)  # mg/dL of counts[0]
+    n_readings = Column(Integer, nullable=False)
+    counts = Column(LargeBinary, nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('pid', 'date', name='cgm_histogram_pk'),
+    )
+
+
+DayHistogram = namedtuple('DayHistogram', ['date', 'low', 'counts'])
+
+
+def day_histogram(glucose):
+    """(low, uint16 counts) of one day's integer glucose values."""
+    glucose = np.asarray(glucose, dtype=np.int64)
+    low = int(glucose.min())
+    return low, np.bincount(glucose - low).astype(COUNTS_DTYPE)
+
+
+def merge(histograms):
+    """Sum (low, counts) histograms into one dense int64 array indexed by mg/dL."""
+    histograms = list(histograms)
+    if not histograms:
+        return np.zeros(0, dtype=np.int64)
+    total = np.zeros(max(low + len(counts) for low, counts in histograms), dtype=np.int64)
+    for low, counts in histograms:
+        total[low:low + len(counts)] += counts
+    return total
+
+
+def rebin(total, width):
+    """[(bin start mg/dL, count)] of the non-empty `width` mg/dL bins of a merged histogram."""
+    if not len(total):
+        return []
+    padded = np.zeros(-(-len(total) // width) * width, dtype=np.int64)
+    padded[:len(total)] = total
+    binned = padded.reshape(-1, width).sum(axis=1)
+    return [(int(i * width), int(count)) for i, count in enumerate(binned) if count]
+
+
+def percentiles(total, qs):
+    """Glucose percentiles (0-100, lower value for ties as with numpy's 'lower' method) of a merged histogram."""
+    n = int(total.sum())
+    if n == 0:
+        return [None for _ in qs]
+    cumulative = np.cumsum(total)
+    ranks = np.floor(np.asarray(qs, dtype=float) / 100 * (n - 1)).astype(np.int64)
+    return np.searchsorted(cumulative, ranks + 1).tolist()
+
+
+def mean(total):
+    """Mean glucose of a merged histogram, or None when it is empty."""
+    n = total.sum()
+    if n == 0:
+        return None
+    return float(np.arange(len(total)) @ total / n)
+
+
+def fraction_between(total, low=None, high=None):
+    """Share of readings with low <= glucose <= high, either bound optional."""
+    n = total.sum()
+    if n == 0:
+        return None
+    start = 0 if low is None else max(int(low), 0)
+    stop = len(total) if high is None else int(high) + 1
+    return float(total[start:stop].sum() / n)
+
+
+class GlucoseHistogramStore:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def create_table(self):
+        Base.metadata.create_all(self.engine)
+
+    def upsert(self, conn, pid, days):
+        """
+        Replace the histograms of the given days, inside the caller's transaction.
+
+        `days` maps dates to their complete packed readings (after merging with what was stored),
+        so a rewritten day gets an exact histogram rather than an increment.
+        """
+        rows = []
+        for day, readings in days.items():
+            if not len(readings):
+                continue
+            low, counts = day_histogram(readings['glucose'])
+            rows.append({'pid': pid, 'date': day, 'low': low, 'n_readings': len(readings), 'counts': counts.tobytes()})
+        if rows:
+            conn.execute(text("""
+                INSERT INTO cgm_histogram (pid, date, low, n_readings, counts)
+                VALUES (:pid, :date, :low, :n_readings, :counts)
+                ON DUPLICATE KEY UPDATE
+                    low = VALUES(low),
+                    n_readings = VALUES(n_readings),
+                    counts = VALUES(counts)
+            """), rows)
+
+    def load(self, pids=None, start=None, end=None, timepoint=None):
+        """
+        {pid: [DayHistogram, ...]} for the given participants (all when None); start/end are
+        inclusive dates. `timepoint` keeps the days the packed series assigns to that timepoint.
+        """
+        conditions, params = [], {}
+        if pids is not None:
+            conditions.append("h.pid IN :pids")
+            params['pids'] = list(pids)
+        if start is not None:
+            conditions.append("h.date >= :start")
+            params['start'] = start
+        if end is not None:
+            conditions.append("h.date <= :end")
+            params['end'] = end
+        query = "SELECT h.pid, h.date, h.low, h.counts FROM cgm_histogram h"
+        if timepoint is not None:
+            query += " JOIN cgm_series s ON s.pid = h.pid AND s.date = h.date"
+            conditions.append("s.timepoint = :timepoint")
+            params['timepoint'] = timepoint
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY h.pid, h.date"
+        statement = text(query)
+        if pids is not None:
+            statement = statement.bindparams(bindparam('pids', expanding=True))
+
+        histograms = {pid: [] for pid in pids or []}
+        with self.engine.connect() as conn:
+            for pid, day, low, counts in conn.execute(statement, params):
+                histograms.setdefault(pid, []).append(DayHistogram(day, low, np.frombuffer(counts, dtype=COUNTS_DTYPE)))
+        return histograms
+
+    def merged(self, pids=None, start=None, end=None, timepoint=None):
+        """{pid: merged dense histogram} over the range."""
+        return {
+            pid: merge((day.low, day.counts) for day in days)
+            for pid, days in self.load(pids, start, end, timepoint).items()
+        }
+
+    def distribution(self, pids=None, start=None, end=None, bin_width=10, timepoint=None):
+        """Per-participant counts in `bin_width` mg/dL bins, as rows of pid, glucose_range and occurrences."""
+        return [
+            {"pid": pid, "glucose_range": start_mg_dl, "occurrences": count}
+            for pid, total in self.merged(pids, start, end, timepoint).items()
+            for start_mg_dl, count in rebin(total, bin_width)
+        ]
+
+    def backfill(self, series_store, pid=None):
+        """Build histograms from the packed series already stored, one participant at a time."""
+        with self.engine.connect() as conn:
+            if pid is None:
+                pids = [row[0] for row in conn.execute(text("SELECT DISTINCT pid FROM cgm_series"))]
+            else:
+                pids = [pid]
+        for current_pid in pids:
+            days = {day.date: day.readings for day in series_store.load(current_pid)}
+            with self.engine.begin() as conn:
+                self.upsert(conn, current_pid, days)
+        return len(pids)
@@ -0,0 +1,150 @@
+import numpy as np
+from sqlalchemy import BigInteger, Column, DateTime, SmallInteger, String, text
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.schema import PrimaryKeyConstraint
+
+# Uniform sample of every participant's CGM readings (one reservoir per participant, so the
+# sample is stratified by pid), kept up to date at ingest with reservoir sampling. Cohort
+# statistics estimated from it read at most SAMPLE_SIZE rows per participant.
+SAMPLE_SIZE = 2000
+
+Base = declarative_base()
+
+
+class CGMSample(Base):
+    __tablename__ = 'cgm_sample'
+
+    pid = Column(String(50), nullable=False)
+    slot = Column(SmallInteger, nullable=False)
+    timepoint = Column(String(50))
+    reading_time = Column(DateTime, nullable=False)
+    glucose = Column(SmallInteger, nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('pid', 'slot', name='cgm_sample_pk'),
+    )
+
+
+class CGMSampleCount(Base):
+    # Readings seen per participant: the population size behind its reservoir
+    __tablename__ = 'cgm_sample_count'
+
+    pid = Column(String(50), primary_key=True)
+    seen = Column(BigInteger, nullable=False)
+
+
+def reservoir_slots(seen, n, size, rng):
+    """
+    Slot each of `n` new readings goes to (or -1 when it is not sampled), given `seen` earlier ones.
+
+    Algorithm R: reading i (0-based over all readings) fills slot i while the reservoir is
+    not full, then replaces a uniformly chosen slot with probability size / (i + 1). The
+    choices are independent, so a batch is drawn at once; when several readings of the
+    batch hit one slot the last wins, as it would sequentially.
+    """
+    index = np.arange(seen, seen + n, dtype=np.int64)
+    slots = np.where(index < size, index, rng.integers(0, index + 1))
+    slots[slots >= size] = -1
+    sampled = np.flatnonzero(slots >= 0)
+    # Keep only the last reading per slot
+    _, last = np.unique(slots[sampled][::-1], return_index=True)
+    keep = np.zeros(n, dtype=bool)
+    keep[sampled[len(sampled) - 1 - last]] = True
+    slots[~keep] = -1
+    return slots
+
+
+class GlucoseSampleStore:
+    def __init__(self, engine, size=SAMPLE_SIZE, seed=None):
+        self.engine = engine
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+
+    def create_table(self):
+        Base.metadata.create_all(self.engine)
+
+    def add(self, conn, pid, timepoint, days):
+        """
+        Offer new readings of one participant to its reservoir, inside the caller's transaction.
+
+        `days` maps dates to packed readings (see sql/glucose_series.py). Only readings not
+        stored before should be passed, so re-ingesting a file does not count them twice.
+        """
+        days = [(day, readings) for day, readings in sorted(days.items()) if len(readings)]
+        if not days:
+            return
+        timestamps = np.concatenate([
+            np.datetime64(day, 'm') + readings['minute'].astype('timedelta64[m]') for day, readings in days
+        ]).astype('datetime64[s]').tolist()
+        glucose = np.concatenate([readings['glucose'] for _, readings in days])
+        n = len(glucose)
+        seen = conn.execute(
+            text("SELECT seen FROM cgm_sample_count WHERE pid = :pid FOR UPDATE"), {'pid': pid}
+        ).scalar() or 0
+        slots = reservoir_slots(seen, n, self.size, self.rng)
+        chosen = np.flatnonzero(slots >= 0)
+        if len(chosen):
+            conn.execute(text("""
+                INSERT INTO cgm_sample (pid, slot, timepoint, reading_time, glucose)
+                VALUES (:pid, :slot, :timepoint, :reading_time, :glucose)
+                ON DUPLICATE KEY UPDATE
+                    timepoint = VALUES(timepoint),
+                    reading_time = VALUES(reading_time),
+                    glucose = VALUES(glucose)
+            """), [
+                {'pid': pid, 'slot': int(slots[i]), 'timepoint': timepoint,
+                 'reading_time': timestamps[i], 'glucose': int(glucose[i])}
+                for i in chosen
+            ])
+        conn.execute(text("""
+            INSERT INTO cgm_sample_count (pid, seen) VALUES (:pid, :seen)
+            ON DUPLICATE KEY UPDATE seen = VALUES(seen)
+        """), {'pid': pid, 'seen': seen + n})
+
+    def stats(self, where="", params=None):
+        """
+        Per-participant sample aggregates for the estimators in analytics/approx.py.
+
+        `where` filters the sample rows (alias `s`). Each row carries the filtered sample
+        size `n`, the participant's whole sample size and the readings it was drawn from.
+        """
+        query = f"""
+            SELECT
+                s.pid,
+                COUNT(*) AS n,
+                LEAST(c.seen, :sample_size) AS sample_size,
+                c.seen AS seen,
+                AVG(s.glucose) AS mean,
+                STDDEV_SAMP(s.glucose) AS sd,
+                SUM(s.glucose < 54) AS very_low,
+                SUM(s.glucose BETWEEN 54 AND 70) AS low,
+                SUM(s.glucose < 70) AS hypo,
+                SUM(s.glucose BETWEEN 70 AND 180) AS target,
+                SUM(s.glucose > 180) AS hyper,
+                SUM(s.glucose BETWEEN 180 AND 250) AS high,
+                SUM(s.glucose > 250) AS very_high
+            FROM cgm_sample s
+            JOIN cgm_sample_count c ON c.pid = s.pid
+            {where}
+            GROUP BY s.pid, c.seen
+            ORDER BY s.pid
+        """
+        with self.engine.connect() as conn:
+            result = conn.execute(text(query), {'sample_size': self.size, **(params or {})})
+            return [dict(row._mapping) for row in result]
+
+    def backfill(self, series_store, pid=None):
+        """Rebuild reservoirs from the packed series, one participant at a time."""
+        with self.engine.connect() as conn:
+            if pid is None:
+                pids = [row[0] for row in conn.execute(text("SELECT DISTINCT pid FROM cgm_series"))]
+            else:
+                pids = [pid]
+        for current_pid in pids:
+            days = series_store.load(current_pid)
+            with self.engine.begin() as conn:
+                conn.execute(text("DELETE FROM cgm_sample WHERE pid = :pid"), {'pid': current_pid})
+                conn.execute(text("DELETE FROM cgm_sample_count WHERE pid = :pid"), {'pid': current_pid})
+                for day in days:
+                    self.add(conn, current_pid, day.timepoint, {day.date: day.readings})
+        return len(pids)
@@ -0,0 +1,274 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Column, String, Integer, Date, LargeBinary, text, bindparam
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.schema import PrimaryKeyConstraint
+
+from sql.glucose_histograms import GlucoseHistogramStore
+from sql.glucose_sample import GlucoseSampleStore
+
+# Packed CGM series: one row per (pid, day) holding every reading of that day as
+# (minute of day, glucose mg/dL) uint16 pairs. Device metadata is stored once per day
+# instead of once per reading, and the blob decodes zero-copy with np.frombuffer.
+SERIES_DTYPE = np.dtype([('minute', '<u2'), ('glucose', '<u2')])
+
+CGM_TIMESTAMP_FORMAT = '%m-%d-%Y %H:%M'
+
+Base = declarative_base()
+
+
+class CGMSeries(Base):
+    __tablename__ = 'cgm_series'
+
+    pid = Column(String(50), nullable=False)
+    date = Column(Date, nullable=False)
+    timepoint = Column(String(50))
+    device = Column(String(100))
+    serial_number = Column(String(100))
+    n_readings = Column(Integer, nullable=False)
+    readings = Column(LargeBinary, nullable=False)
+    # Bumped on every rewrite of the day, used as the data version for caches
+    version = Column(Integer, nullable=False, default=1)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('pid', 'date', name='cgm_series_pk'),
+    )
+
+
+SeriesDay = namedtuple('SeriesDay', ['date', 'timepoint', 'device', 'serial_number', 'readings'])
+
+
+def pack_day(minutes, glucose):
+    """Pack minute offsets and glucose values of one day into a SERIES_DTYPE array sorted by minute."""
+    packed = np.empty(len(minutes), dtype=SERIES_DTYPE)
+    packed['minute'] = minutes
+    packed['glucose'] = np.clip(np.rint(glucose), 0, np.iinfo(np.uint16).max)
+    return merge_days(packed[:0], packed)
+
+
+def unpack_day(blob):
+    """Decode a packed day without copying; the returned array is read-only."""
+    return np.frombuffer(blob, dtype=SERIES_DTYPE)
+
+
+def merge_days(existing, new):
+    """Merge two packed arrays of the same day, readings in `new` win on equal minutes."""
+    combined = np.concatenate([existing, new])
+    combined = combined[np.argsort(combined['minute'], kind='stable')]
+    keep = np.append(combined['minute'][1:] != combined['minute'][:-1], True)
+    return combined[keep]
+
+
+def series_timestamps(days):
+    """Flatten loaded days into (datetime64[m] timestamps, glucose) arrays."""
+    if not days:
+        return np.array([], dtype='datetime64[m]'), np.array([], dtype=np.uint16)
+    base = np.repeat(
+        np.array([d.date for d in days], dtype='datetime64[D]').astype('datetime64[m]'),
+        [len(d.readings) for d in days]
+    )
+    minutes = np.concatenate([d.readings['minute'] for d in days]).astype('timedelta64[m]')
+    glucose = np.concatenate([d.readings['glucose'] for d in days])
+    return base + minutes, glucose
+
+
+class GlucoseSeriesStore:
+    def __init__(self, engine):
+        self.engine = engine
+        # Per-day glucose histograms, rewritten together with the packed days
+        self.histograms = GlucoseHistogramStore(engine)
+        # Per-participant reservoir of readings for approximate cohort statistics
+        self.sample = GlucoseSampleStore(engine)
+
+    def create_table(self):
+        Base.metadata.create_all(self.engine)
+        self.histograms.create_table()
+        self.sample.create_table()
+
+    def load(self, pid, start=None, end=None):
+        """Load all packed days of a participant in one query; start/end are inclusive dates."""
+        query = "SELECT date, timepoint, device, serial_number, readings FROM cgm_series WHERE pid = :pid"
+        params = {'pid': pid}
+        if start is not None:
+            query += " AND date >= :start"
+            params['start'] = start
+        if end is not None:
+            query += " AND date <= :end"
+            params['end'] = end
+        query += " ORDER BY date"
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(query), params).fetchall()
+        return [SeriesDay(row[0], row[1], row[2], row[3], unpack_day(row[4])) for row in rows]
+
+    def load_many(self, pids, start=None, end=None):
+        """Load packed days of several participants in one query, as {pid: [SeriesDay, ...]}."""
+        query = "SELECT pid, date, timepoint, device, serial_number, readings FROM cgm_series WHERE pid IN :pids"
+        params = {'pids': list(pids)}
+        if start is not None:
+            query += " AND date >= :start"
+            params['start'] = start
+        if end is not None:
+            query += " AND date <= :end"
+            params['end'] = end
+        query += " ORDER BY pid, date"
+
+        series = {pid: [] for pid in pids}
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(query).bindparams(bindparam('pids', expanding=True)), params)
+            for row in rows:
+                series.setdefault(row[0], []).append(SeriesDay(row[1], row[2], row[3], row[4], unpack_day(row[5])))
+        return series
+
+    def date_bounds(self, pid):
+        """First and last packed date of a participant, (None, None) when nothing is stored."""
+        with self.engine.connect() as conn:
+            first, last = conn.execute(
+                text("SELECT MIN(date), MAX(date) FROM cgm_series WHERE pid = :pid"), {'pid': pid}
+            ).fetchone()
+        return first, last
+
+    def versions(self, pids, start=None, end=None):
+        """Cheap data version per participant and range, changes whenever a day is (re)written."""
+        query = "SELECT pid, COUNT(*), COALESCE(SUM(version), 0) FROM cgm_series WHERE pid IN :pids"
+        params = {'pids': list(pids)}
+        if start is not None:
+            query += " AND date >= :start"
+            params['start'] = start
+        if end is not None:
+            query += " AND date <= :end"
+            params['end'] = end
+        query += " GROUP BY pid"
+
+        versions = {pid: "0:0" for pid in pids}
+        with self.engine.connect() as conn:
+            for pid, count, total in conn.execute(text(query).bindparams(bindparam('pids', expanding=True)), params):
+                versions[pid] = f"{count}:{total}"
+        return versions
+
+    def version(self, pid, start=None, end=None):
+        return self.versions([pid], start, end)[pid]
+
+    def write_readings(self, pid, timepoint, timestamps, glucose, device=None, serial_number=None, conn=None):
+        """
+        Pack readings into per-day rows and upsert them, merging with days already stored.
+
+        Parameters:
+        -----------
+        timestamps : pd.Series
+            Reading timestamps (datetime64); rows with a missing timestamp or glucose are dropped
+        glucose : pd.Series
+            Glucose values in mg/dL
+        conn : Connection, optional
+            Transaction to write in, so the merge commits (or rolls back) with the caller's
+            other writes; a transaction of its own when omitted
+        """
+        frame = pd.DataFrame({
+            'timestamp': pd.to_datetime(timestamps, errors='coerce').to_numpy(),
+            'glucose': pd.to_numeric(glucose, errors='coerce').to_numpy()
+        }).dropna()
+        if frame.empty:
+            return 0
+
+        dates = frame['timestamp'].dt.normalize()
+        frame['date'] = dates.dt.date
+        frame['minute'] = ((frame['timestamp'] - dates) // pd.Timedelta(minutes=1)).astype(np.uint16)
+
+        days = {
+            day: pack_day(group['minute'].to_numpy(), group['glucose'].to_numpy())
+            for day, group in frame.groupby('date', sort=True)
+        }
+
+        if conn is None:
+            with self.engine.begin() as conn:
+                self._merge_days(conn, pid, timepoint, days, device, serial_number)
+        else:
+            self._merge_days(conn, pid, timepoint, days, device, serial_number)
+        return len(frame)
+
+    def _merge_days(self, conn, pid, timepoint, days, device, serial_number):
+        existing_query = text(
+            "SELECT date, readings FROM cgm_series WHERE pid = :pid AND date IN :dates"
+        ).bindparams(bindparam('dates', expanding=True))
+        upsert = text("""
+            INSERT INTO cgm_series (pid, date, timepoint, device, serial_number, n_readings, readings, version)
+            VALUES (:pid, :date, :timepoint, :device, :serial_number, :n_readings, :readings, 1)
+            ON DUPLICATE KEY UPDATE
+                timepoint = VALUES(timepoint),
+                device = COALESCE(VALUES(device), device),
+                serial_number = COALESCE(VALUES(serial_number), serial_number),
+                n_readings = VALUES(n_readings),
+                readings = VALUES(readings),
+                version = version + 1
+        """)
+
+        new_readings = dict(days)
+        for row in conn.execute(existing_query, {'pid': pid, 'dates': list(days)}):
+            existing = unpack_day(row[1])
+            new_readings[row[0]] = days[row[0]][~np.isin(days[row[0]]['minute'], existing['minute'])]
+            days[row[0]] = merge_days(existing, days[row[0]])
+
+        conn.execute(upsert, [
+            {
+                'pid': pid,
+                'date': day,
+                'timepoint': timepoint,
+                'device': device,
+                'serial_number': serial_number,
+                'n_readings': len(readings),
+                'readings': readings.tobytes()
+            }
+            for day, readings in days.items()
+        ])
+        self.histograms.upsert(conn, pid, days)
+        self.sample.add(conn, pid, timepoint, new_readings)
+
+    def backfill_missing(self):
+        """
+        Repack the participants with cgm_data days that have no histogram, i.e. readings loaded
+        before the packed series and histograms existed. Returns the number of participants.
+        """
+        with self.engine.connect() as conn:
+            pids = [row[0] for row in conn.execute(text("""
+                SELECT DISTINCT c.pid
+                FROM cgm_data c
+                WHERE c.historic_glucose_mg_dl IS NOT NULL
+                AND NOT EXISTS (
+                    SELECT 1 FROM cgm_histogram h
+                    WHERE h.pid = c.pid AND h.date = DATE(STR_TO_DATE(c.device_timestamp, '%m-%d-%Y %H:%i'))
+                )
+            """))]
+        for pid in pids:
+            self.backfill(pid)
+        return len(pids)
+
+    def backfill(self, pid=None):
+        """Rebuild packed series from cgm_data, one participant at a time to bound memory."""
+        with self.engine.connect() as conn:
+            if pid is None:
+                pids = [row[0] for row in conn.execute(text("SELECT DISTINCT pid FROM cgm_data"))]
+            else:
+                pids = [pid]
+
+        for current_pid in pids:
+            readings = pd.read_sql(
+                text("""
+                    SELECT timepoint, device_timestamp, device, serial_number, historic_glucose_mg_dl
+                    FROM cgm_data
+                    WHERE pid = :pid AND historic_glucose_mg_dl IS NOT NULL
+                """),
+                self.engine,
+                params={'pid': current_pid}
+            )
+            for timepoint, group in readings.groupby('timepoint'):
+                self.write_readings(
+                    current_pid,
+                    timepoint,
+                    pd.to_datetime(group['device_timestamp'], format=CGM_TIMESTAMP_FORMAT, errors='coerce'),
+                    group['historic_glucose_mg_dl'],
+                    device=group['device'].dropna().iloc[0] if group['device'].notna().any() else None,
+                    serial_number=group['serial_number'].dropna().iloc[0] if group['serial_number'].notna().any() else None
+                )
+        return len(pids)
@@ -0,0 +1,148 @@
+from sqlalchemy import text
+
+# Versioned schema changes, applied in order and recorded in schema_migrations.
+# Each step is ("index", table, name, columns), ("sql", statement) or ("backfill", table, name),
+# the last running the `backfills[name]` callable passed to `migrate` when `table` exists; steps
+# are idempotent so a migration interrupted half way can simply be run again.
+MIGRATIONS = [
+    (1, "Composite indexes for the per-participant routes", [
+        ("index", "minute_level_data", "idx_minute_level_pid_timestamp", ("pid", "timestamp")),
+        ("index", "day_summary", "idx_day_summary_pid_date", ("pid", "calendar_date")),
+        ("index", "wear_time", "idx_wear_time_pid_date", ("pid", "calendar_date")),
+        ("index", "dietary_data", "idx_dietary_pid_date", ("pid", "date")),
+    ]),
+    # The glucose distribution, histogram and diet/glucose views read only the histograms
+    (2, "Packed series and histograms for readings loaded before them", [
+        ("backfill", "cgm_data", "packed_series"),
+    ]),
+]
+
+# EXPLAIN access types that read the whole table or index
+FULL_SCAN_TYPES = ("ALL", "index")
+
+# Tables written by pandas `to_sql` (dietary_data) have TEXT columns, which MySQL only indexes
+# by a key prefix (error 1170 otherwise); values are short ids and ISO dates, so the prefix
+# covers them whole
+TEXT_TYPES = ("tinytext", "text", "mediumtext", "longtext", "tinyblob", "blob", "mediumblob", "longblob")
+TEXT_KEY_PREFIX = 64
+
+
+def _table_exists(conn, table):
+    return conn.execute(text(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = :table"
+    ), {"table": table}).scalar() > 0
+
+
+def _index_prefixes(conn, table):
+    rows = conn.execute(text("""
+        SELECT index_name, column_name
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = :table
+        ORDER BY index_name, seq_in_index
+    """), {"table": table}).fetchall()
+    indexes = {}
+    for name, column in rows:
+        indexes.setdefault(name, []).append(column.lower())
+    return indexes
+
+
+def _column_types(conn, table):
+    rows = conn.execute(text("""
+        SELECT column_name, data_type
+        FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = :table
+    """), {"table": table}).fetchall()
+    return {column.lower(): data_type.lower() for column, data_type in rows}
+
+
+def _create_index(conn, table, name, columns):
+    """Create the index unless the table is missing or an existing index already leads with `columns`."""
+    if not _table_exists(conn, table):
+        return False
+    wanted = [column.lower() for column in columns]
+    for existing in _index_prefixes(conn, table).values():
+        if existing[:len(wanted)] == wanted:
+            return True
+    types = _column_types(conn, table)
+    keys = [
+        f"{column}({TEXT_KEY_PREFIX})" if types.get(column.lower()) in TEXT_TYPES else column
+        for column in columns
+    ]
+    conn.execute(text(f"CREATE INDEX {name} ON {table} ({', '.join(keys)})"))
+    return True
+
+
+def applied_versions(engine):
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                description VARCHAR(255) NOT NULL,
+                applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """))
+        return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def migrate(engine, backfills=None):
+    """
+    Apply pending migrations. A migration whose tables do not exist yet (the loaders create
+    them), or whose backfill is not among `backfills` ({name: callable}), stays pending and is
+    retried on the next start.
+    """
+    backfills = backfills or {}
+    done = applied_versions(engine)
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        if version in done:
+            continue
+        complete = True
+        with engine.begin() as conn:
+            for step in steps:
+                if step[0] == "index":
+                    complete &= _create_index(conn, *step[1:])
+                elif step[0] == "backfill":
+                    # Nothing to backfill before the table exists; its loader fills the rest
+                    if _table_exists(conn, step[1]):
+                        if step[2] in backfills:
+                            backfills[step[2]]()
+                        else:
+                            complete = False
+                else:
+                    conn.execute(text(step[1]))
+            if complete:
+                conn.execute(text("INSERT INTO schema_migrations (version, description) VALUES (:version, :description)"),
+                             {"version": version, "description": description})
+        if not complete:
+            print(f"Migration {version} ({description}) is pending: some of its tables do not exist yet "
+                  f"or its backfill was not given")
+            break
+        applied.append(version)
+    return applied
+
+
+def check_query_plans(engine, queries):
+    """
+    EXPLAIN each registered query ({name: (sql, sample params)}) and warn about full scans.
+
+    Returns {name: [warnings]} for the queries whose plan reads a whole table or index.
+    """
+    problems = {}
+    with engine.connect() as conn:
+        for name, (query, params) in queries.items():
+            try:
+                plan = [dict(row._mapping) for row in conn.execute(text(f"EXPLAIN {query}"), params)]
+            except Exception as e:
+                problems[name] = [f"EXPLAIN failed: {e}"]
+                continue
+            for step in plan:
+                step = {key.lower(): value for key, value in step.items()}
+                if step.get("type") in FULL_SCAN_TYPES:
+                    problems.setdefault(name, []).append(
+                        f"full {'table' if step['type'] == 'ALL' else 'index'} scan of {step.get('table')} "
+                        f"(~{step.get('rows')} rows, possible keys: {step.get('possible_keys')})"
+                    )
+    for name, warnings in problems.items():
+        for warning in warnings:
+            print(f"WARNING: query plan for {name}: {warning}")
+    return problems
@@ -0,0 +1,172 @@
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import Column, Date, Float, Integer, String, bindparam, text
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.schema import PrimaryKeyConstraint
+
+from sql.glucose_histograms import fraction_between, mean, merge
+
+# dietary_data columns summed into the daily rollups
+NUTRIENTS = (
+    'calories', 'calories_from_fat', 'total_fat_g', 'saturated_fat_g', 'trans_fat_g', 'monounsaturated_fat_g',
+    'polyunsaturated_fat_g', 'cholesterol_mg', 'sodium_mg', 'total_carbs_g', 'net_carbs_g', 'fiber_g', 'sugars_g',
+    'protein_g', 'weight_g', 'glycemic_load',
+)
+
+# Unbounded ends of a participant's date range
+FIRST_DATE = date(1900, 1, 1)
+LAST_DATE = date(9999, 12, 31)
+
+Base = declarative_base()
+
+
+class NutritionDaily(Base):
+    # Per-(pid, day) totals of dietary_data, rewritten for the days a food-log load touches
+    __tablename__ = 'nutrition_daily'
+
+    pid = Column(String(50), nullable=False)
+    date = Column(Date, nullable=False)
+    timepoint = Column(String(50))
+    meals = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('pid', 'date', name='nutrition_daily_pid_date_pk'),
+    )
+
+
+for _nutrient in NUTRIENTS:
+    setattr(NutritionDaily, _nutrient, Column(Float))
+
+
+def pearson(x, y):
+    """Correlation of two equally long sequences, or None with fewer than 3 pairs or no variance."""
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    keep = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[keep], y[keep]
+    if len(x) < 3 or x.std() == 0 or y.std() == 0:
+        return None
+    return float(np.corrcoef(x, y)[0, 1])
+
+
+class NutritionRollupStore:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def create_table(self):
+        Base.metadata.create_all(self.engine)
+
+    def refresh(self, pid, dates):
+        """
+        Recompute the rollups of one participant's days from dietary_data.
+
+        `dates` are the days a load wrote meals for; a day left without meals loses its rollup.
+        """
+        dates = sorted({day.isoformat() if hasattr(day, 'isoformat') else str(day) for day in dates})
+        if not dates:
+            return 0
+        sums = ",\n".join(f"SUM({nutrient})" for nutrient in NUTRIENTS)
+        delete = text(
+            "DELETE FROM nutrition_daily WHERE pid = :pid AND date IN :dates"
+        ).bindparams(bindparam('dates', expanding=True))
+        insert = text(f"""
+            INSERT INTO nutrition_daily (pid, date, timepoint, meals, {', '.join(NUTRIENTS)})
+            SELECT
+                pid,
+                DATE(date),
+                MAX(timepoint),
+                COUNT(*),
+                {sums}
+            FROM dietary_data
+            WHERE pid = :pid AND date IN :dates
+            GROUP BY pid, DATE(date)
+        """).bindparams(bindparam('dates', expanding=True))
+        with self.engine.begin() as conn:
+            conn.execute(delete, {'pid': pid, 'dates': dates})
+            return conn.execute(insert, {'pid': pid, 'dates': dates}).rowcount
+
+    def backfill(self, pid=None):
+        """Build rollups for the meals already in dietary_data, one participant at a time."""
+        with self.engine.connect() as conn:
+            if pid is None:
+                pids = [row[0] for row in conn.execute(text("SELECT DISTINCT pid FROM dietary_data"))]
+            else:
+                pids = [pid]
+        for current_pid in pids:
+            with self.engine.connect() as conn:
+                dates = [row[0] for row in conn.execute(text(
+                    "SELECT DISTINCT date FROM dietary_data WHERE pid = :pid AND date IS NOT NULL"
+                ), {'pid': current_pid})]
+            self.refresh(current_pid, dates)
+        return len(pids)
+
+    def cohort_intake(self, where="", params=None):
+        """
+        Average daily intake per participant and per calendar day over the filtered rollups
+        (`where` from CohortFilter.where on pid, timepoint and date).
+        """
+        averages = ",\n".join(f"AVG({nutrient}) AS {nutrient}" for nutrient in NUTRIENTS)
+        with self.engine.connect() as conn:
+            participants = [dict(row._mapping) for row in conn.execute(text(f"""
+                SELECT pid, COUNT(*) AS days, AVG(meals) AS meals, {averages}
+                FROM nutrition_daily
+                {where}
+                GROUP BY pid
+                ORDER BY pid
+            """), params or {})]
+            days = [dict(row._mapping) for row in conn.execute(text(f"""
+                SELECT date, COUNT(*) AS participants, AVG(meals) AS meals, {averages}
+                FROM nutrition_daily
+                {where}
+                GROUP BY date
+                ORDER BY date
+            """), params or {})]
+        return {"participants": participants, "days": days}
+
+    def diet_glucose(self, histograms, filters):
+        """
+        Daily glycemic load, carbohydrate and calories next to that day's mean glucose and time
+        in range (70-180 mg/dL), joined on (pid, date) from the nutrition and glucose rollups.
+        """
+        where, params = filters.where(pid="pid", timepoint="timepoint", date="date")
+        with self.engine.connect() as conn:
+            days = [dict(row._mapping) for row in conn.execute(text(f"""
+                SELECT pid, date, meals, glycemic_load, total_carbs_g, calories
+                FROM nutrition_daily
+                {where}
+                ORDER BY pid, date
+            """), params)]
+        pids = sorted({day['pid'] for day in days})
+        start = filters.start or (min(day['date'] for day in days) if days else None)
+        end = filters.end or (max(day['date'] for day in days) if days else None)
+        glucose = {}
+        if pids:
+            for pid, day_histograms in histograms.load(pids, start, end).items():
+                for day in day_histograms:
+                    total = merge([(day.low, day.counts)])
+                    glucose[(pid, day.date)] = (int(day.counts.sum()), mean(total), fraction_between(total, 70, 180))
+
+        rows = []
+        for day in days:
+            n_readings, mean_glucose, time_in_range = glucose.get((day['pid'], day['date']), (0, None, None))
+            rows.append({**day, "n_readings": n_readings, "mean_glucose": mean_glucose, "time_in_range": time_in_range})
+        with_glucose = [row for row in rows if row["n_readings"]]
+        return {
+            "data": rows,
+            "correlation": {
+                "glycemic_load_vs_mean_glucose": pearson(
+                    [row["glycemic_load"] for row in with_glucose], [row["mean_glucose"] for row in with_glucose]
+                ),
+                "glycemic_load_vs_time_in_range": pearson(
+                    [row["glycemic_load"] for row in with_glucose], [row["time_in_range"] for row in with_glucose]
+                ),
+            },
+        }
+
+
+def participant_range(start=None, end=None):
+    """Bind values of the registered per-participant query; `end` is inclusive."""
+    return {
+        "start": start or FIRST_DATE,
+        "end": (end + timedelta(days=1)) if end else LAST_DATE,
+    }
@@ -0,0 +1,297 @@
+from collections import namedtuple
+
+from sqlalchemy import Date, DateTime, String, bindparam, text
+
+from sql.nutrition import NUTRIENTS
+
+
+class RegisteredQuery:
+    """
+    One SQL statement defined once, with its bind parameters, result columns and record type.
+
+    Parameters:
+    -----------
+    name : str
+        Registry key, also used in EXPLAIN warnings
+    sql : str
+        Statement text with :named binds
+    binds : dict
+        Bind name -> SQLAlchemy type
+    columns : tuple
+        Result column names, in order; rows are returned as namedtuples with these fields
+    expanding : tuple
+        Binds that take a list (`IN :pids`); such statements are compiled per call
+    explain : dict
+        Sample bind values for the startup EXPLAIN check, or None to skip it
+    """
+
+    __slots__ = ("name", "sql", "binds", "columns", "expanding", "explain", "record", "statement", "compiled")
+
+    def __init__(self, name, sql, binds=None, columns=(), expanding=(), explain=None):
+        self.name = name
+        self.sql = sql
+        self.binds = dict(binds or {})
+        self.columns = tuple(columns)
+        self.expanding = tuple(expanding)
+        self.explain = explain
+        self.record = namedtuple(name.title().replace("-", "").replace(" ", "") + "Row", self.columns)
+        self.statement = text(sql).bindparams(*[
+            bindparam(bind, type_=type_, expanding=bind in self.expanding) for bind, type_ in self.binds.items()
+        ])
+        self.compiled = None
+
+    def compile(self, dialect):
+        # Compiled once; later calls send the dialect's SQL string straight to the driver
+        if not self.expanding:
+            self.compiled = self.statement.compile(dialect=dialect)
+
+    def check_params(self, params):
+        missing = set(self.binds) - set(params)
+        unexpected = set(params) - set(self.binds)
+        if missing or unexpected:
+            raise ValueError(
+                f"Query {self.name} takes binds {sorted(self.binds)}; missing {sorted(missing)}, unexpected {sorted(unexpected)}"
+            )
+
+    def execute(self, conn, params=None):
+        params = params or {}
+        self.check_params(params)
+        compiled = self.compiled
+        if compiled is None or compiled.dialect.name != conn.dialect.name:
+            return conn.execute(self.statement, params)
+        bind = compiled.construct_params(params)
+        if compiled.positiontup is not None:
+            bind = tuple(bind[name] for name in compiled.positiontup)
+        return conn.exec_driver_sql(compiled.string, bind)
+
+    def records(self, result):
+        """Rows of `result` as records, after checking the statement returned the declared columns."""
+        keys = tuple(result.keys())
+        if keys != self.columns:
+            raise ValueError(f"Query {self.name} returned columns {list(keys)}, expected {list(self.columns)}")
+        make = self.record._make
+        return [make(row) for row in result]
+
+
+class QueryRegistry:
+    def __init__(self):
+        self.queries = {}
+
+    def register(self, name, sql, binds=None, columns=(), expanding=(), explain=None):
+        if name in self.queries:
+            raise ValueError(f"Query {name} is already registered")
+        query = self.queries[name] = RegisteredQuery(name, sql, binds, columns, expanding, explain)
+        return query
+
+    def __getitem__(self, name):
+        return self.queries[name]
+
+    def compile(self, dialect):
+        """Compile every statement for `dialect` (at startup, so requests skip parsing and compilation)."""
+        for query in self.queries.values():
+            query.compile(dialect)
+
+    def plan_checks(self):
+        """{name: (sql, sample params)} of the queries to EXPLAIN at startup (see sql/migrations.py)."""
+        return {name: (query.sql, query.explain) for name, query in self.queries.items() if query.explain is not None}
+
+
+QUERIES = QueryRegistry()
+
+SAMPLE_PID = {"pid": "0"}
+SAMPLE_DAY = {"pid": "0", "start": "2024-01-01", "end": "2024-01-02"}
+
+# Per-participant pages
+
+PARTICIPANT_DAY_SUMMARY = QUERIES.register("participant-day-summary", """
+    SELECT
+        calendar_date,
+        dur_day_total_IN_min,
+        dur_day_total_LIG_min,
+        dur_day_total_MOD_min,
+        dur_day_total_VIG_min,
+        dur_spt_min,
+        nonwear_perc_day_spt
+    FROM day_summary
+    WHERE pid = :pid
+""", binds={"pid": String}, columns=(
+    "calendar_date", "dur_day_total_IN_min", "dur_day_total_LIG_min", "dur_day_total_MOD_min",
+    "dur_day_total_VIG_min", "dur_spt_min", "nonwear_perc_day_spt",
+), explain=SAMPLE_PID)
+
+SLEEP_DATA = QUERIES.register("sleep-data", """
+    SELECT
+        calendar_date,
+        sleeponset_ts,
+        wakeup_ts,
+        sleep_efficiency_after_onset
+    FROM day_summary
+    WHERE pid = :pid
+""", binds={"pid": String}, columns=(
+    "calendar_date", "sleeponset_ts", "wakeup_ts", "sleep_efficiency_after_onset",
+), explain=SAMPLE_PID)
+
+# The bare column is selected (and reduced to its date part in Python) so the distinct values
+# come straight off the (pid, calendar_date) index
+PARTICIPANT_DATES = QUERIES.register("participant-dates", """
+    SELECT DISTINCT calendar_date
+    FROM wear_time
+    WHERE pid = :pid
+    ORDER BY calendar_date
+""", binds={"pid": String}, columns=("calendar_date",), explain=SAMPLE_PID)
+
+WEAR_TIME = QUERIES.register("wear-time", """
+    SELECT
+        calendar_date,
+        day,
+        recorded_wear_time_hrs
+    FROM wear_time
+    WHERE pid = :pid
+    ORDER BY calendar_date
+""", binds={"pid": String}, columns=("calendar_date", "day", "recorded_wear_time_hrs"), explain=SAMPLE_PID)
+
+SLEEP_HOURS_EFFICIENCY = QUERIES.register("sleep-hours-efficiency", """
+    SELECT
+        calendar_date,
+        dur_spt_sleep_min / 60 AS sleep_hours,
+        sleeponset_ts,
+        wakeup_ts,
+        sleep_efficiency_after_onset
+    FROM day_summary
+    WHERE pid = :pid
+    ORDER BY calendar_date
+""", binds={"pid": String}, columns=(
+    "calendar_date", "sleep_hours", "sleeponset_ts", "wakeup_ts", "sleep_efficiency_after_onset",
+), explain=SAMPLE_PID)
+
+# One day as a half-open range on the (pid, timestamp) index
+ACTIVITY_SLEEP_TRACE = QUERIES.register("activity-sleep-trace", """
+    SELECT
+        timestamp,
+        sedentary,
+        light,
+        moderate_vigorous,
+        sleep
+    FROM minute_level_data
+    WHERE pid = :pid
+    AND timestamp >= :start AND timestamp < :end
+    ORDER BY timestamp
+""", binds={"pid": String, "start": DateTime, "end": DateTime}, columns=(
+    "timestamp", "sedentary", "light", "moderate_vigorous", "sleep",
+), explain=SAMPLE_DAY)
+
+# Meals of one day; `date` holds ISO date strings, so the half-open range compares in date
+# order and can use the (pid, date) index
+FOOD_LOG = QUERIES.register("food-log", """
+    SELECT
+        timestamp AS meal_timestamp,
+        total_carbs_g,
+        total_fat_g,
+        protein_g,
+        raw_data,
+        calories,
+        glycemic_load
+    FROM
+        dietary_data
+    WHERE
+        pid = :pid
+        AND date >= :start AND date < :end
+    ORDER BY
+        meal_timestamp
+""", binds={"pid": String, "start": String, "end": String}, columns=(
+    "meal_timestamp", "total_carbs_g", "total_fat_g", "protein_g", "raw_data", "calories", "glycemic_load",
+), explain=SAMPLE_DAY)
+
+# Daily nutrition totals of one participant (sql/nutrition.py), over a half-open date range
+PARTICIPANT_NUTRITION = QUERIES.register("participant-nutrition", f"""
+    SELECT date, timepoint, meals, {', '.join(NUTRIENTS)}
+    FROM nutrition_daily
+    WHERE pid = :pid
+    AND date >= :start AND date < :end
+    ORDER BY date
+""", binds={"pid": String, "start": Date, "end": Date}, columns=("date", "timepoint", "meals", *NUTRIENTS),
+    explain=SAMPLE_DAY)
+
+# Daily averages from the row table, for participants whose CGM data is not packed yet
+DAILY_AVG_GLUCOSE = QUERIES.register("daily-avg-glucose", """
+    SELECT
+        DATE(STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i')) AS date,
+        AVG(historic_glucose_mg_dl) AS avg_glucose
+    FROM
+        cgm_data
+    WHERE
+        pid = :pid
+    GROUP BY
+        DATE(STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i'))
+    ORDER BY
+        DATE(STR_TO_DATE(device_timestamp, '%m-%d-%Y %H:%i'))
+""", binds={"pid": String}, columns=("date", "avg_glucose"), explain=SAMPLE_PID)
+
+# Cohort lists and QC pages
+
+PIDS = QUERIES.register("pids", """
+    SELECT DISTINCT pid FROM wear_time
+""", columns=("pid",))
+
+PARTICIPANT_TRENDS = QUERIES.register("participant-trends", """
+    SELECT
+        pid,
+        calendar_date,
+        recorded_wear_time_hrs
+    FROM wear_time
+    WHERE pid IN :pids
+    ORDER BY pid, calendar_date
+""", binds={"pids": String}, expanding=("pids",), columns=("pid", "calendar_date", "recorded_wear_time_hrs"))
+
+QC_DASHBOARD = QUERIES.register("qc-dashboard", """
+    SELECT
+        pid,
+        file_size,
+        file_deviceID,
+        file_startTime,
+        file_endTime,
+        data_wearTime_overall_days,
+        data_nonWearTime_overall_days,
+        data_quality_goodCalibration
+    FROM ukb_summary
+""", columns=(
+    "pid", "file_size", "file_deviceID", "file_startTime", "file_endTime", "data_wearTime_overall_days",
+    "data_nonWearTime_overall_days", "data_quality_goodCalibration",
+))
+
+# The four QC aggregates in one pass over summary_data
+QC_METRICS = QUERIES.register("qc-metrics", """
+    SELECT
+        COUNT(*) AS total_files,
+        AVG(wearTime_overall) AS avg_wear_time,
+        AVG(file_size) AS avg_file_size,
+        AVG(nonWearTime_overall) AS avg_non_wear_time
+    FROM summary_data
+""", columns=("total_files", "avg_wear_time", "avg_file_size", "avg_non_wear_time"))
+
+WEAR_VS_NONWEAR = QUERIES.register("wear-vs-nonwear", """
+    SELECT
+        pid,
+        wearTime_overall,
+        nonWearTime_overall
+    FROM summary_data
+""", columns=("pid", "wearTime_overall", "nonWearTime_overall"))
+
+CALIBRATION_CHECK = QUERIES.register("calibration-check", """
+    SELECT
+        participant_id,
+        data_quality_goodCalibration
+    FROM ukb_summary
+    WHERE data_quality_goodCalibration = 1
+""", columns=("participant_id", "data_quality_goodCalibration"))
+
+FILE_METADATA = QUERIES.register("file-metadata", """
+    SELECT
+        pid,
+        file_name,
+        file_deviceID,
+        file_size,
+        file_startTime,
+        file_endTime
+    FROM summary_data
+""", columns=("pid", "file_name", "file_deviceID", "file_size", "file_startTime", "file_endTime"))
@@ -0,0 +1,183 @@
+import asyncio
+import threading
+import time
+from contextvars import ContextVar
+
+from fastapi import Depends, Request
+from sqlalchemy import event
+
+# MySQL error codes raised when a statement is stopped
+ER_QUERY_INTERRUPTED = 1317  # KILL QUERY
+ER_QUERY_TIMEOUT = 3024  # MAX_EXECUTION_TIME exceeded
+
+
+class QueryInterrupted(Exception):
+    status_code = 500
+
+
+class QueryTimeout(QueryInterrupted):
+    status_code = 504
+
+
+class QueryCancelled(QueryInterrupted):
+    # nginx's "client closed request"; the client is gone so nobody reads it
+    status_code = 499
+
+
+class QueryControl:
+    """
+    Deadline and cancellation state of the statements run for one request.
+
+    Every connection the request checks out (see enforce_deadlines) gets `deadline_ms` as
+    its session's MAX_EXECUTION_TIME and is registered while checked out, so `cancel` can
+    stop its statements with KILL QUERY from another connection. The connection stays
+    usable and goes back to the pool when it is released.
+    """
+
+    def __init__(self, deadline_ms=None):
+        self.deadline_ms = deadline_ms
+        self.started = time.monotonic()
+        self.reason = None  # None, "timeout" or "disconnect"
+        self._connections = set()
+        self._lock = threading.Lock()
+
+    def remaining_ms(self):
+        if self.deadline_ms is None:
+            return None
+        return max(int(self.deadline_ms - (time.monotonic() - self.started) * 1000), 1)
+
+    def error(self):
+        """The exception for the reason statements were stopped, or None while they may run."""
+        if self.reason == "disconnect":
+            return QueryCancelled("Client disconnected, query cancelled")
+        if self.reason == "timeout":
+            return QueryTimeout(f"Query exceeded its {self.deadline_ms} ms deadline")
+        return None
+
+    def check(self):
+        error = self.error()
+        if error is not None:
+            raise error
+
+    def interrupted(self, error):
+        """Translate the driver error of a killed or timed out statement."""
+        code = getattr(getattr(error, "orig", error), "errno", None)
+        if code == ER_QUERY_TIMEOUT:
+            return QueryTimeout(f"Query exceeded its {self.deadline_ms} ms deadline")
+        if code == ER_QUERY_INTERRUPTED:
+            return self.error()
+        return None
+
+    def register(self, connection_id):
+        with self._lock:
+            self._connections.add(connection_id)
+
+    def unregister(self, connection_id):
+        with self._lock:
+            self._connections.discard(connection_id)
+
+    def cancel(self, reason, kill_query):
+        # The lock is held through the kills: a connection is unregistered before it goes back
+        # to the pool, so it cannot be handed to another request and have that one's statement killed
+        with self._lock:
+            self.reason = self.reason or reason
+            for connection_id in self._connections:
+                kill_query(connection_id)
+
+
+def enforce_deadlines(engine):
+    """
+    Apply the current request's QueryControl to every connection `engine` checks out.
+
+    Stores that use the engine directly (packed series, histograms, rollups) get the same
+    deadline and cancellation as MySQLDatabase sessions: MAX_EXECUTION_TIME is set and the
+    connection registered on checkout, and both are undone on checkin. Statements are not
+    started once the request is cancelled, and killed or timed out ones raise QueryInterrupted.
+    """
+
+    @event.listens_for(engine, "checkout")
+    def checkout(dbapi_connection, record, proxy):
+        control = current_query_control.get()
+        if control is None:
+            return
+        connection_id = getattr(dbapi_connection, "connection_id", None)
+        remaining_ms = control.remaining_ms()
+        cursor = dbapi_connection.cursor()
+        try:
+            if connection_id is None:
+                cursor.execute("SELECT CONNECTION_ID()")
+                connection_id = cursor.fetchone()[0]
+            if remaining_ms is not None:
+                cursor.execute(f"SET SESSION MAX_EXECUTION_TIME = {remaining_ms}")
+        finally:
+            cursor.close()
+        control.register(connection_id)
+        record.info["query_control"] = (control, connection_id, remaining_ms is not None)
+
+    @event.listens_for(engine, "checkin")
+    def checkin(dbapi_connection, record):
+        entry = record.info.pop("query_control", None)
+        if entry is None:
+            return
+        control, connection_id, limited = entry
+        control.unregister(connection_id)
+        if limited and dbapi_connection is not None:
+            try:
+                cursor = dbapi_connection.cursor()
+                cursor.execute("SET SESSION MAX_EXECUTION_TIME = 0")
+                cursor.close()
+            except Exception:
+                # A broken connection is discarded by the pool
+                pass
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def check(conn, cursor, statement, parameters, context, executemany):
+        control = current_query_control.get()
+        if control is not None:
+            control.check()
+
+    # Returned rather than raised, so the engine's other handle_error listeners still run
+    @event.listens_for(engine, "handle_error", retval=True)
+    def translate(context):
+        control = current_query_control.get()
+        if control is not None:
+            return control.interrupted(context.original_exception)
+        return None
+
+
+current_query_control = ContextVar("current_query_control", default=None)
+
+
+def statement_deadline(database, deadline_ms, poll_seconds=0.25):
+    """
+    Route dependency enforcing a statement deadline and cancelling on client disconnect.
+
+    The handler must be a plain `def` so FastAPI runs it in the threadpool: the control set
+    here is copied into that thread's context, while the watcher keeps running on the event
+    loop and kills the in-flight query when the client goes away or the deadline passes.
+    """
+
+    async def dependency(request: Request):
+        control = QueryControl(deadline_ms)
+        current_query_control.set(control)
+        watcher = asyncio.create_task(_watch(request, control, database, poll_seconds))
+        try:
+            yield control
+        finally:
+            watcher.cancel()
+
+    return Depends(dependency)
+
+
+async def _watch(request, control, database, poll_seconds):
+    while True:
+        await asyncio.sleep(poll_seconds)
+        if await request.is_disconnected():
+            reason = "disconnect"
+        elif control.deadline_ms is not None and (time.monotonic() - control.started) * 1000 > control.deadline_ms:
+            # Covers handlers running several statements that are each under the limit
+            reason = "timeout"
+        else:
+            continue
+        await asyncio.to_thread(control.cancel, reason, database.kill_query)
+        return
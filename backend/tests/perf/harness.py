@@ -0,0 +1,127 @@
+import json
+import math
+import time
+from collections import namedtuple
+
+from sqlalchemy import event, text
+
+# One request per route: `route` is the "METHOD /path/{template}" it exercises, `url` the concrete request
+RouteCase = namedtuple("RouteCase", ["route", "url", "json"], defaults=[None])
+
+# Server status counters read around each request. Com_* count the statements the API sent,
+# whatever the client path (ORM session, engine connection or the raw export cursor);
+# Innodb_rows_read counts the rows the storage engine handed to the server for them
+STATEMENT_COUNTERS = ("Com_select", "Com_insert", "Com_update", "Com_delete", "Com_replace")
+ROWS_COUNTER = "Innodb_rows_read"
+
+# Session bookkeeping (deadlines, connection ids) is not part of a route's query budget
+BOOKKEEPING_PREFIXES = ("SET ", "SHOW ", "KILL ", "SELECT CONNECTION_ID()")
+
+
+def case_id(case):
+    method = case.route.split(" ", 1)[0]
+    return f"{method} {case.url}"
+
+
+class ServerCounters:
+    """Snapshots of the global status counters from a connection of its own."""
+
+    def __init__(self, engine):
+        self.conn = engine.connect()
+        names = ", ".join(f"'{name}'" for name in (*STATEMENT_COUNTERS, ROWS_COUNTER))
+        self.query = text(f"SHOW GLOBAL STATUS WHERE Variable_name IN ({names})")
+
+    def snapshot(self):
+        return {name: int(value) for name, value in self.conn.execute(self.query)}
+
+    def close(self):
+        self.conn.close()
+
+
+class StatementRecorder:
+    """Statements (with their DBAPI parameters) run through `engine` while recording, for EXPLAIN."""
+
+    def __init__(self, engine):
+        self.statements = None
+        event.listen(engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if self.statements is not None and not statement.lstrip().upper().startswith(BOOKKEEPING_PREFIXES):
+            self.statements.append((statement, parameters))
+
+    def start(self):
+        self.statements = []
+
+    def stop(self):
+        statements, self.statements = self.statements, None
+        return statements
+
+
+def full_scans(engine, statements):
+    """Tables read with a full table or index scan ("ALL"/"index" in EXPLAIN) by the recorded SELECTs."""
+    scans = []
+    with engine.connect() as conn:
+        for statement, parameters in statements:
+            if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+                continue
+            result = conn.exec_driver_sql("EXPLAIN " + statement, parameters or ())
+            columns = list(result.keys())
+            for row in result:
+                plan = dict(zip(columns, row))
+                if plan.get("type") in ("ALL", "index") and plan.get("table"):
+                    scans.append(f"{plan['table']} ({plan['type']}, ~{plan.get('rows')} rows)")
+    return scans
+
+
+Measurement = namedtuple("Measurement", ["statements", "rows_examined", "latency_ms", "status", "full_scans"])
+
+
+def measure(client, case, counters, recorder, explain_engine):
+    """Run one request and return what it cost on the server."""
+    recorder.start()
+    before = counters.snapshot()
+    started = time.perf_counter()
+    if case.json is not None:
+        response = client.request(case.route.split(" ", 1)[0], case.url, json=case.json)
+    else:
+        response = client.request(case.route.split(" ", 1)[0], case.url)
+    latency_ms = (time.perf_counter() - started) * 1000
+    after = counters.snapshot()
+    statements = recorder.stop()
+    return Measurement(
+        statements=sum(after[name] - before[name] for name in STATEMENT_COUNTERS),
+        rows_examined=after[ROWS_COUNTER] - before[ROWS_COUNTER],
+        latency_ms=round(latency_ms, 1),
+        status=response.status_code,
+        full_scans=full_scans(explain_engine, statements),
+    )
+
+
+# Key of budgets.json recording the server the budgets were measured on
+MEASURED_ON = "_measured_on"
+
+
+def load_budgets(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def derived_budget(measurement):
+    """Budget written by PERF_UPDATE_BUDGETS: exact statement count, headroom on rows and latency."""
+    return {
+        "statements": measurement.statements,
+        "rows_examined": int(math.ceil(measurement.rows_examined * 1.5)) + 50,
+        "latency_ms": max(100, int(math.ceil(measurement.latency_ms * 3 / 50)) * 50),
+    }
+
+
+def server_version(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT VERSION()")).scalar()
+
+
+def write_budgets(path, measurements, measured_on):
+    budgets = {MEASURED_ON: measured_on, **{key: derived_budget(m) for key, m in sorted(measurements.items())}}
+    with open(path, "w") as f:
+        json.dump(budgets, f, indent=2)
+        f.write("\n")
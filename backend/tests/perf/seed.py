@@ -0,0 +1,143 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+from extract.cgm import Base as CGMBase, CGMData
+from extract.ggir import Base as GGIRBase, DaySummary, MinuteLevelData, WearTime
+from extract.ukb_summary import Base as UKBBase, SummaryData, UKBSummary
+from sql.cohort_filter import create_table as create_group_table, set_group
+from sql.glucose_series import CGM_TIMESTAMP_FORMAT
+from sql.migrations import MIGRATIONS, applied_versions, migrate
+from sql.nutrition import NUTRIENTS, NutritionRollupStore
+
+# Deterministic study the route budgets in budgets.json were set against: every participant
+# has the same amount of data, so a per-participant route that scans a whole table reads
+# PARTICIPANTS times its budget and fails
+PARTICIPANTS = [f"P{i:02d}" for i in range(1, 9)]
+TIMEPOINT = "Baseline"
+FIRST_DAY = date(2024, 3, 4)
+DAYS = 3
+CGM_INTERVAL_MINUTES = 15
+MEALS = ((8, 0), (12, 30), (19, 0))
+GROUP = ("perf", PARTICIPANTS[:4])
+
+
+def scratch_database_name(url):
+    """The database of `url`, refusing anything that does not look like a throwaway one."""
+    name = make_url(url).database
+    if not name or not any(marker in name.lower() for marker in ("perf", "test")):
+        raise ValueError(f"PERF_DATABASE_URL must name a scratch database containing 'perf' or 'test', got '{name}'")
+    return name
+
+
+def recreate_database(url):
+    """Drop and recreate the scratch database, so each run starts from the same tables and statistics."""
+    name = scratch_database_name(url)
+    server = create_engine(make_url(url).set(database=None))
+    try:
+        with server.begin() as conn:
+            conn.execute(text(f"DROP DATABASE IF EXISTS `{name}`"))
+            conn.execute(text(f"CREATE DATABASE `{name}`"))
+    finally:
+        server.dispose()
+
+
+def days():
+    return [FIRST_DAY + timedelta(days=i) for i in range(DAYS)]
+
+
+def glucose_profile(pid_index, minutes):
+    # Diurnal curve dipping under 70 before dawn and peaking over 180 after meals
+    return np.round(125 + 65 * np.sin(2 * np.pi * (minutes - 360) / 1440) + 5 * pid_index).astype(int)
+
+
+def seed(engine, series_store, partitions):
+    """Create every table the API reads and fill it with the deterministic study above."""
+    for base in (CGMBase, GGIRBase, UKBBase):
+        base.metadata.create_all(engine)
+    series_store.create_table()
+    partitions.create_table()
+    create_group_table(engine)
+    rollups = NutritionRollupStore(engine)
+    rollups.create_table()
+
+    cgm_rows, minute_rows, day_rows, wear_rows, meal_rows, summary_rows, ukb_rows = [], [], [], [], [], [], []
+    for index, pid in enumerate(PARTICIPANTS):
+        timestamps, readings = [], []
+        for day in days():
+            start = datetime.combine(day, datetime.min.time())
+            minutes = np.arange(0, 24 * 60, CGM_INTERVAL_MINUTES)
+            glucose = glucose_profile(index, minutes)
+            for minute, value in zip(minutes.tolist(), glucose.tolist()):
+                timestamp = start + timedelta(minutes=minute)
+                timestamps.append(timestamp)
+                readings.append(value)
+                cgm_rows.append({
+                    "pid": pid, "timepoint": TIMEPOINT, "device_timestamp": timestamp.strftime(CGM_TIMESTAMP_FORMAT),
+                    "device": "FreeStyle Libre", "serial_number": f"SN-{pid}", "record_type": 0,
+                    "historic_glucose_mg_dl": value,
+                })
+            for minute in range(24 * 60):
+                asleep = minute < 7 * 60 or minute >= 23 * 60
+                minute_rows.append({
+                    "pid": pid, "timestamp": start + timedelta(minutes=minute),
+                    "sedentary": 0.0 if asleep else float(minute % 3 == 0), "light": 0.0 if asleep else float(minute % 3 == 1),
+                    "moderate_vigorous": 0.0 if asleep else float(minute % 3 == 2), "sleep": float(asleep),
+                })
+            day_rows.append({
+                "pid": pid, "calendar_date": day, "dur_day_total_IN_min": 600.0, "dur_day_total_LIG_min": 240.0,
+                "dur_day_total_MOD_min": 40.0, "dur_day_total_VIG_min": 10.0, "dur_spt_min": 480.0,
+                "dur_spt_sleep_min": 430.0 - index, "nonwear_perc_day_spt": 2.0, "sleeponset_ts": "23:00:00",
+                "wakeup_ts": "07:00:00", "sleep_efficiency_after_onset": 0.9 - index / 100,
+            })
+            wear_rows.append({
+                "pid": pid, "calendar_date": start, "day": day.strftime("%A"), "recorded_wear_time_hrs": 20.0 + index / 4,
+            })
+            for hour, minute in MEALS:
+                meal_time = start + timedelta(hours=hour, minutes=minute)
+                meal_rows.append({
+                    **dict.fromkeys(NUTRIENTS, 0.0), "pid": pid, "timepoint": TIMEPOINT, "date": day.isoformat(), "day": day.strftime("%A"),
+                    "time": meal_time.time(), "timestamp": meal_time, "calories": 550.0, "total_carbs_g": 60.0,
+                    "total_fat_g": 20.0, "protein_g": 25.0, "raw_data": "seeded meal", "glycemic_load": 18.0,
+                })
+        series_store.write_readings(pid, TIMEPOINT, pd.Series(timestamps), pd.Series(readings),
+                                    device="FreeStyle Libre", serial_number=f"SN-{pid}")
+
+        file_start = datetime.combine(FIRST_DAY, datetime.min.time())
+        file_end = file_start + timedelta(days=DAYS)
+        summary_rows.append({
+            "pid": pid, "file_name": f"{pid}.cwa", "file_size": 250_000_000 + index, "file_deviceID": f"AX-{pid}",
+            "file_startTime": file_start, "file_endTime": file_end, "file_timezone": "Europe/London",
+            "totalReads": 25_920_000, "wearTime_overall": 2.8, "nonWearTime_overall": 0.2,
+            "quality_goodCalibration": 1, "quality_daylightSavingsCrossover": 0,
+        })
+        ukb_rows.append({
+            "pid": pid, "participant_id": pid, "date": FIRST_DAY.isoformat(), "file_name": f"{pid}.cwa",
+            "file_size": 250_000_000 + index, "file_deviceID": f"AX-{pid}", "file_startTime": file_start,
+            "file_endTime": file_end, "file_timezone": "Europe/London", "data_totalReads": 25_920_000,
+            "data_wearTime_overall_days": 2.8, "data_nonWearTime_overall_days": 0.2,
+            "data_quality_goodCalibration": 1, "data_quality_daylightSavingsCrossover": 0,
+        })
+
+    with engine.begin() as conn:
+        for table, rows in ((CGMData, cgm_rows), (MinuteLevelData, minute_rows), (DaySummary, day_rows),
+                            (WearTime, wear_rows), (SummaryData, summary_rows), (UKBSummary, ukb_rows)):
+            conn.execute(table.__table__.insert(), rows)
+    # dietary_data has no model; it is created by pandas as in extract/foodLog.py
+    pd.DataFrame(meal_rows).to_sql("dietary_data", con=engine, if_exists="append", index=False)
+    rollups.backfill()
+
+    set_group(engine, *GROUP)
+    migrate(engine, {"packed_series": series_store.backfill_missing})
+    pending = {version for version, _, _ in MIGRATIONS} - applied_versions(engine)
+    if pending:
+        # Budgets measured without the indexes would bless full scans
+        raise RuntimeError(f"Migrations {sorted(pending)} did not apply to the seeded database")
+    with engine.begin() as conn:
+        # Fresh index statistics, so plans match a loaded database rather than empty tables
+        for table in ("cgm_data", "minute_level_data", "day_summary", "wear_time", "dietary_data", "cgm_series"):
+            conn.execute(text(f"ANALYZE TABLE {table}"))
+    partitions.refresh()
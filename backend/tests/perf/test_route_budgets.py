@@ -0,0 +1,121 @@
+import os
+import warnings
+from datetime import timedelta
+
+import pytest
+from fastapi.routing import APIRoute
+
+from harness import RouteCase, case_id, measure
+from seed import FIRST_DAY, GROUP, PARTICIPANTS
+
+PID = PARTICIPANTS[0]
+DAY = FIRST_DAY.isoformat()
+SECOND_DAY = (FIRST_DAY + timedelta(days=1)).isoformat()
+STUDY = os.environ.get("DEFAULT_STUDY", "default")
+
+CASES = [
+    # Cohort dashboards, computed on demand (the precompute caches are cleared before each request)
+    RouteCase("GET /days-worn", "/days-worn"),
+    RouteCase("GET /cgm-metrics", "/cgm-metrics"),
+    RouteCase("GET /cgm-metrics", f"/cgm-metrics?pids={PID}"),
+    RouteCase("GET /cgm-metrics", f"/cgm-metrics?group={GROUP[0]}"),
+    RouteCase("GET /cgm-metrics", "/cgm-metrics?approx=true"),
+    RouteCase("GET /participant-time-in-ranges", "/participant-time-in-ranges"),
+    RouteCase("GET /participant-time-in-ranges", f"/participant-time-in-ranges?pids={PID}&from={DAY}&to={DAY}"),
+    RouteCase("GET /qa-dashboard", "/qa-dashboard"),
+    RouteCase("GET /glucose-histogram", f"/glucose-histogram?pids={PID}"),
+    RouteCase("GET /nutrition/daily", "/nutrition/daily"),
+    RouteCase("GET /nutrition/diet-glucose", "/nutrition/diet-glucose"),
+    RouteCase("GET /qc-dashboard", "/qc-dashboard"),
+    RouteCase("GET /qc-metrics", "/qc-metrics"),
+    RouteCase("GET /wear-vs-nonwear", "/wear-vs-nonwear"),
+    RouteCase("GET /calibration-check", "/calibration-check"),
+    RouteCase("GET /file-metadata", "/file-metadata"),
+    RouteCase("GET /wear-time-boxplot", "/wear-time-boxplot"),
+    RouteCase("GET /avg-sleep-boxplot", "/avg-sleep-boxplot"),
+    RouteCase("GET /file-size-boxplot", "/file-size-boxplot"),
+    RouteCase("GET /pids", "/pids"),
+    RouteCase("GET /groups", "/groups"),
+    RouteCase("PUT /groups/{name}", f"/groups/{GROUP[0]}", json={"pids": GROUP[1]}),
+    RouteCase("POST /participant-trends", "/participant-trends", json={"pids": PARTICIPANTS[:2]}),
+    RouteCase("POST /agp/cohort", "/agp/cohort", json={"pids": PARTICIPANTS[:2], "start": DAY, "end": SECOND_DAY}),
+    # Per-participant pages: these must stay proportional to one participant's data
+    RouteCase("GET /participant/{pid}", f"/participant/{PID}"),
+    RouteCase("GET /participant/{pid}/sleep-data", f"/participant/{PID}/sleep-data"),
+    RouteCase("GET /participant/{pid}/dates", f"/participant/{PID}/dates"),
+    RouteCase("GET /participant/{pid}/wear-time", f"/participant/{PID}/wear-time"),
+    RouteCase("GET /participant/{pid}/sleep-hours-efficiency", f"/participant/{PID}/sleep-hours-efficiency"),
+    RouteCase("GET /participant/{pid}/activity-sleep-trace", f"/participant/{PID}/activity-sleep-trace?date={DAY}"),
+    RouteCase("GET /participant/{pid}/daily-avg-glucose", f"/participant/{PID}/daily-avg-glucose"),
+    # Same page through the study prefix: routing adds no statements
+    RouteCase("GET /participant/{pid}", f"/studies/{STUDY}/participant/{PID}"),
+    RouteCase("GET /participant/{pid}/nutrition", f"/participant/{PID}/nutrition?from={DAY}&to={SECOND_DAY}"),
+    RouteCase("GET /participant/{pid}/hourly-glucose/{date}", f"/participant/{PID}/hourly-glucose/{DAY}"),
+    RouteCase("GET /participant/{pid}/agp", f"/participant/{PID}/agp"),
+    RouteCase("GET /participant/{pid}/series/{source}", f"/participant/{PID}/series/cgm?bucket=1h"),
+    RouteCase("GET /participant/{pid}/series/{source}",
+              f"/participant/{PID}/series/minute_level?bucket=15m&from={DAY}T00:00:00&to={SECOND_DAY}T00:00:00"),
+    RouteCase("GET /participant/{pid}/export/{table}", f"/participant/{PID}/export/minute_level_data?from={DAY}&to={DAY}"),
+    RouteCase("GET /export/{table}", f"/export/cgm_data?pids={PID}"),
+    # Status pages
+    RouteCase("GET /jobs/status", "/jobs/status"),
+    RouteCase("GET /metrics/routes", "/metrics/routes"),
+    RouteCase("GET /partitions/status", "/partitions/status"),
+    RouteCase("GET /admission/status", "/admission/status"),
+    RouteCase("GET /studies", "/studies"),
+]
+
+# Routes without a budget, and why
+EXEMPT = {
+    "GET /participant/{pid}/glucose-stream": "Server-Sent Events stream that stays open",
+    "GET /cohort/glucose-stream": "Server-Sent Events stream that stays open",
+    "POST /cgm/readings": "committed by the ingest thread, which only runs with the app lifespan",
+    "POST /jobs/{name}/run": "runs the job on the scheduler, outside the request",
+}
+
+
+def clear_caches(api):
+    for cache in (api.precomputed, api.filtered_views, api.agp_cache):
+        cache.clear()
+
+
+def test_every_route_has_a_budget_case(api):
+    covered = {case.route for case in CASES} | set(EXEMPT)
+    routes = {
+        f"{method} {route.path}"
+        for route in api.app.routes if isinstance(route, APIRoute)
+        for method in route.methods - {"HEAD"}
+    }
+    assert not routes - covered, f"Routes without a perf case or exemption: {sorted(routes - covered)}"
+
+
+@pytest.mark.parametrize("case", CASES, ids=case_id)
+def test_route_within_budget(case, api, client, server, budgets, measurements):
+    counters, recorder = server
+    # The first run opens connections and warms the dialect; the second, with the result caches
+    # cleared again, is what a cold request costs
+    clear_caches(api)
+    measure(client, case, counters, recorder, api.database.engine)
+    clear_caches(api)
+    result = measure(client, case, counters, recorder, api.database.engine)
+    measurements[case_id(case)] = result
+
+    assert result.status < 400, f"{case_id(case)} returned {result.status}"
+    if os.environ.get("PERF_UPDATE_BUDGETS") == "1":
+        return
+    budget = budgets.get(case_id(case))
+    assert budget is not None, f"No budget for {case_id(case)} in budgets.json (run with PERF_UPDATE_BUDGETS=1)"
+
+    scans = f"; full scans: {', '.join(result.full_scans)}" if result.full_scans else ""
+    assert result.statements <= budget["statements"], (
+        f"{case_id(case)} ran {result.statements} statements, budget {budget['statements']}{scans}"
+    )
+    assert result.rows_examined <= budget["rows_examined"], (
+        f"{case_id(case)} examined {result.rows_examined} rows, budget {budget['rows_examined']}{scans}"
+    )
+    # Latency depends on the machine: reported, and enforced only when asked for
+    if result.latency_ms > budget["latency_ms"]:
+        message = f"{case_id(case)} took {result.latency_ms} ms, budget {budget['latency_ms']} ms"
+        if os.environ.get("PERF_ENFORCE_LATENCY") == "1":
+            pytest.fail(message)
+        warnings.warn(message)
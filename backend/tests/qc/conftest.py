@@ -0,0 +1,25 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+
+@pytest.fixture
+def collection():
+    """A scratch summary collection, dropped after the test."""
+    # e.g. mongodb://localhost:27017/; the test creates and drops its own collection
+    url = os.environ.get("QC_MONGO_URL")
+    if not url:
+        pytest.skip("QC_MONGO_URL is not set; the QC dashboard queries need a MongoDB server")
+    pymongo = pytest.importorskip("pymongo")
+
+    client = pymongo.MongoClient(url, serverSelectionTimeoutMS=5000)
+    collection = client["accelerometer_data_test"][f"ukb_summary_{uuid.uuid4().hex}"]
+    yield collection
+    collection.drop()
+    client.close()
@@ -0,0 +1,98 @@
+import pytest
+
+from qc_cache import SummaryCache
+from qc_data import ensure_indexes, metadata_page, participant_ids, summary_kpis, wear_nonwear_by_participant
+
+
+def summary(pid, day, wear, non_wear, calibrated):
+    return {
+        "participant_id": pid,
+        "date": f"2024-01-{day:02d}",
+        "data": {
+            "totalReads": 1000 + day,
+            "file-size": 2 * 1024 ** 2,
+            "file-deviceID": 40000,
+            "file-startTime": "2024-01-01 10:00:00.000+0000 [Europe/London]",
+            "file-endTime": "2024-01-08 10:00:00.000+0000 [Europe/London]",
+            "quality-daylightSavingsCrossover": 0,
+            "quality-goodCalibration": calibrated,
+            "wearTime-overall(days)": wear,
+            "nonWearTime-overall(days)": non_wear,
+        },
+    }
+
+
+DOCUMENTS = [
+    summary("P1", 1, 6.0, 1.0, 1),
+    summary("P1", 2, 5.0, 2.0, 0),
+    summary("P2", 1, 7.0, 0.0, 1),
+    summary("P2", 1, 4.0, 3.0, 1),  # same participant and date: only _id orders the two
+    summary("P3", 3, 3.0, 4.0, 0),
+    {"date": "2024-01-05", "data": {"file-size": 1024 ** 2, "quality-goodCalibration": 1}},  # no participant, no wear times
+]
+
+
+@pytest.fixture
+def summaries(collection):
+    collection.insert_many([dict(document) for document in DOCUMENTS])
+    ensure_indexes(collection)
+    return collection
+
+
+def test_summary_kpis(summaries):
+    kpis = summary_kpis(summaries)
+    assert kpis["total_files"] == 6
+    assert kpis["average_wear_time"] == pytest.approx(5.0)
+    assert kpis["average_non_wear_time"] == pytest.approx(2.0)
+    assert kpis["good_calibration_count"] == 4
+
+
+def test_summary_cache_matches_aggregation(summaries):
+    cache = SummaryCache(summaries, refresh_seconds=0)
+    assert cache.kpis() == pytest.approx(summary_kpis(summaries))
+
+    # Documents inserted after the high-water mark are merged into the running totals
+    summaries.insert_one(summary("P3", 4, 5.0, 0.0, 1))
+    assert cache.kpis() == pytest.approx(summary_kpis(summaries))
+    assert cache.participant_ids() == participant_ids(summaries) == ["P1", "P2", "P3"]
+
+
+def test_wear_nonwear_by_participant(summaries):
+    wear = wear_nonwear_by_participant(summaries).set_index("participant_id")
+    assert wear.loc["P1", "data_wearTime-overall(days)"] == pytest.approx(11.0)
+    assert wear.loc["P2", "data_nonWearTime-overall(days)"] == pytest.approx(3.0)
+    assert wear.loc["P3", "data_wearTime-overall(days)"] == pytest.approx(3.0)
+
+
+@pytest.mark.parametrize("page_size", [1, 2, 4, 6, 10])
+def test_metadata_pages_cover_every_document_once_in_order(summaries, page_size):
+    rows, after, pages = [], None, 0
+    while True:
+        page, after = metadata_page(summaries, after, page_size)
+        assert len(page) <= page_size
+        rows += list(zip(page["participant_id"], page["date"], page["data_totalReads"]))
+        pages += 1
+        if after is None:
+            break
+
+    assert pages == max(1, -(-len(DOCUMENTS) // page_size))
+    assert len(rows) == len(DOCUMENTS)
+    # The document without a participant sorts first, then participant and date order
+    assert [(pid if isinstance(pid, str) else None, day) for pid, day, _ in rows] == [
+        (None, "2024-01-05"),
+        ("P1", "2024-01-01"),
+        ("P1", "2024-01-02"),
+        ("P2", "2024-01-01"),
+        ("P2", "2024-01-01"),
+        ("P3", "2024-01-03"),
+    ]
+    assert sorted(reads for pid, _, reads in rows if pid == "P2") == [1001, 1001]
+
+
+def test_metadata_page_converts_file_size_and_times(summaries):
+    page, after = metadata_page(summaries, None, 10)
+    assert after is None
+    row = page[page["participant_id"] == "P3"].iloc[0]
+    assert row["data_file-size"] == pytest.approx(2.0)
+    assert row["data_file-startTime"] == "2024-01-01 10:00:00"
+    assert row["timezone"] == "Europe/London"